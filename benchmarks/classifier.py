@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+"""Benchmark classifier vocabulary options.
+
+Trains the bayes classifier on synthetic card payees, which contain store
+numbers, dates and reference ids like real bank downloads, and reports the
+vocabulary size, model file size, training and classification time and
+accuracy on held out payees for several tokenizer/pruning settings.
+
+Usage: python benchmarks/classifier.py [TRAIN] [TEST]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyledgertools.bayes import HashingTokenizer, NaiveBayes  # noqa: E402
+
+WORDS = (
+    'market grill coffee fuel pharmacy books pizza cinema hardware auto '
+    'garden bakery deli sushi taco burger pet salon fitness hotel air '
+    'parking toll grocery wine liquor cafe bistro express supply outlet'
+).split()
+
+SETTINGS = [
+    ('all tokens', {}, {}),
+    ('min_token_count=2', {}, {'min_token_count': 2}),
+    ('min_token_count=5', {}, {'min_token_count': 5}),
+    ('hash_buckets=4096', {'buckets': 4096}, {}),
+    ('hash_buckets=65536', {'buckets': 65536}, {}),
+    ('hash_buckets=65536, min_token_count=2', {'buckets': 65536},
+     {'min_token_count': 2}),
+]
+
+
+def merchants(rand, accounts=150, per_account=4):
+    """Merchant names and the account each one belongs to."""
+    result = []
+    for i in range(accounts):
+        account = 'Expenses:Category{}'.format(i)
+        for _ in range(per_account):
+            brand = ''.join(
+                rand.choice('bcdfgklmnprstvz') + rand.choice('aeiou')
+                for _ in range(3)
+            )
+            name = '{} {}'.format(brand, rand.choice(WORDS)).upper()
+            result.append((name, account))
+    return result
+
+
+def payee(rand, name):
+    """Card purchase payee with the noise typical of bank downloads."""
+    return 'POS PURCHASE {} #{:05d} {:02d}/{:02d} REF{:08d} n10'.format(
+        name, rand.randint(1, 99999), rand.randint(1, 12),
+        rand.randint(1, 28), rand.randint(0, 10 ** 8)
+    )
+
+
+def examples(rand, count, names):
+    for _ in range(count):
+        name, account = rand.choice(names)
+        yield payee(rand, name), account
+
+
+def run(label, tokenizer_options, prune_options, train, test):
+    if tokenizer_options:
+        model = NaiveBayes(HashingTokenizer(**tokenizer_options))
+    else:
+        model = NaiveBayes()
+
+    start = time.time()
+    for text, account in train:
+        model.update(text, account)
+    if prune_options:
+        model.prune(**prune_options)
+    train_time = time.time() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model')
+        model.save(path)
+        size = os.path.getsize(path)
+        model = NaiveBayes.load(path)
+
+        texts = [x for x, _ in test]
+        start = time.time()
+        for text in texts[:1000]:
+            model.classify(text)
+        single = (time.time() - start) / min(len(texts), 1000)
+
+        start = time.time()
+        results = model.classify_batch(texts, k=1)
+        batch = (time.time() - start) / len(texts)
+
+    correct = sum(
+        1 for result, (_, account) in zip(results, test)
+        if result and result[0][0] == account
+    )
+
+    print('{:<40} {:>8} {:>9} {:>8.2f} {:>9.1f} {:>9.1f} {:>8.1%}'.format(
+        label, len(model.token_counts), size // 1024, train_time,
+        single * 1e6, batch * 1e6, correct / len(test)
+    ))
+
+
+def main():
+    train_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    test_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    rand = random.Random(0)
+    names = merchants(rand)
+    train = list(examples(rand, train_count, names))
+    test = list(examples(rand, test_count, names))
+
+    print('{} training and {} test payees'.format(train_count, test_count))
+    print('{:<40} {:>8} {:>9} {:>8} {:>9} {:>9} {:>8}'.format(
+        'setting', 'tokens', 'size kB', 'train s', 'single us',
+        'batch us', 'accuracy'
+    ))
+    for label, tokenizer_options, prune_options in SETTINGS:
+        run(label, tokenizer_options, prune_options, train, test)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+"""Benchmark journal rendering.
+
+Compares writing ``to_string() + '\\n\\n'`` for every transaction with
+:func:`pyledgertools.journal.render_journal` on a synthetic journal, or on
+the transactions of a journal file given on the command line.
+
+Usage: python benchmarks/render.py [COUNT | JOURNAL]
+"""
+
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyledgertools.journal import (  # noqa: E402
+    Posting, Transaction, render_journal
+)
+from pyledgertools.reader import read_journal  # noqa: E402
+
+
+def synthetic(count):
+    rand = random.Random(0)
+    transactions = []
+    for i in range(count):
+        amount = rand.randint(1, 10 ** 6) / 100.0
+        transactions.append(Transaction(
+            date='2017-{:02}-{:02}'.format(i % 12 + 1, i % 28 + 1),
+            flag=' * ',
+            payee='Payee {}'.format(rand.randint(0, 5000)),
+            metadata=[['UUID', '{:032x}'.format(rand.getrandbits(128))]],
+            postings=[
+                Posting(account='Assets:Checking', amount=-amount),
+                Posting(account='Expenses:Category{}'.format(i % 150),
+                        amount=amount),
+            ],
+        ))
+    return transactions
+
+
+def to_string(transactions, stream):
+    for transaction in transactions:
+        stream.write(transaction.to_string() + '\n\n')
+
+
+def best_of(func, transactions, repeat=3):
+    best = None
+    for _ in range(repeat):
+        stream = io.StringIO()
+        start = time.time()
+        func(transactions, stream)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, stream.getvalue()
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else '100000'
+    if os.path.isfile(arg):
+        transactions = [
+            x for x in read_journal(arg)
+            if all(p.amount is not None for p in x.postings)
+        ]
+    else:
+        transactions = synthetic(int(arg))
+
+    old, expected = best_of(to_string, transactions)
+    new, output = best_of(render_journal, transactions)
+    assert output == expected, 'render_journal output differs'
+
+    size = len(output.encode('utf-8')) / 1e6
+    print('{} transactions, {:.1f} MB'.format(len(transactions), size))
+    for label, elapsed in (('to_string', old), ('render_journal', new)):
+        print('{:<16} {:6.2f}s {:9.0f} transactions/s {:6.1f} MB/s'.format(
+            label, elapsed, len(transactions) / elapsed, size / elapsed
+        ))
+    print('speedup {:.2f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
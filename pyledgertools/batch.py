@@ -0,0 +1,246 @@
+"""Columnar storage for imported transactions.
+
+Statement files hold thousands of rows that each become a single posting
+:obj:`Transaction`, most of which are then dropped again as already
+imported. :obj:`TransactionBatch` keeps the rows as columns instead and
+only builds :obj:`Transaction` objects for the rows that are used.
+"""
+
+from array import array
+from decimal import Decimal
+import re
+from sys import intern
+
+from pyledgertools.functions import to_decimal
+from pyledgertools.journal import Posting, Transaction
+
+DATE_REGEX = re.compile(r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$')
+
+
+def _date_number(date):
+    """Convert a ``YYYY-MM-DD`` date to the integer ``YYYYMMDD``."""
+    match = DATE_REGEX.match(date)
+    if not match:
+        raise ValueError('Invalid transaction date: {!r}'.format(date))
+    y, m, d = match.groups()
+    return int(y) * 10000 + int(m) * 100 + int(d)
+
+
+class TransactionBatch(object):
+    """Single posting transactions stored by column.
+
+    Dates are kept as ``YYYYMMDD`` integers and amounts as integer cents in
+    arrays. Amounts that are not whole cents are kept exactly on the side.
+    Metadata of all rows is stored in flat key and value lists, the
+    metadata of row ``i`` is at ``meta_offsets[i]:meta_offsets[i + 1]``.
+
+    Indexing or iterating a batch builds :obj:`Transaction` objects, the
+    same ones a parser would have built directly.
+
+    Attributes:
+        dates (array): Transaction dates as ``YYYYMMDD`` integers.
+        cents (array): Amounts of the posting in cents.
+        payees (list): Transaction payees.
+        uuids (list): Transaction UUIDs.
+        accounts (list): Statement account of each transaction.
+        posting_accounts (list): Ledger account of the posting.
+        currencies (list): Currency of the posting.
+        meta_offsets (array): Start of the metadata of each row.
+        meta_keys (list): Metadata keys.
+        meta_values (list): Metadata values.
+    """
+
+    def __init__(self):
+        self.dates = array('l')
+        self.cents = array('q')
+        self.payees = []
+        self.uuids = []
+        self.accounts = []
+        self.posting_accounts = []
+        self.currencies = []
+        self.meta_offsets = array('l', [0])
+        self.meta_keys = []
+        self.meta_values = []
+        # Row to Decimal amount for amounts that are not whole cents.
+        self._exact = {}
+
+    def __len__(self):
+        return len(self.payees)
+
+    def append(self, date, payee, posting_account, amount, currency='$',
+               metadata=(), uuid='', account=''):
+        """Add a transaction.
+
+        Parameters:
+            date (str): Transaction date, ``YYYY-MM-DD``.
+            payee (str): Transaction payee.
+            posting_account (str): Ledger account of the posting.
+            amount (Decimal, float or str): Amount of the posting.
+            currency (str): Currency of the posting.
+            metadata (list): Key/value pairs of the transaction.
+            uuid (str): Transaction UUID.
+            account (str): Statement account.
+        """
+        row = len(self.payees)
+        amount = to_decimal(amount)
+        cents = amount * 100
+        self.cents.append(int(cents))
+        if cents != cents.to_integral_value():
+            self._exact[row] = amount
+
+        self.dates.append(_date_number(date))
+        self.payees.append(payee)
+        self.uuids.append(uuid)
+        self.accounts.append(intern(account))
+        self.posting_accounts.append(intern(posting_account))
+        self.currencies.append(intern(currency))
+        for key, value in metadata:
+            self.meta_keys.append(key)
+            self.meta_values.append(value)
+        self.meta_offsets.append(len(self.meta_keys))
+
+    def date(self, row):
+        """Date of a row as ``YYYY-MM-DD``."""
+        number = self.dates[row]
+        return '{:04d}-{:02d}-{:02d}'.format(
+            number // 10000, number // 100 % 100, number % 100
+        )
+
+    def amount(self, row):
+        """Amount of a row as :obj:`Decimal`."""
+        exact = self._exact.get(row)
+        if exact is not None:
+            return exact
+        return Decimal(self.cents[row]).scaleb(-2)
+
+    def metadata(self, row):
+        """Metadata of a row as a list of ``(key, value)`` tuples."""
+        start, end = self.meta_offsets[row], self.meta_offsets[row + 1]
+        return list(
+            zip(self.meta_keys[start:end], self.meta_values[start:end])
+        )
+
+    def column(self, field):
+        """Values of a transaction field for every row.
+
+        Parameters:
+            field (str): Transaction attribute name or ``amount`` for the
+                posting amount.
+
+        Returns:
+            list: One value per row.
+        """
+        if field == 'amount':
+            return [self.amount(x) for x in range(len(self))]
+        if field == 'date':
+            return [self.date(x) for x in range(len(self))]
+        if field == 'payee':
+            return list(self.payees)
+        if field == 'uuid':
+            return list(self.uuids)
+        if field == 'account':
+            return list(self.accounts)
+        return [getattr(self[x], field) for x in range(len(self))]
+
+    def __getitem__(self, row):
+        """Build the :obj:`Transaction` of a row."""
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('batch index out of range')
+
+        posting = Posting(
+            account=self.posting_accounts[row],
+            amount=self.amount(row),
+            currency=self.currencies[row],
+        )
+
+        return Transaction(
+            date=self.date(row),
+            payee=self.payees[row],
+            postings=[posting],
+            metadata=self.metadata(row),
+            account=self.accounts[row],
+            uuid=self.uuids[row],
+        )
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def take(self, rows):
+        """New batch holding the given rows in the given order.
+
+        Parameters:
+            rows (iterable): Row numbers.
+
+        Returns:
+            TransactionBatch: The selected rows.
+        """
+        rows = list(rows)
+        batch = TransactionBatch()
+        batch.dates = array('l', map(self.dates.__getitem__, rows))
+        batch.cents = array('q', map(self.cents.__getitem__, rows))
+        for name in ('payees', 'uuids', 'accounts', 'posting_accounts',
+                     'currencies'):
+            setattr(batch, name, list(map(getattr(self, name).__getitem__,
+                                          rows)))
+        if self._exact:
+            exact = self._exact
+            batch._exact = dict(
+                (new, exact[row]) for new, row in enumerate(rows)
+                if row in exact
+            )
+
+        offsets = self.meta_offsets
+        keys = batch.meta_keys
+        values = batch.meta_values
+        new_offsets = batch.meta_offsets
+        for row in rows:
+            start, end = offsets[row], offsets[row + 1]
+            if start != end:
+                keys.extend(self.meta_keys[start:end])
+                values.extend(self.meta_values[start:end])
+            new_offsets.append(len(keys))
+
+        return batch
+
+    def filter(self, mask):
+        """New batch with the rows where `mask` is true.
+
+        Parameters:
+            mask (iterable): One boolean per row.
+
+        Returns:
+            TransactionBatch: The selected rows.
+        """
+        return self.take(row for row, keep in enumerate(mask) if keep)
+
+    def sort_by_date(self):
+        """New batch with the rows sorted by date.
+
+        The sort is stable so rows with the same date keep their order.
+
+        Returns:
+            TransactionBatch: The sorted rows.
+        """
+        dates = self.dates
+        return self.take(sorted(range(len(self)), key=dates.__getitem__))
+
+
+def column(transactions, field):
+    """Values of a transaction field for a batch or list of transactions.
+
+    Parameters:
+        transactions (TransactionBatch or list): Transactions.
+        field (str): Transaction attribute name or ``amount`` for the amount
+            of the first posting.
+
+    Returns:
+        list: One value per transaction.
+    """
+    if isinstance(transactions, TransactionBatch):
+        return transactions.column(field)
+    if field == 'amount':
+        return [x.postings[0].amount for x in transactions]
+    return [getattr(x, field) for x in transactions]
@@ -0,0 +1,649 @@
+"""Multinomial naive bayes text classification.
+
+Token and category counts are kept directly so training examples can be
+added and removed one at a time without rebuilding anything. Scores are
+computed in log space.
+
+Trained models are saved in a compact binary format: a sorted token
+vocabulary and the token counts as flat integer arrays. Loading maps the
+file read-only so a saved model can classify right away without
+rebuilding the count dictionaries. They are only built when the loaded
+model is trained further.
+"""
+
+from array import array
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+import json
+from math import exp, log
+import mmap
+import os
+import struct
+import sys
+from zlib import crc32
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+MODEL_MAGIC = b'PLTBAYES'
+MODEL_VERSION = 1
+
+# Magic, version and header length.
+_PREFIX = struct.Struct('<8sII')
+# Array type codes of the token offsets/indptr and count sections. Category
+# indices use the smallest of `_INDEX_TYPES` that fits.
+_OFFSET_TYPE = 'Q'
+_INDEX_TYPES = ('B', 'H', 'I')
+_COUNT_TYPE = 'I'
+
+
+class Tokenizer(object):
+    """Split text into lower case tokens.
+
+    Attributes:
+        signs_to_remove (str): Characters removed from every token.
+    """
+
+    def __init__(self, signs_to_remove='?!%.\''):
+        self.signs_to_remove = signs_to_remove
+        self._table = str.maketrans('', '', signs_to_remove)
+
+    def tokenize(self, text):
+        """Return the list of tokens in `text`.
+
+        >>> Tokenizer().tokenize('Joe\\'s Pizza p10')
+        ['joes', 'pizza', 'p10']
+        """
+        return text.lower().translate(self._table).split(' ')
+
+
+class HashingTokenizer(Tokenizer):
+    """Tokenizer that maps tokens to a fixed number of hash buckets.
+
+    Keeps the vocabulary of a model bounded no matter how many distinct
+    store numbers, reference ids and dates show up in payees, at the cost of
+    unrelated tokens occasionally sharing a bucket.
+
+    Attributes:
+        buckets (int): Number of distinct tokens produced.
+    """
+
+    def __init__(self, buckets=1 << 18, signs_to_remove='?!%.\''):
+        super(HashingTokenizer, self).__init__(signs_to_remove)
+        self.buckets = buckets
+
+    def tokenize(self, text):
+        """Return the bucket of every token in `text` as a hex string.
+
+        CRC32 is used rather than :func:`hash` so buckets are the same in
+        every process.
+        """
+        buckets = self.buckets
+        return [
+            '{:x}'.format(crc32(x.encode('utf-8')) % buckets)
+            for x in super(HashingTokenizer, self).tokenize(text)
+        ]
+
+
+class NaiveBayes(object):
+    """Naive bayes classifier over token counts.
+
+    For each category the number of training documents is kept and for each
+    token the number of times it was seen in each category. The score of a
+    category for a text is the prior of the category multiplied by the
+    probability of each known token of the text in that category. Tokens
+    never seen in training are ignored, tokens seen only in other categories
+    get probability `default_prob`.
+
+    Attributes:
+        tokenizer (Tokenizer): Tokenizer used for training and
+            classification.
+        default_prob (float): Probability of a known token in a category it
+            was never seen in.
+    """
+
+    def __init__(self, tokenizer=None, default_prob=1e-9):
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer()
+        self.default_prob = default_prob
+
+        # Category name -> number of documents.
+        self.doc_counts = {}
+        # Token -> {category name: count}
+        self.token_counts = {}
+
+        self._matrix = None
+
+    def __getstate__(self):
+        # The score matrix is rebuilt on demand, do not pickle it.
+        state = self.__dict__.copy()
+        state['_matrix'] = None
+        state['token_counts'] = dict(self.token_counts.items())
+        return state
+
+    @property
+    def categories(self):
+        """List of known categories."""
+        return list(self.doc_counts)
+
+    def __len__(self):
+        """Number of training documents."""
+        return sum(self.doc_counts.values())
+
+    def update(self, text, category):
+        """Add a training example.
+
+        Parameters:
+            text (str): Example text.
+            category (str): Category of `text`.
+        """
+        self._thaw()
+        self.doc_counts[category] = self.doc_counts.get(category, 0) + 1
+
+        token_counts = self.token_counts
+        for token in self.tokenizer.tokenize(text):
+            counts = token_counts.get(token)
+            if counts is None:
+                counts = token_counts[token] = {}
+            counts[category] = counts.get(category, 0) + 1
+
+    def forget(self, text, category):
+        """Remove a training example previously added with :meth:`update`.
+
+        Parameters:
+            text (str): Example text.
+            category (str): Category of `text`.
+
+        Raises:
+            KeyError: If the example was not trained.
+        """
+        tokens = self.tokenizer.tokenize(text)
+        if self.doc_counts.get(category, 0) < 1:
+            raise KeyError(category)
+        for token in tokens:
+            if self.token_counts.get(token, {}).get(category, 0) < 1:
+                raise KeyError(token)
+
+        self._thaw()
+        self.doc_counts[category] -= 1
+        if self.doc_counts[category] == 0:
+            del self.doc_counts[category]
+
+        for token in tokens:
+            counts = self.token_counts[token]
+            counts[category] -= 1
+            if counts[category] == 0:
+                del counts[category]
+                if not counts:
+                    del self.token_counts[token]
+
+    def merge(self, other):
+        """Add the counts of another model to this one.
+
+        The result is the same, including the order categories and tokens
+        are kept in, as training this model on the examples of `other` after
+        its own.
+
+        Parameters:
+            other (NaiveBayes): Model to add.
+        """
+        self._thaw()
+
+        doc_counts = self.doc_counts
+        for category, count in other.doc_counts.items():
+            doc_counts[category] = doc_counts.get(category, 0) + count
+
+        token_counts = self.token_counts
+        for token, counts in other.token_counts.items():
+            current = token_counts.get(token)
+            if current is None:
+                token_counts[token] = dict(counts)
+                continue
+            for category, count in counts.items():
+                current[category] = current.get(category, 0) + count
+
+    def prune(self, min_token_count=1, min_category_count=1):
+        """Drop rare tokens and categories.
+
+        Parameters:
+            min_token_count (int): Tokens seen fewer times than this, over all
+                categories, are removed.
+            min_category_count (int): Categories with fewer training documents
+                than this are removed along with their token counts.
+        """
+        self._thaw()
+
+        doc_counts = self.doc_counts
+        dropped = set(
+            x for x, y in doc_counts.items() if y < min_category_count
+        )
+        for category in dropped:
+            del doc_counts[category]
+
+        token_counts = self.token_counts
+        for token in list(token_counts):
+            counts = token_counts[token]
+            for category in dropped.intersection(counts):
+                del counts[category]
+            if not counts or sum(counts.values()) < min_token_count:
+                del token_counts[token]
+
+    def log_scores(self, text):
+        """Log of the score of every category for a text.
+
+        Parameters:
+            text (str): Text to score.
+
+        Returns:
+            dict: Category name to log score. Empty when none of the tokens
+            in `text` are known.
+        """
+        token_counts = self.token_counts
+        known = [
+            token_counts[x] for x in set(self.tokenizer.tokenize(text))
+            if x in token_counts
+        ]
+        if not known:
+            return {}
+
+        doc_counts = self.doc_counts
+        log_default = log(self.default_prob)
+        log_total = log(sum(doc_counts.values()))
+
+        # Start every category as if no token was seen in it, then replace
+        # the default probability for the tokens that were.
+        base = len(known) * log_default - log_total
+        scores = {}
+        for category, count in doc_counts.items():
+            scores[category] = base + log(count)
+
+        for counts in known:
+            for category, count in counts.items():
+                scores[category] += (
+                    log(count / doc_counts[category]) - log_default
+                )
+
+        return scores
+
+    def classify(self, text):
+        """Score every category for a text.
+
+        Parameters:
+            text (str): Text to classify.
+
+        Returns:
+            list: ``(category, score)`` tuples sorted from best to worst. All
+            scores are 0 if none of the tokens in `text` are known.
+        """
+        scores = self.log_scores(text)
+        if not scores:
+            result = [(x, 0.0) for x in self.doc_counts]
+        else:
+            result = [(x, exp(y)) for x, y in scores.items()]
+
+        result.sort(key=lambda x: x[1], reverse=True)
+        return result
+
+    def classify_batch(self, texts, k=None):
+        """Classify many texts at once.
+
+        With NumPy available the scores of all texts are computed together
+        from a sparse token by category matrix of log probabilities.
+
+        Parameters:
+            texts (list): Texts to classify.
+            k (int): Number of best categories to return per text, all
+                categories when `None`.
+
+        Returns:
+            list: For every text a list of ``(category, score)`` tuples as
+            returned by :meth:`classify`.
+        """
+        if np is None or not self.doc_counts:
+            return [self.classify(x)[:k] for x in texts]
+
+        matrix = self._score_matrix()
+        categories = matrix['categories']
+        vocab = matrix['vocab']
+        indptr = matrix['indptr']
+        n_cats = len(categories)
+
+        # Known token ids of every text, flattened, and the text they belong
+        # to.
+        token_ids = []
+        token_rows = []
+        known = np.zeros(len(texts))
+        tokenize = self.tokenizer.tokenize
+        for row, text in enumerate(texts):
+            ids = set(vocab[x] for x in tokenize(text) if x in vocab)
+            token_ids.extend(ids)
+            token_rows.extend([row] * len(ids))
+            known[row] = len(ids)
+
+        token_ids = np.array(token_ids, dtype=np.intp)
+        token_rows = np.array(token_rows, dtype=np.intp)
+
+        # Expand each token to its range of non zero matrix entries.
+        starts = indptr[token_ids]
+        lengths = indptr[token_ids + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        entries = (
+            np.arange(lengths.sum()) - np.repeat(offsets, lengths) +
+            np.repeat(starts, lengths)
+        )
+        rows = np.repeat(token_rows, lengths)
+
+        scores = np.bincount(
+            rows * n_cats + matrix['indices'][entries],
+            weights=matrix['data'][entries],
+            minlength=len(texts) * n_cats
+        ).reshape(len(texts), n_cats)
+        scores += matrix['prior'][np.newaxis, :]
+        scores += (known * log(self.default_prob))[:, np.newaxis]
+
+        probs = np.exp(scores)
+        probs[known == 0] = 0.0
+
+        if k == 1:
+            order = np.argmax(probs, axis=1)[:, np.newaxis]
+        else:
+            order = np.argsort(-probs, axis=1, kind='stable')[:, :k]
+
+        return [
+            [(categories[x], float(probs[row, x])) for x in order[row]]
+            for row in range(len(texts))
+        ]
+
+    def _score_matrix(self):
+        """Build (or reuse) the sparse log probability matrix.
+
+        Row ``i`` holds, for every category token ``i`` was seen in, the log
+        probability of the token minus the log of `default_prob`. Stored in
+        compressed sparse row form.
+        """
+        if self._matrix is not None:
+            return self._matrix
+
+        if isinstance(self.token_counts, CountTable):
+            self._matrix = self.token_counts.score_matrix(
+                self.doc_counts, self.default_prob
+            )
+            return self._matrix
+
+        categories = list(self.doc_counts)
+        cat_ids = dict((x, i) for i, x in enumerate(categories))
+        doc_counts = self.doc_counts
+        log_default = log(self.default_prob)
+
+        vocab = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for token, counts in self.token_counts.items():
+            vocab[token] = len(vocab)
+            for category, count in counts.items():
+                indices.append(cat_ids[category])
+                data.append(log(count / doc_counts[category]) - log_default)
+            indptr.append(len(indices))
+
+        total = log(sum(doc_counts.values()))
+        self._matrix = {
+            'categories': categories,
+            'vocab': vocab,
+            'indptr': np.array(indptr, dtype=np.intp),
+            'indices': np.array(indices, dtype=np.intp),
+            'data': np.array(data, dtype=float),
+            'prior': np.array([log(doc_counts[x]) - total for x in categories]),
+        }
+
+        return self._matrix
+
+    def _thaw(self):
+        """Prepare for changes to the counts.
+
+        Drops the cached score matrix and replaces a memory mapped count
+        table with plain dictionaries.
+        """
+        self._matrix = None
+        if not isinstance(self.token_counts, dict):
+            self.token_counts = dict(self.token_counts.items())
+
+    def save(self, path):
+        """Write the model in the compact binary format.
+
+        The file is replaced atomically so a model that is currently loaded
+        from `path` stays valid.
+
+        Parameters:
+            path (str): File to write.
+        """
+        categories = list(self.doc_counts)
+        cat_ids = dict((x, i) for i, x in enumerate(categories))
+        index_type = [
+            x for x in _INDEX_TYPES
+            if len(categories) <= 1 << (8 * array(x).itemsize)
+        ][0]
+
+        token_offsets = array(_OFFSET_TYPE, [0])
+        tokens = bytearray()
+        indptr = array(_OFFSET_TYPE, [0])
+        indices = array(index_type)
+        counts = array(_COUNT_TYPE)
+
+        token_counts = self.token_counts
+        for token in sorted(token_counts):
+            tokens += token.encode('utf-8')
+            token_offsets.append(len(tokens))
+            for category, count in token_counts[token].items():
+                indices.append(cat_ids[category])
+                counts.append(count)
+            indptr.append(len(indices))
+
+        sections = [
+            ('token_offsets', token_offsets.tobytes()),
+            ('tokens', bytes(tokens)),
+            ('indptr', indptr.tobytes()),
+            ('indices', indices.tobytes()),
+            ('counts', counts.tobytes()),
+        ]
+
+        header = {
+            'byteorder': sys.byteorder,
+            'default_prob': self.default_prob,
+            'signs_to_remove': getattr(
+                self.tokenizer, 'signs_to_remove', None
+            ),
+            'buckets': getattr(self.tokenizer, 'buckets', None),
+            'categories': categories,
+            'doc_counts': [self.doc_counts[x] for x in categories],
+            'index_type': index_type,
+            'sections': {},
+        }
+
+        # Sections start after the header, aligned to 8 bytes so they can be
+        # used as arrays straight from the memory map.
+        offset = 0
+        for name, data in sections:
+            header['sections'][name] = [offset, len(data)]
+            offset += len(data) + (-len(data) % 8)
+
+        header = json.dumps(header).encode('utf-8')
+        header += b' ' * (-(len(header) + _PREFIX.size) % 8)
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_PREFIX.pack(MODEL_MAGIC, MODEL_VERSION, len(header)))
+            f.write(header)
+            for name, data in sections:
+                f.write(data)
+                f.write(b'\0' * (-len(data) % 8))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model written by :meth:`save`.
+
+        The token counts are used straight from a read-only memory map of
+        the file.
+
+        Parameters:
+            path (str): Model file.
+
+        Returns:
+            NaiveBayes: The model or `None` if the file does not exist or is
+            not a compatible model file.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+
+        try:
+            magic, version, size = _PREFIX.unpack_from(data)
+            if magic != MODEL_MAGIC or version != MODEL_VERSION:
+                return None
+            start = _PREFIX.size + size
+            header = json.loads(data[_PREFIX.size:start].decode('utf-8'))
+        except (struct.error, ValueError):
+            return None
+
+        if (header['byteorder'] != sys.byteorder or
+                header['index_type'] not in _INDEX_TYPES):
+            return None
+
+        view = memoryview(data)
+        sections = {}
+        for name, (offset, length) in header['sections'].items():
+            offset += start
+            if offset + length > len(data):
+                return None
+            sections[name] = view[offset:offset + length]
+
+        tokenizer = None
+        if header.get('buckets') is not None:
+            tokenizer = HashingTokenizer(
+                header['buckets'], header['signs_to_remove']
+            )
+        elif header['signs_to_remove'] is not None:
+            tokenizer = Tokenizer(header['signs_to_remove'])
+
+        model = cls(tokenizer, header['default_prob'])
+        model.doc_counts = dict(zip(header['categories'], header['doc_counts']))
+        model.token_counts = CountTable(
+            header['categories'],
+            sections['tokens'],
+            sections['token_offsets'].cast(_OFFSET_TYPE),
+            sections['indptr'].cast(_OFFSET_TYPE),
+            sections['indices'].cast(header['index_type']),
+            sections['counts'].cast(_COUNT_TYPE),
+        )
+
+        return model
+
+
+class CountTable(Mapping):
+    """Read-only token counts backed by flat arrays.
+
+    Behaves like the ``token -> {category: count}`` dictionary of
+    :obj:`NaiveBayes`. Token ``i`` of the sorted vocabulary has the
+    categories ``indices[indptr[i]:indptr[i + 1]]`` with the matching
+    ``counts``.
+
+    Attributes:
+        categories (list): Category names in index order.
+    """
+
+    def __init__(self, categories, tokens, token_offsets, indptr, indices,
+                 counts):
+        self.categories = categories
+        self._tokens = tokens
+        self._token_offsets = token_offsets
+        self._indptr = indptr
+        self._indices = indices
+        self._counts = counts
+        self._ids = None
+
+    def _token(self, i):
+        offsets = self._token_offsets
+        return bytes(self._tokens[offsets[i]:offsets[i + 1]])
+
+    def _vocab(self):
+        """Token to index dictionary, built on first use."""
+        if self._ids is None:
+            self._ids = dict(
+                (self._token(i).decode('utf-8'), i) for i in range(len(self))
+            )
+        return self._ids
+
+    def _find(self, token):
+        """Index of a token or -1, by binary search of the sorted vocabulary.
+
+        Avoids building the vocabulary dictionary when only a few tokens are
+        looked up.
+        """
+        if self._ids is not None:
+            return self._ids.get(token, -1)
+
+        key = token.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._token(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self) and self._token(lo) == key:
+            return lo
+        return -1
+
+    def __getitem__(self, token):
+        i = self._find(token)
+        if i < 0:
+            raise KeyError(token)
+
+        categories = self.categories
+        start, end = self._indptr[i], self._indptr[i + 1]
+        return dict(
+            (categories[x], y) for x, y in
+            zip(self._indices[start:end], self._counts[start:end])
+        )
+
+    def __contains__(self, token):
+        return self._find(token) >= 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._token(i).decode('utf-8')
+
+    def __len__(self):
+        return len(self._token_offsets) - 1
+
+    def score_matrix(self, doc_counts, default_prob):
+        """Sparse log probability matrix as built by
+        :meth:`NaiveBayes._score_matrix`, computed from the arrays directly.
+        """
+        categories = self.categories
+        indptr = np.asarray(self._indptr).astype(np.intp)
+        indices = np.asarray(self._indices).astype(np.intp)
+        counts = np.asarray(self._counts)
+        docs = np.array([doc_counts[x] for x in categories], dtype=float)
+        total = log(docs.sum())
+
+        return {
+            'categories': categories,
+            'vocab': self._vocab(),
+            'indptr': indptr,
+            'indices': indices,
+            'data': np.log(counts / docs[indices]) - log(default_prob),
+            'prior': np.log(docs) - total,
+        }
@@ -2,23 +2,31 @@
 """Command line interface for ledgertools package."""
 
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 import os
 from os.path import expanduser
-import re
 import sys
 import tempfile
+import threading
 from subprocess import Popen, PIPE, call
-from yapsy.PluginManager import PluginManager
 import yaml
 import logging
 import logging.config
 
+from pyledgertools.batch import TransactionBatch, column
 from pyledgertools.strings import UI, Info, Prompts
 from pyledgertools.functions import amount_group
+from pyledgertools.reader import (
+    JournalChanged, journal_key, parse_entries, read_new_entries
+)
+from pyledgertools.registry import PluginRegistry
+from pyledgertools.uuid_index import UUIDIndex
+from pyledgertools.writer import JournalWriter
 
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
 HOME = expanduser("~")
+CACHE_DIR = os.path.join(HOME, '.cache', 'ledgertools')
 
 HTML_TEMPLATE = """
 <html>
@@ -87,48 +95,87 @@ def get_args():
         default='20170320',
         help='Date to start pulling transactions from.'
     )
+    parser.add_argument(
+        '--reindex',
+        dest='reindex',
+        action='store_true',
+        help='Rebuild the UUID index from the full ledger journal.'
+    )
+    parser.add_argument(
+        '--retrain',
+        dest='retrain',
+        action='store_true',
+        help='Retrain the classifier instead of updating the saved model.'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=1,
+        help='Number of accounts to download and parse concurrently.'
+    )
+    parser.add_argument(
+        '--train-jobs',
+        dest='train_jobs',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of processes used to train the classifier.'
+    )
     args = parser.parse_args()
 
     return dict((k, v) for k, v in vars(args).items() if v)
 
 
 def get_plugin(manager, name):
-    """Find a plugin by name."""
-    for plugin in manager.getAllPlugins():
-        if plugin.name == name:
-            return plugin.plugin_object
-
-    return None
-
-
-def read_ledger(journal=None):
-    """Read a ledger journal and return fuuidsormatted transactions."""
-
-    # Ignore opening balances and limit transactions to the
-    # past 12 months.
-    options = [
-        '--limit', 'payee!~/Opening Balance/',
-        '-p', 'from 12 months ago',
-        '--raw'
-    ]
-
-    if journal is None:
-        cmd = ['ledger', 'print'] + options
+    """Find a plugin by name.
+
+    Parameters:
+        manager (PluginRegistry): Registry to load the plugin from.
+        name (str): Plugin name.
+    """
+    return manager.get(name)
+
+
+def load_uuid_index(path, journal=None, rebuild=False):
+    """Open the UUID index and bring it up to date with the journal.
+
+    Only the entries appended to the journal since the last call are read,
+    see :func:`pyledgertools.reader.read_new_entries`. The index is
+    reseeded from the whole journal when it is empty, was seeded from a
+    different journal or the journal was changed other than by appending
+    to it.
+
+    Parameters:
+        path (str): Location of the index database.
+        journal (str): Journal file to seed from, defaults to the ledger
+            default journal.
+        rebuild (bool): Discard the index contents and reseed from the
+            journal.
+    """
+    index = UUIDIndex(path)
+    journals = journal_key(journal)
+
+    marks = index.marks
+    if rebuild or marks is None or index.journals != journals:
+        marks = None
     else:
-        cmd = ['ledger', '-f', journal, 'print'] + options
-
-    process = Popen(cmd, stdout=PIPE)
-    journal, err = process.communicate()
-
-    return journal
-
+        try:
+            index.update(
+                x.uuid for x in parse_entries(read_new_entries(journal, marks))
+            )
+        except JournalChanged:
+            marks = None
 
-def list_uuids(journal):
-    """Pull list of UUID's from ledger journal."""
+    if marks is None:
+        marks = {}
+        index.clear()
+        index.update(
+            x.uuid for x in parse_entries(read_new_entries(journal, marks))
+        )
+        index.journals = journals
+    index.marks = marks
 
-    # Make list of existing UUID's
-    regex = 'UUID:\s+([a-z0-9]+)'
-    return re.findall(regex, str(journal))
+    return index
 
 
 def vim_input(text='', offset=None):
@@ -155,6 +202,82 @@ def vim_input(text='', offset=None):
                 return line.strip().decode('utf-8')
 
 
+def account_config(config, account, cli_options):
+    """Build the configuration for a single account.
+
+    Global options are overridden by the parent section, then the account
+    section and finally the command line options.
+    """
+    account_sections = config.get('accounts', None)
+
+    conf = account_sections.get(account, None)
+    parent_conf = account_sections.get(conf.get('parent', 'NaN'), {})
+
+    base_conf = dict(config.get('global', {}))
+    base_conf.update(parent_conf)
+    base_conf.update(conf)
+    base_conf.update(cli_options)
+
+    return base_conf
+
+
+def fetch_account(manager, conf, locks):
+    """Download and parse the transactions for an account.
+
+    Runs in a worker thread. Plugins are not assumed to be thread safe unless
+    they set a ``thread_safe`` attribute, calls into other plugins are
+    serialized with the lock in `locks` for that plugin.
+
+    Parameters:
+        manager (PluginRegistry): Plugin registry.
+        conf (dict): Account configuration.
+        locks (dict): Plugin name to :obj:`threading.Lock` mapping.
+
+    Returns:
+        TransactionBatch: Transactions sorted by date, `None` if the download
+        failed. Parsers returning a plain list get a sorted list back.
+    """
+    logger = logging.getLogger(__name__)
+
+    # Get downloader and parser plugins fromthe config.
+    getter = get_plugin(manager, conf['downloader'])
+    parser = get_plugin(manager, conf['parser'])
+
+    file_path = conf.get('input_file', None)
+    try:
+        if not file_path:
+            with _plugin_lock(getter, locks[conf['downloader']]):
+                file_path = getter.download(conf)
+    except:
+        logger.error('Error processing the account.')
+        return None
+
+    with _plugin_lock(parser, locks[conf['parser']]):
+        balances, transactions = parser.build_journal(file_path, conf)
+
+    if isinstance(transactions, TransactionBatch):
+        transactions = transactions.sort_by_date()
+    else:
+        transactions.sort(key=lambda x: x.date)
+
+    return transactions
+
+
+class _NoLock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+def _plugin_lock(plugin, lock):
+    """Return `lock` unless the plugin declares itself thread safe."""
+    if getattr(plugin, 'thread_safe', False):
+        return _NoLock()
+    return lock
+
+
 def automatic():
     """Run the command line interface without user input."""
 
@@ -165,15 +288,6 @@ def automatic():
 
     other_plugins = os.path.join(HOME, '.config', 'ledgertools', 'plugins')
 
-    # Load Plugins
-    manager = PluginManager()
-    manager.setPluginPlaces([os.path.join(DIR_PATH, 'plugins'), other_plugins])
-    manager.collectPlugins()
-
-    # Load classification plugins
-    rule = get_plugin(manager, 'Rule Based Classifier')
-    bayes = get_plugin(manager, 'Naive Bayes Classifier')
-
     # Load command line options.
     cli_options = get_args()
 
@@ -193,76 +307,121 @@ def automatic():
 
     accounts = cli_options['account'].split(',')
 
-    learning_file = read_ledger()
+    journal = cli_options.get('journal_file', None)
+    cache_dir = global_conf.get('cache_dir', CACHE_DIR)
 
-    uuids = list_uuids(learning_file)
-
-    for account in accounts:
-        logger.info('Processing ' + account)
-
-        base_conf = global_conf
-        account_config = config.get('accounts', None)
+    # Find plugins, they are imported when first used.
+    manager = PluginRegistry(
+        [os.path.join(DIR_PATH, 'plugins'), other_plugins],
+        manifest=os.path.join(cache_dir, 'plugins.json')
+    )
+    manager.collect()
 
-        conf = account_config.get(account, None)
-        parent_conf = account_config.get(conf.get('parent', 'NaN'), {})
+    # Load classification plugins
+    rule = get_plugin(manager, 'Rule Based Classifier')
+    bayes = get_plugin(manager, 'Naive Bayes Classifier')
 
-        base_conf.update(parent_conf)
-        base_conf.update(conf)
-        base_conf.update(cli_options)
-        conf = base_conf
+    # Ignore opening balances and by default limit training to the past 12
+    # months. Only what was added to the journal since the last run is read.
+    training = {
+        'window': global_conf.get('training_window', 12),
+        'exclude_payee': 'Opening Balance',
+    }
+    for key in ('hash_buckets', 'min_token_count', 'min_category_count'):
+        if key in global_conf:
+            training[key] = global_conf[key]
+    interactive_classifier = bayes.train_window(
+        os.path.join(cache_dir, 'bayes'), journal,
+        jobs=cli_options.get('train_jobs', 1),
+        rebuild=cli_options.get('retrain', False), **training
+    )
 
-        # Get downloader and parser plugins fromthe config.
-        getter = get_plugin(manager, conf['downloader'])
-        parser = get_plugin(manager, conf['parser'])
+    uuids = load_uuid_index(
+        global_conf.get('uuid_index', os.path.join(cache_dir, 'uuids.sqlite')),
+        journal=journal,
+        rebuild=cli_options.get('reindex', False)
+    )
+    new_uuids = []
+    rulesets = {}
+    writer = JournalWriter()
+
+    confs = [account_config(config, x, cli_options) for x in accounts]
+    locks = {}
+    for conf in confs:
+        for name in (conf['downloader'], conf['parser']):
+            locks.setdefault(name, threading.Lock())
+
+    # Downloading and parsing run in the pool, everything after that is done
+    # here in account order so the journal output is deterministic.
+    pool = ThreadPoolExecutor(max_workers=max(cli_options.get('jobs', 1), 1))
+    futures = [pool.submit(fetch_account, manager, x, locks) for x in confs]
+
+    for account, conf, future in zip(accounts, confs, futures):
+        logger.info('Processing ' + account)
 
-        file_path = conf.get('input_file', None)
-        try:
-            if not file_path:
-                file_path = getter.download(conf)
-        except:
-            logger.error('Error processing the account.')
+        transactions = future.result()
+        if transactions is None:
             continue
 
-        balances, transactions = parser.build_journal(file_path, conf)
-
-        transactions.sort(key=lambda x: x.date)
-
-        interactive_classifier = bayes.setup(journal_file=learning_file)
-        rules = rule.build_rules(conf.get('rules_file', None))
+        # Accounts using the same rules share one parsed rule set.
+        rules_file = conf.get('rules_file', None)
+        if rules_file not in rulesets:
+            rulesets[rules_file] = rule.build_rules(rules_file, cache_dir)
+        rules = rulesets[rules_file]
 
         print_results = False
         str_out = ''
 
-        # Build generator for filtered transactions
-        filtered = (x for x in transactions if x.uuid not in uuids)
-        for transaction in filtered:
+        # Batches are filtered and matched by column, transaction objects
+        # are only built for the rows that get imported.
+        if isinstance(transactions, TransactionBatch):
+            filtered = transactions.filter(
+                [x not in uuids for x in transactions.uuids]
+            )
+        else:
+            filtered = [x for x in transactions if x.uuid not in uuids]
+        found_rules = rule.find_matching_rules(rules, filtered)
+
+        # Classify every transaction that is not handled by a rule in a
+        # single batch.
+        payees = column(filtered, 'payee')
+        amounts = column(filtered, 'amount')
+        guesses = iter(interactive_classifier.classify_batch(
+            [payees[idx] + ' ' + amount_group(amounts[idx])
+             for idx, found in enumerate(found_rules)
+             if found.get('ignore', False) is not True and
+             not found.get('process', None)],
+            k=1
+        ))
+
+        for idx, found_rule in enumerate(found_rules):
             result = None
             postings = []
 
-            text = transaction.payee
-            amount = transaction.postings[0].amount
-            currency = transaction.postings[0].currency
-
-            found_rule = rule.find_matching_rule(rules, transaction)
-
             # Check for keys in rule
             skip = found_rule.get('ignore', False)
             process = found_rule.get('process', None)
 
             if skip is True:
                 continue
-            elif process:
+
+            transaction = filtered[idx]
+            amount = transaction.postings[0].amount
+            currency = transaction.postings[0].currency
+
+            if process:
                 for plug in process.keys():
                     logger.info('Use plugin: {}'.format(plug))
                     logger.debug(process[plug])
                     plugin = get_plugin(manager, plug)
-                    transaction = plugin.process(transaction, conf, process[plug])
+                    # Plugins may modify their arguments, the rule set is
+                    # reused so give them a copy.
+                    transaction = plugin.process(
+                        transaction, conf, dict(process[plug])
+                    )
 
             else: # Use classifier
-                result = interactive_classifier.classify(
-                    text + ' ' + amount_group(amount),
-                    method='bayes'
-                )
+                result = next(guesses)
                 result = [x for x in result if round(x[1], 10) > 0]
                 if len(result) > 0:
                     posting = {
@@ -277,14 +436,27 @@ def automatic():
 
             print_results = True
 
-            print(transaction.to_string(), '\n', file=sys.stderr)
-            str_out += "<pre><code>\n" + transaction.to_string() + "\n</code></pre>\n"
-            with open(conf['ledger_file'], 'a') as outfile:
-                print(transaction.to_string() + '\n', file=outfile)
+            rendered = transaction.to_string()
+            print(rendered, '\n', file=sys.stderr)
+            str_out += "<pre><code>\n" + rendered + "\n</code></pre>\n"
+            writer.add(conf['ledger_file'], account, rendered + '\n\n')
+            new_uuids.append(transaction.uuid)
 
         if print_results:
             msg_body += '<h2>Transactions for ' + account + '</h2>\n' + str_out
 
+    # Journals and index are only updated once all accounts are processed so
+    # an interrupted run leaves no partial import behind. The new UUID's are
+    # only committed if the journals were written, appends they miss are
+    # picked up by the next load_uuid_index.
+    pool.shutdown()
+    logger.info(
+        'Classifier cache: {}'.format(interactive_classifier.cache_info())
+    )
+    with uuids.atomic_update(new_uuids):
+        writer.flush()
+    uuids.close()
+
     print(HTML_TEMPLATE.format(body=msg_body), file=sys.stdout)
 
 
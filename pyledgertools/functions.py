@@ -1,5 +1,8 @@
 """Useful functions."""
 
+from datetime import date
+from decimal import Decimal
+
 try:
     from math import gcd
 except ImportError:
@@ -23,21 +26,64 @@ def amount_group(val):
         return prefix + '0'
 
 
+def to_decimal(value):
+    """Convert an amount to :obj:`Decimal`.
+
+    Floats are converted from their shortest repr so ``0.1`` becomes
+    ``Decimal('0.1')`` and not the exact binary value.
+
+    >>> to_decimal(0.1)
+    Decimal('0.1')
+    """
+    if value is None or isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    if isinstance(value, str):
+        return Decimal(value.replace(',', ''))
+    return Decimal(value)
+
+
 def GCD(dollars):
     """Find greatest common divisor of list of dollar ammounts.
 
-    Works with integer and floats.
+    Works with integer, float and Decimal values.
 
     Parameters:
         dollars (list): Values to find the common denominator.
+
+    Returns:
+        Decimal: Greatest common divisor, to the cent.
     """
 
-    # Convert dollar values to integers
-    dollars = [int(d * 100) for d in dollars]
+    # Convert dollar values to integer cents
+    cents = [int((to_decimal(d) * 100).to_integral_value()) for d in dollars]
 
-    res = dollars[0]
+    res = cents[0]
 
-    for c in dollars[1::]:
+    for c in cents[1::]:
         res = gcd(res, c)
 
-    return res / 100
+    return Decimal(res) / 100
+
+
+def months_ago(months, today=None):
+    """Date string for the first day of the month `months` months ago.
+
+    Matches the start of a ledger ``from N months ago`` period.
+
+    Parameters:
+        months (int): Number of months to go back.
+        today (date): Reference date, defaults to today.
+
+    Returns:
+        str: Date formatted as ``YYYY-MM-DD``.
+
+    >>> months_ago(12, date(2017, 3, 15))
+    '2016-03-01'
+    """
+    if today is None:
+        today = date.today()
+
+    index = today.year * 12 + today.month - 1 - months
+    return '{:04d}-{:02d}-01'.format(index // 12, index % 12 + 1)
@@ -4,6 +4,10 @@
 from __future__ import print_function
 
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_EVEN
+from sys import intern
+
+from pyledgertools.functions import to_decimal
 
 
 now = datetime.now
@@ -35,12 +39,20 @@ def make_meta_string(metadata, indent):
     return '\n'.join(m)
 
 
+CENT = Decimal('0.01')
+
+
 class Posting(object):
     """Posting class for transactions.
 
+    Postings are created in large numbers when reading journals so they have
+    no instance dictionary and the account and currency strings are interned.
+
     Attributes:
         account (str): Name of the ledger account for this posting.
-        amount (float): Dollar value of the posting.
+        amount (Decimal): Dollar value of the posting or `None` when elided.
+            Values of other types are converted with
+            :func:`pyledgertools.functions.to_decimal`.
         currency (str): String representing the allocation commodity.
             ``$``, ``USD``, ``CAN`` etc.
         assertion (bool): Set to `True` if posting is a balance assertion.
@@ -57,24 +69,53 @@ class Posting(object):
         metadata (list): Key/value pairs to add to posting.
     """
 
+    __slots__ = (
+        'account', '_amount', 'currency', 'assertion', 'tags', 'metadata'
+    )
+
     def __init__(self, **kwargs):
         """Initialize allocation.
 
         Parameters:
             account (str): Name of the ledger account for this posting.
-            amount (float): Dollar value of the posting.
+            amount (Decimal, float or str): Dollar value of the posting.
             currency (str): String representing the allocation commodity.
             assertion (bool): Set to 'True' if posting is balance assertion.
             tags (list): Tag strings to add to the posting.
             metadata (list): Key/value pairs to add to posting.
         """
-        self.account = kwargs['account']
+        self.account = intern(kwargs['account'])
         self.amount = kwargs['amount']
-        self.currency = kwargs.get('currency', '$')
+        self.currency = intern(kwargs.get('currency', '$'))
         self.assertion = kwargs.get('assertion', False)
         self.tags = kwargs.get('tags', [])
         self.metadata = kwargs.get('metadata', [])
 
+    @property
+    def amount(self):
+        amount = self._amount
+        if amount.__class__ is int:
+            return Decimal(amount).scaleb(-2)
+        return amount
+
+    @amount.setter
+    def amount(self, value):
+        # Whole cent amounts, by far the most common, are kept as an integer
+        # number of cents which takes a fraction of the memory of a Decimal.
+        value = to_decimal(value)
+        if (value is not None and value.is_finite() and
+                value.as_tuple().exponent >= -2):
+            value = int(value * 100)
+        self._amount = value
+
+    @property
+    def cents(self):
+        """Amount in integer cents, rounded half to even."""
+        amount = self._amount
+        if amount is None or amount.__class__ is int:
+            return amount
+        return int(amount.quantize(CENT, ROUND_HALF_EVEN) * 100)
+
     def to_string(self, width=80, indent=4):
         """ Posting as string. Fix to width in this.
 
@@ -123,8 +164,14 @@ class Transaction(object):
         bankid (str):
         acctid (str):
         account (str):
+        uuid (str): Unique id of the imported transaction.
     """
 
+    __slots__ = (
+        'date', 'flag', 'payee', 'tags', 'metadata', 'postings', 'bankid',
+        'acctid', 'account', 'uuid',
+    )
+
     def __init__(self, **kwargs):
         """Initialize Transaction object.
 
@@ -141,7 +188,7 @@ class Transaction(object):
             acctid (str):
             account (str):
         """
-        self.date = kwargs['date']
+        self.date = intern(kwargs['date'])
         self.flag = kwargs.get('flag', ' ')
         self.payee = kwargs['payee']
         self.tags = kwargs.get('tags', [])
@@ -176,7 +223,9 @@ class Transaction(object):
         if len(self.metadata) > 0:
             outlist.append(make_meta_string(self.metadata, ind))
 
-        postings = [a.to_string(indent=indent) for a in self.postings]
+        postings = [
+            a.to_string(width=width, indent=indent) for a in self.postings
+        ]
         outlist.append('\n'.join(postings))
 
         return '\n'.join(outlist)
@@ -186,7 +235,7 @@ class Transaction(object):
 
         Parameters:
             account (str): Name of the ledger account for this posting.
-            amount (float): Dollar value of the allocation.
+            amount (Decimal, float or str): Dollar value of the allocation.
             currency (str): String representing the posting commodity.
         """
         new_posting = Posting(
@@ -196,3 +245,79 @@ class Transaction(object):
         )
 
         self.postings.append(new_posting)
+
+
+def _amount_text(posting):
+    """Amount of a posting formatted like :meth:`Posting.to_string`."""
+    amount = posting._amount
+    if amount.__class__ is int:
+        whole, cents = divmod(-amount if amount < 0 else amount, 100)
+        return '{}{}.{:02d}'.format('-' if amount < 0 else '', whole, cents)
+    return '{:.2f}'.format(amount)
+
+
+def render_journal(transactions, stream, width=80, indent=4):
+    """Write transactions to a text stream in ledger journal format.
+
+    Produces the same text as writing ``transaction.to_string(width,
+    indent) + '\n\n'`` for every transaction, without building the
+    intermediate strings and lists for each posting.
+
+    Parameters:
+        transactions (iterable): :obj:`Transaction` objects.
+        stream (file): Text stream to write to.
+        width (int): Column to align the decimal point of amounts to, see
+            :meth:`Posting.to_string`.
+        indent (int): Number of spaces to indent each level of transaction.
+
+    Returns:
+        int: Number of transactions written.
+    """
+    write = stream.write
+    ind = ' ' * indent
+    tag_prefix = '\n' + ind + '; :'
+    meta_prefix = '\n' + ind + '; '
+    posting_tag_prefix = '\n' + ind * 2 + '; :'
+    posting_meta_prefix = '\n' + ind * 2 + '; '
+    posting_prefix = '\n' + ind
+    # Fill is width less the indent, account, amount up to the decimal point
+    # and three more characters.
+    fill_base = width - indent - 3
+
+    count = 0
+    for transaction in transactions:
+        out = [transaction.date, transaction.flag, transaction.payee]
+
+        if transaction.tags:
+            out += [tag_prefix, ':'.join(transaction.tags), ':']
+        for meta in transaction.metadata:
+            out.append('{}{}: {}'.format(meta_prefix, meta[0], meta[1]))
+
+        if transaction.postings:
+            for posting in transaction.postings:
+                account = posting.account
+                amount = posting.currency + ' ' + _amount_text(posting)
+                if posting.assertion:
+                    amount = '= ' + amount
+
+                point = amount.find('.')
+                if point < 0:
+                    point = len(amount)
+                fill = fill_base - len(account) - point
+
+                out += [posting_prefix, account, ' ' * fill, amount]
+
+                if posting.tags:
+                    out += [posting_tag_prefix, ':'.join(posting.tags), ':']
+                for meta in posting.metadata:
+                    out.append('{}{}: {}'.format(
+                        posting_meta_prefix, meta[0], meta[1]
+                    ))
+        else:
+            out.append('\n')
+
+        out.append('\n\n')
+        write(''.join(out))
+        count += 1
+
+    return count
@@ -0,0 +1,441 @@
+"""Sidecar index of the entries in a journal file.
+
+Searching a journal otherwise means reading and parsing all of it. The
+index is a SQLite database stored next to the journal
+(``.<journal>.index``) that maps transaction dates, payee tokens, UUID's and
+``file:`` metadata to the byte offset and line number of each entry, so a
+search only has to seek to the entries that match.
+
+Journals normally only grow at the end. The index remembers how far the
+journal was indexed and a digest of the bytes before that point; when the
+journal was only appended to just the new entries are indexed, otherwise
+the index is rebuilt.
+"""
+
+import os
+import re
+import sqlite3
+
+from pyledgertools.reader import (
+    COMMENT_CHARS, HEADER_REGEX, INCLUDE_REGEX, META_REGEX, SKIP_BLOCK_REGEX,
+    _include_paths, default_journal, mark_digest, sidecar_path
+)
+
+INDEX_EXT = '.index'
+INDEX_VERSION = 1
+
+# Metadata keys (lower case) that are indexed and the field they are
+# stored under.
+INDEXED_META = {
+    'uuid': 'uuid',
+    'file': 'file',
+}
+
+DATE_REGEX = re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})$')
+TOKEN_REGEX = re.compile(r'\w+')
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)',
+    'CREATE TABLE IF NOT EXISTS entries ('
+    'offset INTEGER PRIMARY KEY, length INTEGER, line INTEGER, '
+    'date INTEGER)',
+    'CREATE INDEX IF NOT EXISTS entries_date ON entries (date)',
+    'CREATE TABLE IF NOT EXISTS terms ('
+    'field TEXT, term TEXT, offset INTEGER, '
+    'PRIMARY KEY (field, term, offset)) WITHOUT ROWID',
+]
+
+
+def index_path(journal):
+    """Location of the index of a journal file, see :func:`sidecar_path`."""
+    return sidecar_path(journal, INDEX_EXT)
+
+
+def date_key(date):
+    """Convert a ``YYYY-MM-DD`` or ``YYYY/MM/DD`` date to ``YYYYMMDD``.
+
+    Dates that already are ``YYYYMMDD`` integers are returned unchanged.
+    """
+    if isinstance(date, int):
+        return date
+    match = DATE_REGEX.match(date.strip())
+    if not match:
+        raise ValueError('Invalid date: {!r}'.format(date))
+    y, m, d = match.groups()
+    return int(y) * 10000 + int(m) * 100 + int(d)
+
+
+def payee_tokens(payee):
+    """Normalized search tokens of a payee.
+
+    >>> payee_tokens('AMAZON Mktp US*2K3')
+    ['2k3', 'amazon', 'mktp', 'us']
+    """
+    return sorted(set(TOKEN_REGEX.findall(payee.lower())))
+
+
+def iter_offsets(f, offset=0, line=1):
+    """Group the lines of a journal into entries and track their position.
+
+    Entries are split the same way as :func:`reader.iter_entries`. Only the
+    lines needed by :func:`entry_terms` are decoded and returned.
+
+    Parameters:
+        f (file): Journal opened in binary mode.
+        offset (int): Offset to start reading at, the start of a line.
+        line (int): Line number at `offset`.
+
+    Yields:
+        tuple: Offset, length, first line number of an entry and a list of
+        its header and comment lines.
+    """
+    f.seek(offset)
+    pos = offset
+    entry = None
+    skip_end = None
+
+    for raw in f:
+        start = pos
+        pos += len(raw)
+        number = line
+        line += 1
+
+        if skip_end is not None:
+            if raw.strip() == skip_end:
+                skip_end = None
+            continue
+
+        if raw[:1] in b' \t\r\n':
+            if not raw.strip():
+                if entry:
+                    yield _entry(entry)
+                    entry = None
+            elif entry:
+                entry[1] = pos
+                if b';' in raw:
+                    entry[3].append(_decode(raw))
+            continue
+
+        if entry:
+            yield _entry(entry)
+            entry = None
+
+        text = _decode(raw)
+        if text[0] in COMMENT_CHARS:
+            continue
+
+        match = SKIP_BLOCK_REGEX.match(text)
+        if match:
+            skip_end = ('end ' + match.group(1)).encode()
+            continue
+
+        entry = [start, pos, number, [text]]
+
+    if entry:
+        yield _entry(entry)
+
+
+def _decode(raw):
+    return raw.decode('utf-8', 'replace').rstrip('\r\n')
+
+
+def _entry(entry):
+    start, end, number, lines = entry
+    return start, end - start, number, lines
+
+
+def entry_terms(lines):
+    """Date and search terms of an entry.
+
+    Parameters:
+        lines (list): Header and comment lines of the entry.
+
+    Returns:
+        tuple: Date as ``YYYYMMDD`` (`None` for entries that are not
+        transactions) and a list of ``(field, term)`` pairs.
+    """
+    header = lines[0]
+    match = INCLUDE_REGEX.match(header)
+    if match:
+        return None, [('include', match.group('path'))]
+
+    match = HEADER_REGEX.match(header.split(';', 1)[0].rstrip())
+    if not match:
+        return None, []
+
+    terms = [('payee', x) for x in payee_tokens(match.group('payee'))]
+    for text in lines:
+        idx = text.find(';')
+        if idx < 0:
+            continue
+        meta = META_REGEX.match(text[idx:].strip())
+        if meta:
+            field = INDEXED_META.get(meta.group('key').lower())
+            if field is not None:
+                terms.append((field, meta.group('value').strip()))
+
+    return date_key(match.group('date')), terms
+
+
+class JournalIndex(object):
+    """SQLite index of the entries in a journal file.
+
+    Attributes:
+        journal (str): Indexed journal file.
+        path (str): Location of the SQLite database file.
+    """
+
+    def __init__(self, journal, path=None):
+        """Open (and create if needed) the index of a journal.
+
+        The index is not brought up to date, call :meth:`update` for that.
+
+        Parameters:
+            journal (str): Journal file.
+            path (str): Location of the index, next to the journal when not
+                given.
+        """
+        self.journal = os.path.abspath(journal)
+        self.path = path or index_path(journal)
+        self._conn = sqlite3.connect(self.path)
+
+        if self._meta('version') not in (None, INDEX_VERSION):
+            with self._conn:
+                for table in ('meta', 'entries', 'terms'):
+                    self._conn.execute('DROP TABLE IF EXISTS ' + table)
+
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            self._set_meta(version=INDEX_VERSION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM entries'
+        ).fetchone()[0]
+
+    def _meta(self, key):
+        try:
+            row = self._conn.execute(
+                'SELECT value FROM meta WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            values.items()
+        )
+
+    def clear(self):
+        """Remove every entry from the index."""
+        with self._conn:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.execute('DELETE FROM terms')
+            self._conn.execute(
+                "DELETE FROM meta WHERE key IN "
+                "('offset', 'line', 'end', 'digest')"
+            )
+
+    def update(self):
+        """Index the entries added to the journal since the last update.
+
+        The last entry is indexed again on every update in case lines were
+        appended to it. The whole journal is indexed again when it was
+        changed other than by appending.
+
+        Returns:
+            int: Number of entries indexed.
+        """
+        with open(self.journal, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            end = self._meta('end')
+            offset = self._meta('offset') or 0
+            line = self._meta('line') or 1
+
+            if end is not None and (
+                    size < end or mark_digest(f, end) != self._meta('digest')):
+                self.clear()
+                end = None
+                offset = 0
+                line = 1
+
+            if end == size:
+                return 0
+
+            # Entries from here on are indexed again.
+            restart = offset
+            entries = []
+            terms = []
+            for start, length, number, lines in iter_offsets(f, offset, line):
+                date, found = entry_terms(lines)
+                if date is not None:
+                    entries.append((start, length, number, date))
+                terms.extend((x, y, start) for x, y in found)
+                offset = start
+                line = number
+
+            digest = mark_digest(f, size)
+
+        # Appending to an entry can only add terms, the terms indexed for
+        # it before are kept. Sorted inserts are much faster on a rebuild.
+        terms.sort()
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM entries WHERE offset >= ?', (restart,)
+            )
+            self._conn.executemany(
+                'INSERT INTO entries (offset, length, line, date) '
+                'VALUES (?, ?, ?, ?)', entries
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO terms (field, term, offset) '
+                'VALUES (?, ?, ?)', terms
+            )
+            self._set_meta(offset=offset, line=line, end=size, digest=digest)
+
+        return len(entries)
+
+    def find(self, payee=None, uuid=None, file=None, begin=None, end=None):
+        """Find transactions in the index.
+
+        All given conditions have to match.
+
+        Parameters:
+            payee (str): Every token of the payee has to start one of the
+                payee tokens of a transaction.
+            uuid (str): Transaction UUID.
+            file (str): Part of the ``file:`` metadata, ignoring case.
+            begin (str): First date, inclusive. A date string or
+                ``YYYYMMDD`` integer.
+            end (str): Last date, exclusive like ledger's ``--end``.
+
+        Returns:
+            list: ``(offset, length, line)`` of the matching transactions in
+            file order.
+        """
+        where = []
+        args = []
+
+        if begin:
+            where.append('date >= ?')
+            args.append(date_key(begin))
+        if end:
+            where.append('date < ?')
+            args.append(date_key(end))
+
+        terms = 'offset IN (SELECT offset FROM terms WHERE field = ? AND {})'
+        for token in payee_tokens(payee or ''):
+            where.append(terms.format('term >= ? AND term < ?'))
+            args.extend(['payee', token, token + '\uffff'])
+        if uuid:
+            where.append(terms.format('term = ?'))
+            args.extend(['uuid', uuid])
+        if file:
+            where.append(terms.format("term LIKE ? ESCAPE '\\'"))
+            escaped = re.sub(r'([%_\\])', r'\\\1', file)
+            args.extend(['file', '%' + escaped + '%'])
+
+        query = 'SELECT offset, length, line FROM entries'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY offset'
+
+        return self._conn.execute(query, args).fetchall()
+
+    def terms(self, field, offsets=None):
+        """Indexed values of a field.
+
+        Parameters:
+            field (str): ``payee``, ``uuid``, ``file`` or ``include``.
+            offsets (list): Only return values of the entries at these
+                offsets.
+
+        Returns:
+            list: ``(offset, term)`` pairs in file order.
+        """
+        rows = self._conn.execute(
+            'SELECT offset, term FROM terms WHERE field = ? '
+            'ORDER BY offset, term', (field,)
+        )
+        if offsets is None:
+            return rows.fetchall()
+        offsets = set(offsets)
+        return [x for x in rows if x[0] in offsets]
+
+    def read(self, entries):
+        """Read entries from the journal.
+
+        Parameters:
+            entries (list): ``(offset, length, line)`` tuples from
+                :meth:`find`.
+
+        Yields:
+            tuple: Line number and text of each entry.
+        """
+        with open(self.journal, 'rb') as f:
+            for offset, length, line in entries:
+                f.seek(offset)
+                yield line, f.read(length).decode('utf-8', 'replace')
+
+    def includes(self):
+        """Files included by the journal."""
+        paths = []
+        for _, pattern in self.terms('include'):
+            paths.extend(_include_paths(self.journal, pattern))
+        return paths
+
+    def close(self):
+        self._conn.close()
+
+
+def open_indexes(paths=None, update=True):
+    """Open the indexes of journal files and the files they include.
+
+    Parameters:
+        paths (list): Journal files, the default journal when not given.
+        update (bool): Bring the indexes up to date.
+
+    Yields:
+        JournalIndex: Index of each journal file. It is closed when the
+        next one is requested.
+    """
+    if paths is None:
+        paths = [default_journal()]
+
+    seen = set()
+    pending = [os.path.realpath(x) for x in paths if x]
+    while pending:
+        path = pending.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+
+        with JournalIndex(path) as index:
+            if update:
+                index.update()
+            pending[:0] = [os.path.realpath(x) for x in index.includes()]
+            yield index
+
+
+def update_index(journal):
+    """Update the index of a journal if it has one."""
+    if os.path.exists(index_path(journal)):
+        with JournalIndex(journal) as index:
+            index.update()
+
+
+def remove_index(journal):
+    """Remove the index of a journal if it has one."""
+    try:
+        os.remove(index_path(journal))
+    except OSError:
+        pass
@@ -1,114 +1,121 @@
 #! /usr/bin/env python3
 """Transaction classifier Implementation."""
 
-from naiveBayesClassifier import tokenizer
-from naiveBayesClassifier.trainer import Trainer
-from naiveBayesClassifier.classifier import Classifier as BayesClassifier
 from yapsy.IPlugin import IPlugin
-from itertools import groupby
 
-from operator import itemgetter
-import re
+from collections import namedtuple, OrderedDict
 
-from pyledgertools.functions import amount_group, GCD
+from pyledgertools.bayes import HashingTokenizer, NaiveBayes, Tokenizer
+from pyledgertools.training import WindowedModel, train_transactions
 
-DOLLAR_REGEX = '([\$A-Z]+)?\s?([\-0-9]+.[0-9]{2,2})?'
-
-# Allocation RegEx
-ALLOC_REGEX = '\s+([A-Za-z0-9:_\- ]*[A-Za-z0-9:_\-]+)\s*' + DOLLAR_REGEX
-# ALLOC_REGEX = '\s+((?!.*  )[a-zA-Z0-9:_\- ]*)' + DOLLAR_REGEX
-TRANS_REGEX = '^\d{4,4}[/-]{1,1}\d{2,2}[/-]{1,1}\d{2,2}\s+[!\*]?\s?(?P<payee>[&#\w\s]+)'
-
-
-def train_journal(journal_string):
-    """Generate training data from ledger entries."""
-    blocks = [x.split('\n') for x in journal_string.decode('utf-8').split('\n\n')]
-    training_data = []
-
-    for tran in blocks:
-        tran = [x.split('=')[0] for x in tran if x != '' and not re.match('\s*;',x)]
-        if len(tran) > 0:
-            result = re.search(TRANS_REGEX, tran[0])
-            if result:
-                payee = result.group('payee')
-
-            result = re.findall(ALLOC_REGEX, ' '.join(tran[1:]))
-            if len(result) > 1:
-                try:
-                    alloc_list = list(result[1])
-                    alloc_list[2] = float(result[0][2])
-                    alloc_list[0] = alloc_list[0].strip()
-                    payee += ' ' + amount_group(alloc_list[2])
-                    training_data.append([payee] + alloc_list)
-                # Skip tranactions where amount can't be converted to float.
-                # Occurs in transactions containing commodity conversion.
-                except ValueError:
-                    pass
-
-    sorted_data = sorted(training_data, key=itemgetter(1))
-    sorted_data = groupby(sorted_data, itemgetter(1))
-
-    return_data = []
-    for elmnt, items in sorted_data:
-        grp_tran = [v for v in items]
-        return_data.append([elmnt, grp_tran, GCD([v[3] for v in grp_tran])])
-    return return_data
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
 
 class Classifier(object):
-    """Custom class to implement naive bayes classification using
-    naiveBayesClassifier.
+    """Naive bayes classification of transactions.
 
     Attributes:
-        classifier (Classifier object): Object of class `Classifier` for
-            classifying transactios based on existing journal.
+        model (NaiveBayes): Token count model used for classification.
     """
 
     class NotImplemented(Exception):
         pass
 
-    def __init__(self, journal=None):
+    # Number of classification results kept, see :meth:`cache_info`.
+    CACHE_SIZE = 4096
+
+    def __init__(self, transactions=None, hash_buckets=None):
         """Classifer initialization.
 
         Parameters:
-            journal_file (str): Journal file string to import.
+            transactions (iterable): :obj:`Transaction` objects to train
+                from.
+            hash_buckets (int): Hash tokens into this many buckets instead
+                of keeping every distinct token.
         """
-        self._tknizer = tokenizer.Tokenizer(signs_to_remove=['?!%.'])
-        self._trainer = Trainer(self._tknizer)
-        if journal is not None:
-            journal_data = train_journal(journal)
-
-            for group in journal_data:
-                # 0: Allocation account.
-                # 1: List of transactions.
-                # 2: Greatest common multiple of values in transactions.
-                for transaction in group[1]:
-                    # 0: Transaction payee string.
-                    # 1: Allocation account.
-                    self._trainer.train(transaction[0], transaction[1])
-
-            self._classifier = BayesClassifier(
-                self._trainer.data,
-                self._tknizer
-            )
+        if hash_buckets:
+            tokenizer = HashingTokenizer(hash_buckets, '?!%.\'')
         else:
-            self._classifier = None
+            tokenizer = Tokenizer(signs_to_remove='?!%.\'')
+        self.model = NaiveBayes(tokenizer)
+
+        self._cache = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        if transactions is not None:
+            self.extend(transactions)
+
+    @classmethod
+    def from_window(cls, state_dir, paths=None, jobs=1, window=12,
+                    rebuild=False, **options):
+        """Load a classifier trained on a sliding window of months.
+
+        The saved model is updated with the transactions added to the
+        journal since the last call, see
+        :obj:`pyledgertools.training.WindowedModel`.
+
+        Parameters:
+            state_dir (str): Directory holding the model state.
+            paths (str or list): Journal file(s), defaults to the ledger
+                default journal.
+            jobs (int): Number of processes to train with.
+            window (int): Number of months, before the current one, to
+                train on.
+            rebuild (bool): Train on the whole window again instead of
+                updating the saved model.
+            options: Other :obj:`WindowedModel` options.
+
+        Returns:
+            Classifier: Trained classifier.
+        """
+        classifier = cls()
+        classifier.model = WindowedModel(state_dir, window, **options).refresh(
+            paths, jobs, rebuild=rebuild
+        )
+
+        return classifier
+
+    def train(self, examples):
+        """Train on ``(text, category)`` pairs.
+
+        Parameters:
+            examples (iterable): Training examples, consumed one at a time.
+        """
+        self._cache.clear()
+        update = self.model.update
+        for text, category in examples:
+            update(text, category)
+
+    def extend(self, transactions):
+        """Train on additional journal transactions.
+
+        Parameters:
+            transactions (iterable): :obj:`Transaction` objects.
+        """
+        self.train(train_transactions(transactions))
 
     def update(self, text, category):
         """Update training data with new examples.
 
-        Adds new data to the trainer then generates a new classifier. Can be
-        useful for updating on the fly if performing an interactive data import.
+        Only the token counts of the example are updated so this is cheap
+        enough to call for every transaction of an interactive data import.
 
         Parameters:
             text (str): New text to classify.
             category (str): Classification of `text`.
         """
-        self._trainer.train(text, category)
-        self._classifier = BayesClassifier(
-            self._trainer.data,
-            self._tknizer
-        )
+        self._cache.clear()
+        self.model.update(text, category)
+
+    def forget(self, text, category):
+        """Remove an example added with :meth:`update`.
+
+        Parameters:
+            text (str): Example text.
+            category (str): Classification of `text`.
+        """
+        self._cache.clear()
+        self.model.forget(text, category)
 
     def classify(self, text, method='bayes'):
         """Give classifcation for a text string using bayes classification.
@@ -121,10 +128,12 @@ class Classifier(object):
         """
 
         if method == 'bayes':
-            if self._classifier is not None:
-                return self._classifier.classify(text)
-            else:
-                return None
+            key = (text.lower(), None)
+            result = self._cache_get(key)
+            if result is None:
+                result = self.model.classify(text)
+                self._cache_put(key, result)
+            return list(result)
 
         elif method == 'rules':
             raise NotImplementedError(
@@ -133,7 +142,78 @@ class Classifier(object):
         else:
             raise NotImplemented('The method `{}` is not valid'.format(method))
 
+    def classify_batch(self, texts, k=None, method='bayes'):
+        """Classify several text strings at once.
+
+        Parameters:
+            texts (list): Texts to classify.
+            k (int): Number of best categories to return per text, all when
+                `None`.
+            method (str): Type of classification to use. Default to `bayes`.
+        Returns:
+            list: For each text the best categories and their probabilities.
+        """
+        if method != 'bayes':
+            return [self.classify(x, method)[:k] for x in texts]
+
+        keys = [(x.lower(), k) for x in texts]
+        found = {}
+        missing = OrderedDict()
+        for text, key in zip(texts, keys):
+            if key in found or key in missing:
+                # Repeated within the batch, scored only once.
+                self._hits += 1
+                continue
+            result = self._cache_get(key)
+            if result is None:
+                missing[key] = text
+            else:
+                found[key] = result
+
+        scored = []
+        if missing:
+            scored = self.model.classify_batch(list(missing.values()), k)
+        for key, result in zip(missing, scored):
+            found[key] = result
+            self._cache_put(key, result)
+
+        return [list(found[x]) for x in keys]
+
+    def cache_info(self):
+        """Statistics of the classification result cache.
+
+        Results are cached by lower case text so repeated payees are only
+        scored once. The cache is cleared whenever the model is trained.
+
+        Returns:
+            CacheInfo: ``(hits, misses, maxsize, currsize)`` like
+            :func:`functools.lru_cache`.
+        """
+        return CacheInfo(
+            self._hits, self._misses, self.CACHE_SIZE, len(self._cache)
+        )
+
+    def cache_clear(self):
+        """Empty the classification result cache and reset its statistics."""
+        self._cache.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def _cache_get(self, key):
+        result = self._cache.get(key)
+        if result is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            self._cache.move_to_end(key)
+        return result
+
+    def _cache_put(self, key, result):
+        self._cache[key] = result
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+
 
 class PluginLoader(IPlugin):
-    def setup(self, journal_file=None):
-        return Classifier(journal_file)
+    def train_window(self, state_dir, journal=None, jobs=1, **options):
+        return Classifier.from_window(state_dir, journal, jobs, **options)
@@ -1,162 +1,9 @@
 import yaml
-import os
-import sys
 import re
 
 from yapsy.IPlugin import IPlugin
 
-
-# Comparison functions
-# Dates used as strings in format YYYY-MM-DD so string comparison can be used
-def CONTAINS(rule_value, tran_value):
-    """Return True if rule_value contained in tran_value
-    """
-
-    rule_value = rule_value.lower()
-    tran_value = tran_value.lower()
-
-    return tran_value.find(rule_value) >= 0
-
-
-def STARTS_WITH(rule_value, tran_value):
-    """Return True if tran_value starts with rule_value
-    """
-
-    rule_value = rule_value.lower()
-    tran_value = tran_value.lower()
-
-    tran_value = tran_value.strip()
-    return tran_value.startswith(rule_value)
-
-
-def ENDS_WITH(rule_value, tran_value):
-    """Return True if tran_value ends with rule_value
-
-    Parameters:
-        rule_value: Value from the rule file to check for.
-        tran_value: Value from transaction.
-    Return:
-        bool: Will return true if `tran_value` ends with `rule_value`.
-    """
-
-    rule_value = rule_value.lower()
-    tran_value = tran_value.lower()
-
-    tran_value = tran_value.strip()
-    return tran_value.endswith(rule_value)
-
-
-def EQUALS(rule_value, tran_value):
-    """Test for equality
-
-    Parameters:
-        rule_value: Value from the rule file to check for.
-        tran_value: Value from transaction.
-    Return:
-        bool: Return True if rule_value is euqal to tran_value.  Works for both
-        numbers and strings
-    """
-
-    try:
-        rule_value = float(rule_value)
-        tran_value = float(tran_value)
-        return rule_value == tran_value
-    except ValueError:
-        rule_value = rule_value.lower()
-        tran_value = tran_value.lower()
-        tran_value = tran_value.strip()
-
-        return rule_value == tran_value
-
-
-def GT(rule_value, tran_value):
-    try:
-        rule_value = float(rule_value)
-        tran_value = float(tran_value)
-        return rule_value < tran_value
-    except ValueError:
-        rule_value = rule_value.lower()
-        tran_value = tran_value.lower()
-        return rule_value < tran_value
-
-
-def GE(rule_value, tran_value):
-    try:
-        rule_value = float(rule_value)
-        tran_value = float(tran_value)
-        return rule_value <= tran_value
-    except ValueError:
-        rule_value = rule_value.lower()
-        tran_value = tran_value.lower()
-        return rule_value <= tran_value
-
-
-def LT(rule_value, tran_value):
-    try:
-        rule_value = float(rule_value)
-        tran_value = float(tran_value)
-        return rule_value > tran_value
-    except ValueError:
-        rule_value = rule_value.lower()
-        tran_value = tran_value.lower()
-        return rule_value > tran_value
-
-
-def LE(rule_value, tran_value):
-    try:
-        rule_value = float(rule_value)
-        tran_value = float(tran_value)
-        return rule_value >= tran_value
-    except ValueError:
-        rule_value = rule_value.lower()
-        tran_value = tran_value.lower()
-        return rule_value >= tran_value
-
-
-def MOD(rule_value, tran_value):
-    modulus = float(tran_value) % float(rule_value)
-
-    if modulus == 0:
-        return True
-
-    return False
-
-
-# Boolean logic functions
-def AND(bools):
-    """Logical And."""
-    if False in bools:
-        return False
-
-    return True
-
-
-def OR(bools):
-    """Logical OR."""
-    if True in bools:
-        return True
-
-    return False
-
-
-def NAND(bools):
-    return not AND(bools)
-
-
-def NOR(bools):
-    return not OR(bools)
-
-
-def XOR(bools):
-    """Logical Xor.
-       Result is True if there are an odd number of true items
-       and False if there are an even number of true items.
-    """
-    # Return false if there are an even number of True results.
-    if len([x for x in bools if x is True]) % 2 == 0:
-        return False
-
-    return True
+from pyledgertools.rules import RuleSet, compile_rules, load_rules, match_all
 
 
 class RuleClassifier(IPlugin):
@@ -184,98 +31,56 @@ class RuleClassifier(IPlugin):
 
         return rule_yml[payee]
 
-    def check_condition(self, condition, tran_obj):
-        """Convert the condition string from the rule into the
-        appropriate function and evaluate it.
+    def build_rules(self, rule_loc, cache_dir=None):
+        """Build rules from file or directory.
+
+        If a directory is given all .rules files in it are combined into a
+        single dictionary. Parsed files are cached in `cache_dir`.
         ::
 
             Company Income:
               Conditions:
                 - AND:
                   - payee CONTAINS My Employer
-                  - AND:
-                    - amount GT 800.00
+                  - amount GT 800.00
               Allocations:
                 - 100 PERCENT Revenue:Salary
 
-            Company Bonus:
-              Conditions:
-                - AND:
-                  - payee CONTAINS My Employer
-                  - AND:
-                    - amount LT 800.00
-              Allocations:
-                - 100 PERCENT Revenue:Bonus
-
-        Parameters:
-            condition (str): Formatted string from rules file.
-            tran_obj (Transaction): Transaction object to test against.
+        Returns:
+            RuleSet: Compiled rules.
         """
-        condition = condition.split(' ')
-
-        field = condition[0].lower()
-        test = condition[1]
-        rule_value = ' '.join(condition[2:])
-
-        # Use string value to access comparison function
-        # sys.module[__name__] returns this module
-        test_func = getattr(sys.modules[__name__], test)
-
-        # If testing the transaction amount, the amount of the first allocation
-        # which contains the primary bank account side of the transactions.
-        if field == 'amount':
-            tran_value = tran_obj.postings[0].amount
-        else:
-            tran_value = getattr(tran_obj, field)
-
-        return test_func(rule_value, tran_value)
-
-    def build_rules(self, rule_loc):
-        """Build rules from file or directory."""
-        rules = None
-
-        if os.path.isfile(rule_loc):
-            rules = yaml.load(open(rule_loc))
-
-        # If directory is given find all .rules files in directory
-        # and build a single dictionary from their contents.
-        elif os.path.isdir(rule_loc):
-            rules = {}
-            for root, dirs, files in os.walk(rule_loc):
-                for file in files:
-                    if file.endswith('.rules'):
-                        rules.update(yaml.load(open(os.path.join(root, file))))
-
-        return rules
+        return compile_rules(load_rules(rule_loc, cache_dir))
 
     def find_matching_rule(self, rules, trans_obj):
-        """Find rule that matches a transaction."""
-        found_rule = {}
+        """Find rule that matches a transaction.
 
-        for rule in rules.keys():
-            match = self._walk_rules(rules[rule]['conditions'], trans_obj)
-            if match:
-                found_rule = rules[rule]
-                break
+        Parameters:
+            rules (RuleSet): Rules from :meth:`build_rules`. A plain rule
+                dictionary is compiled first.
+            trans_obj (Transaction): Transaction to match.
+        """
+        if not isinstance(rules, RuleSet):
+            rules = compile_rules(rules)
 
-        return found_rule
+        return rules.find(trans_obj)
 
-    def _walk_rules(self, conditions, trans_obj=None, logic=None):
-        results = []
-        for condition in conditions:
-            if isinstance(condition, dict):
-                new_logic = list(condition.keys())[0]
-                res = self._walk_rules(condition[new_logic], trans_obj, new_logic)
-            if isinstance(condition, str):
-                res = self.check_condition(condition, trans_obj)
+    def find_matching_rules(self, rules, transactions):
+        """Find the rule matching each of a list of transactions.
 
-            results.append(res)
+        Parameters:
+            rules (RuleSet): Rules from :meth:`build_rules`.
+            transactions (list): Transactions or a
+                :obj:`TransactionBatch` to match.
 
-        if logic is None:
-            logic = 'AND'
+        Returns:
+            list: Matching rule for each transaction, empty dictionaries where
+            no rule matches.
+        """
+        if not isinstance(rules, RuleSet):
+            rules = compile_rules(rules)
 
-        # Evaluate results
-        l_func = getattr(sys.modules[__name__], logic)
-        final = l_func(results)
+        return [
+            rules.rules[x].data if x >= 0 else {}
+            for x in match_all(rules, transactions)
+        ]
 
-        return final
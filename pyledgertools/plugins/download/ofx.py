@@ -12,6 +12,9 @@ def make_date_kwargs(config):
 class OFXDownload(IPlugin):
     """OFX plugin class."""
 
+    # No per-call state is kept on the instance.
+    thread_safe = True
+
     def download(self, config):
         """Setup account info and credentials."""
 
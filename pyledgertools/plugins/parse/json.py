@@ -6,7 +6,7 @@ from yapsy.IPlugin import IPlugin
 import json
 import re
 
-from pyledgertools.journal import Transaction, Posting
+from pyledgertools.batch import TransactionBatch
 
 now = datetime.now
 strftime = datetime.strftime
@@ -15,11 +15,14 @@ strftime = datetime.strftime
 class ParseJSON(IPlugin):
     """OFX file parsing."""
 
+    # No per-call state is kept on the instance.
+    thread_safe = True
+
     def build_journal(self, json_file, config):
         with open(json_file, 'r') as jfile:
             json_data = json.load(jfile)
 
-        transactions = []
+        transactions = TransactionBatch()
 
         # There may be multiple bank statements in one file
         for transaction in json_data:
@@ -42,20 +45,14 @@ class ParseJSON(IPlugin):
             meta.append(('UUID', uuid))
             meta.append(('Imported', strftime(now(), '%Y-%m-%d')))
 
-            a_tran = Posting(
-                account=config['from'],
-                amount=amount,
-                currency=currency
-            )
-
-            t_tran = Transaction(
+            transactions.append(
                 date=trn_date,
                 payee=payee,
-                postings=[a_tran],
+                posting_account=config['from'],
+                amount=amount,
+                currency=currency,
                 metadata=meta,
                 uuid=uuid
             )
 
-            transactions.append(t_tran)
-
         return None, transactions
@@ -5,6 +5,7 @@ import hashlib
 from ofxtools import OFXTree
 from yapsy.IPlugin import IPlugin
 
+from pyledgertools.batch import TransactionBatch
 from pyledgertools.journal import Transaction, Posting
 
 now = datetime.now
@@ -18,6 +19,9 @@ CURRENCY_LOOKUP = {
 class ParseOFX(IPlugin):
     """OFX file parsing."""
 
+    # No per-call state is kept on the instance.
+    thread_safe = True
+
     def __init__(self):
         self.is_activated = False
 
@@ -29,7 +33,7 @@ class ParseOFX(IPlugin):
         stop_words = config.get('stop_words', [])
 
         balance_assertions = []
-        transactions = []
+        transactions = TransactionBatch()
 
         # There may be multiple bank statements in one file
         for statement in ofx_obj.statements:
@@ -85,24 +89,18 @@ class ParseOFX(IPlugin):
                 meta.append(('UUID', uuid))
                 meta.append(('Imported', strftime(now(), '%Y-%m-%d')))
 
-                a_tran = Posting(
-                    account=config['from'],
-                    amount=amount,
-                    currency=currency
-                )
+                # Need to process transactions further here
+                # Either rules or Bayesian...
 
-                t_tran = Transaction(
+                transactions.append(
                     date=trn_date,
                     payee=payee,
-                    postings=[a_tran],
+                    posting_account=config['from'],
+                    amount=amount,
+                    currency=currency,
                     metadata=meta,
-                    account=account,
-                    uuid=uuid
+                    uuid=uuid,
+                    account=account
                 )
 
-                # Need to process transactions further here
-                # Either rules or Bayesian...
-
-                transactions.append(t_tran)
-
         return balance_assertions, transactions
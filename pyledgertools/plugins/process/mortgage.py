@@ -1,6 +1,7 @@
 """Get mortgage allocation from amortization schedule."""
 
 from datetime import datetime
+from decimal import Decimal
 from yapsy.IPlugin import IPlugin
 import csv
 import logging
@@ -44,10 +45,12 @@ class AmortSchedule(IPlugin):
             )
             self.logger.debug('Selected amortization row. ' + str(row))
 
-        running_sum = 0.00
+        running_sum = Decimal('0.00')
         for column in rule_args.keys():
             try:
-                row_value = float(row[column].replace('$', ''))
+                row_value = Decimal(
+                    row[column].replace('$', '').replace(',', '')
+                )
                 transaction.add(rule_args[column], row_value, currency)
                 running_sum += row_value
                 self.logger.info(
@@ -0,0 +1,551 @@
+"""Native ledger journal reader.
+
+Parses ledger-cli journal files into :obj:`Transaction` objects without
+running ``ledger``. Files are read line by line and transactions are yielded
+as soon as they are complete so memory use does not grow with the size of the
+journal. ``include`` directives are followed.
+
+Only the subset of the journal format needed by the import tools is
+understood. Automated and periodic transactions, price directives and other
+declarations are skipped.
+"""
+
+from decimal import Decimal
+from glob import glob
+import hashlib
+import io
+from itertools import islice
+import os
+from os.path import expanduser
+import re
+
+from pyledgertools.journal import Transaction, Posting
+
+# Transaction header:  DATE[=AUX_DATE] [*|!] [(CODE)] PAYEE [; NOTE]
+HEADER_REGEX = re.compile(
+    r'^(?P<date>\d{4}[/-]\d{1,2}[/-]\d{1,2})(?:=\S+)?'
+    r'\s*(?P<flag>[*!])?\s*(?:\((?P<code>[^)]*)\))?\s*(?P<payee>.*)$'
+)
+META_REGEX = re.compile(r'^;\s*(?P<key>[^\s:]+):\s+(?P<value>.*)$')
+TAGS_REGEX = re.compile(r'^;\s*:(?P<tags>(?:[^\s:]+:)+)\s*$')
+AMOUNT_REGEX = re.compile(
+    r'^(?P<sign>-)?\s*(?P<pre>"[^"]+"|[^\s\d.,+\-"]+)?\s*'
+    r'(?P<number>[-+]?(?:\d[\d,]*)?\.?\d+)\s*'
+    r'(?P<post>"[^"]+"|[^\s\d.,+\-@;"]+)?$'
+)
+INCLUDE_REGEX = re.compile(r'^!?include\s+(?P<path>.+?)\s*$')
+LEDGERRC_REGEX = re.compile(r'^\s*(?:--file|-f)[\s=]+(?P<path>.+?)\s*$')
+
+COMMENT_CHARS = ';#%|*'
+SKIP_BLOCK_REGEX = re.compile(r'^(comment|test)\b')
+
+# Bytes at the start and end of the part of a file already read that are
+# checked to detect changes other than appends, see :func:`read_new_entries`.
+MARK_CHECK = 4096
+# Bytes read at a time when reading new entries.
+READ_CHUNK = 1 << 20
+
+
+class JournalChanged(Exception):
+    """A journal file was changed other than by appending to it."""
+
+
+def default_journal():
+    """Find the journal ledger would use when no file is given.
+
+    Checks the ``LEDGER_FILE`` environment variable and then the ``--file``
+    option in ``~/.ledgerrc``.
+
+    Returns:
+        str: Path to the journal or `None` if it can not be determined.
+    """
+    journal = os.environ.get('LEDGER_FILE')
+    if journal:
+        return expanduser(journal)
+
+    ledgerrc = expanduser(os.path.join('~', '.ledgerrc'))
+    if os.path.isfile(ledgerrc):
+        with open(ledgerrc, 'r') as f:
+            for line in f:
+                match = LEDGERRC_REGEX.match(line)
+                if match:
+                    return expanduser(match.group('path'))
+
+    return None
+
+
+def normalize_date(date):
+    """Convert a ledger date to ``YYYY-MM-DD`` format.
+
+    >>> normalize_date('2017/3/5')
+    '2017-03-05'
+    """
+    y, m, d = re.split('[/-]', date)
+    return '{}-{:0>2}-{:0>2}'.format(y, m, d)
+
+
+def parse_amount(text):
+    """Parse a ledger amount string.
+
+    Parameters:
+        text (str): Amount such as ``$ -12.00``, ``-$12`` or ``1,200 USD``.
+
+    Returns:
+        tuple: ``(amount, currency)`` with a :obj:`Decimal` amount or
+        ``(None, None)`` if the amount can not be parsed (empty or a value
+        expression).
+    """
+    text = text.strip()
+    match = AMOUNT_REGEX.match(text)
+    if not match:
+        return None, None
+
+    amount = Decimal(match.group('number').replace(',', ''))
+    if match.group('sign'):
+        amount = -amount
+
+    currency = match.group('pre') or match.group('post') or ''
+
+    return amount, currency
+
+
+def _split_comment(text):
+    """Split a line at the first ``;`` into value and comment parts."""
+    idx = text.find(';')
+    if idx < 0:
+        return text, None
+    return text[:idx], text[idx:]
+
+
+def _add_comment(comment, tags, metadata):
+    """Add tags/metadata found in a comment string to the given lists."""
+    match = TAGS_REGEX.match(comment)
+    if match:
+        tags.extend(x for x in match.group('tags').split(':') if x)
+        return
+
+    match = META_REGEX.match(comment)
+    if match:
+        metadata.append([match.group('key'), match.group('value').strip()])
+
+
+def parse_posting(line):
+    """Parse a single (indented) posting line.
+
+    Parameters:
+        line (str): Posting line from the journal.
+
+    Returns:
+        Posting: The posting. `amount` is `None` when it is elided.
+    """
+    text, comment = _split_comment(line.strip())
+
+    # Cleared/pending state of the posting.
+    if text[:2] in ('* ', '! '):
+        text = text[2:]
+
+    parts = re.split(r'\t|  +', text.strip(), maxsplit=1)
+    account = parts[0].strip()
+    amount_text = parts[1] if len(parts) > 1 else ''
+
+    # Drop cost / price information, only the commodity amount is kept.
+    amount_text = re.split(r'\s*@', amount_text)[0]
+
+    assertion = False
+    if '=' in amount_text:
+        amount_text, assert_text = amount_text.split('=', 1)
+        if amount_text.strip() == '':
+            amount_text = assert_text
+            assertion = True
+
+    amount, currency = parse_amount(amount_text)
+
+    tags = []
+    metadata = []
+    if comment is not None:
+        _add_comment(comment, tags, metadata)
+
+    return Posting(
+        account=account,
+        amount=amount,
+        currency=currency if currency is not None else '$',
+        assertion=assertion,
+        tags=tags,
+        metadata=metadata,
+    )
+
+
+def parse_transaction(lines):
+    """Build a transaction from the lines of a single journal entry.
+
+    Parameters:
+        lines (list): Header line followed by the indented entry lines.
+
+    Returns:
+        Transaction: Parsed transaction or `None` if the header is not a
+        transaction header.
+    """
+    header, note = _split_comment(lines[0].rstrip())
+    match = HEADER_REGEX.match(header.rstrip())
+    if not match:
+        return None
+
+    flag = match.group('flag')
+    tags = []
+    metadata = []
+    postings = []
+
+    if note is not None:
+        _add_comment(note, tags, metadata)
+
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped.startswith(';'):
+            # Comments apply to the most recent posting if there is one.
+            if postings:
+                posting = postings[-1]
+                _add_comment(stripped, posting.tags, posting.metadata)
+            else:
+                _add_comment(stripped, tags, metadata)
+        elif stripped:
+            postings.append(parse_posting(line))
+
+    uuid = ''
+    for meta in metadata + [m for p in postings for m in p.metadata]:
+        if meta[0] == 'UUID':
+            uuid = meta[1]
+            break
+
+    return Transaction(
+        date=normalize_date(match.group('date')),
+        flag=' {} '.format(flag) if flag else ' ',
+        payee=match.group('payee').strip(),
+        tags=tags,
+        metadata=metadata,
+        postings=postings,
+        uuid=uuid,
+    )
+
+
+def iter_entries(lines):
+    """Group journal lines into entries.
+
+    An entry starts with an unindented line and includes every indented line
+    that follows it. Blank lines, comment lines and ``comment`` blocks are
+    dropped.
+
+    Parameters:
+        lines (iterable): Lines of a journal file.
+
+    Yields:
+        list: Lines of a single entry.
+    """
+    entry = []
+    skip_block = None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        if skip_block is not None:
+            if line.strip() == 'end ' + skip_block:
+                skip_block = None
+            continue
+
+        if line.strip() == '':
+            if entry:
+                yield entry
+                entry = []
+            continue
+
+        if line[0] in ' \t':
+            if entry:
+                entry.append(line)
+            continue
+
+        if entry:
+            yield entry
+            entry = []
+
+        if line[0] in COMMENT_CHARS:
+            continue
+
+        match = SKIP_BLOCK_REGEX.match(line)
+        if match:
+            skip_block = match.group(1)
+            continue
+
+        entry = [line]
+
+    if entry:
+        yield entry
+
+
+def _read_entries(path, seen):
+    """Yield the entries of a single file following includes."""
+    path = os.path.realpath(path)
+    if path in seen:
+        return
+    seen = seen | {path}
+
+    with io.open(path, 'r', encoding='utf-8') as f:
+        for entry in iter_entries(f):
+            match = INCLUDE_REGEX.match(entry[0])
+            if match:
+                for included in _include_paths(path, match.group('path')):
+                    for item in _read_entries(included, seen):
+                        yield item
+            else:
+                yield entry
+
+
+def read_entries(paths=None):
+    """Read the raw entries of one or more journal files.
+
+    Parameters:
+        paths (str or list): Journal file(s) to read. Defaults to the journal
+            found by :func:`default_journal`.
+
+    Yields:
+        list: Lines of each entry, see :func:`iter_entries`. ``include``
+        directives are replaced by the entries of the included files.
+    """
+    for path in _journal_paths(paths):
+        for entry in _read_entries(path, frozenset()):
+            yield entry
+
+
+def mark_digest(f, offset):
+    """Digest of the first and last `MARK_CHECK` bytes before `offset`.
+
+    Used to check that the part of a file before a saved offset is still
+    the same without reading all of it.
+
+    Parameters:
+        f (file): File opened in binary mode.
+        offset (int): End of the checked part of the file.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha1()
+    f.seek(0)
+    digest.update(f.read(min(offset, MARK_CHECK)))
+    start = max(offset - MARK_CHECK, 0)
+    f.seek(start)
+    digest.update(f.read(offset - start))
+    return digest.hexdigest()
+
+
+def _read_new_entries(path, marks, seen):
+    """Yield the entries of a file after its mark, following includes."""
+    path = os.path.realpath(path)
+    if path in seen:
+        return
+    seen = seen | {path}
+
+    mark = marks.get(path, {'offset': 0, 'digest': None, 'includes': []})
+    includes = list(mark['includes'])
+
+    # Files matched by includes read before may have grown or appeared.
+    for pattern in mark['includes']:
+        for included in _include_paths(path, pattern):
+            for item in _read_new_entries(included, marks, seen):
+                yield item
+
+    with open(path, 'rb') as f:
+        offset = mark['offset']
+        if offset:
+            stat = os.fstat(f.fileno())
+            if (stat.st_size < offset or
+                    (stat.st_size == offset and
+                     stat.st_mtime_ns != mark.get('mtime')) or
+                    mark_digest(f, offset) != mark['digest']):
+                raise JournalChanged(path)
+        f.seek(offset)
+
+        end = [offset]
+
+        def _lines():
+            # Decode a chunk of whole lines at a time, which is a lot
+            # faster than decoding every line on its own.
+            rest = b''
+            while True:
+                data = f.read(READ_CHUNK)
+                if not data:
+                    break
+                data = rest + data
+                cut = data.rfind(b'\n') + 1
+                rest = data[cut:]
+                end[0] += cut
+                lines = data[:cut].decode('utf-8').split('\n')
+                for line in islice(lines, len(lines) - 1):
+                    yield line
+            if rest:
+                end[0] += len(rest)
+                yield rest.decode('utf-8')
+
+        for entry in iter_entries(_lines()):
+            match = INCLUDE_REGEX.match(entry[0])
+            if match:
+                pattern = match.group('path')
+                if pattern not in includes:
+                    includes.append(pattern)
+                for included in _include_paths(path, pattern):
+                    for item in _read_new_entries(included, marks, seen):
+                        yield item
+            else:
+                yield entry
+
+        digest = mark_digest(f, end[0])
+        mtime = os.fstat(f.fileno()).st_mtime_ns
+
+    marks[path] = {
+        'offset': end[0], 'digest': digest, 'mtime': mtime,
+        'includes': includes
+    }
+
+
+def read_new_entries(paths=None, marks=None):
+    """Read the entries added to journal files since a previous read.
+
+    A high-water mark, the end offset of the data read, is kept for every
+    file along with a digest of the start and end of the data before it,
+    the modification time and the ``include`` patterns seen. The next read
+    continues at the mark.
+
+    A file is reported as changed when it shrank, when the digest no longer
+    matches or when it did not grow but its modification time changed. An
+    edit in the middle of a file that keeps its length and is followed by
+    an append before the next read is not noticed, derived data has to be
+    rebuilt from scratch in that case.
+
+    Parameters:
+        paths (str or list): Journal file(s) to read. Defaults to the journal
+            found by :func:`default_journal`.
+        marks (dict): Marks from the previous read, updated in place as the
+            entries are read. Empty to read everything.
+
+    Yields:
+        list: Lines of each new entry, see :func:`read_entries`.
+
+    Raises:
+        JournalChanged: If a file was truncated or modified before its mark.
+    """
+    if marks is None:
+        marks = {}
+
+    for path in _journal_paths(paths):
+        for entry in _read_new_entries(path, marks, frozenset()):
+            yield entry
+
+
+def parse_entries(entries):
+    """Parse the transactions among journal entries.
+
+    Parameters:
+        entries (iterable): Entries from :func:`read_entries`.
+
+    Yields:
+        Transaction: Transactions in entry order.
+    """
+    for entry in entries:
+        if entry[0][0].isdigit():
+            transaction = parse_transaction(entry)
+            if transaction is not None:
+                yield transaction
+
+
+def _journal_paths(paths):
+    if paths is None:
+        paths = default_journal()
+        if paths is None:
+            raise IOError('No journal file given and no default found.')
+
+    if isinstance(paths, str):
+        paths = [paths]
+
+    return [expanduser(x) for x in paths]
+
+
+def journal_key(paths=None):
+    """Real paths of journal files.
+
+    Used to tell which journal derived data, like a model or an index, was
+    built from. Files included by the journal are tracked by the marks
+    of :func:`read_new_entries`.
+
+    Parameters:
+        paths (str or list): Journal file(s), defaults to
+            :func:`default_journal`.
+
+    Returns:
+        list: Real path of every file.
+    """
+    return [os.path.realpath(x) for x in _journal_paths(paths)]
+
+
+def sidecar_path(path, ext):
+    """Location of a file kept next to a journal file, like its index.
+
+    The name is ``.<journal><ext>`` in the directory of the real journal
+    file. Hidden names are not matched by ``include`` patterns such as
+    ``dir/*`` so the reader never tries to parse them.
+
+    Parameters:
+        path (str): Journal file.
+        ext (str): Suffix of the file, ``.index`` for example.
+
+    Returns:
+        str: Absolute path.
+    """
+    dirname, basename = os.path.split(os.path.realpath(path))
+    return os.path.join(dirname, '.' + basename + ext)
+
+
+def _include_paths(path, pattern):
+    pattern = os.path.join(os.path.dirname(path), expanduser(pattern))
+    return sorted(glob(pattern))
+
+
+def filter_transactions(transactions, since=None, exclude_payee=None):
+    """Filter transactions by date and payee.
+
+    Parameters:
+        transactions (iterable): :obj:`Transaction` objects.
+        since (str): Only yield transactions dated on or after this
+            ``YYYY-MM-DD`` date.
+        exclude_payee (str): Case insensitive regex, transactions with a
+            matching payee are skipped.
+
+    Yields:
+        Transaction: Transactions passing the filters.
+    """
+    if exclude_payee is not None:
+        exclude_payee = re.compile(exclude_payee, re.I)
+
+    for transaction in transactions:
+        if since is not None and transaction.date < since:
+            continue
+        if exclude_payee and exclude_payee.search(transaction.payee):
+            continue
+        yield transaction
+
+
+def read_journal(paths=None, since=None, exclude_payee=None):
+    """Read transactions from one or more journal files.
+
+    Parameters:
+        paths (str or list): Journal file(s) to read. Defaults to the journal
+            found by :func:`default_journal`.
+        since (str): Only yield transactions dated on or after this
+            ``YYYY-MM-DD`` date.
+        exclude_payee (str): Case insensitive regex, transactions with a
+            matching payee are skipped.
+
+    Yields:
+        Transaction: Transactions in file order.
+    """
+    transactions = parse_entries(read_entries(paths))
+    for transaction in filter_transactions(
+            transactions, since, exclude_payee):
+        yield transaction
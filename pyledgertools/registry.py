@@ -0,0 +1,223 @@
+"""Plugin discovery and loading.
+
+Replacement for yapsy's ``PluginManager`` that only imports a plugin when it
+is first requested. Plugins are still described by ``.yapsy-plugin`` files
+and implemented as ``IPlugin`` subclasses so existing plugins keep working.
+
+The list of plugin descriptions found in the plugin directories is cached in
+a manifest file and only rebuilt when one of the directories or description
+files changes.
+"""
+
+from configparser import ConfigParser
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+
+INFO_EXT = '.yapsy-plugin'
+MANIFEST_VERSION = 1
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def read_info(info_file):
+    """Read a plugin description file.
+
+    Parameters:
+        info_file (str): Path to a ``.yapsy-plugin`` file.
+
+    Returns:
+        dict: ``name`` and ``path`` (module path without extension) of the
+        plugin or `None` if the file is not a valid description.
+    """
+    parser = ConfigParser()
+    try:
+        parser.read(info_file)
+        name = parser.get('Core', 'Name').strip()
+        module = parser.get('Core', 'Module').strip()
+    except Exception:
+        return None
+
+    return {
+        'name': name,
+        'path': os.path.join(os.path.dirname(info_file), module),
+    }
+
+
+class PluginRegistry(object):
+    """Lazily loaded collection of plugins.
+
+    Attributes:
+        places (list): Directories searched for plugins.
+        manifest (str): File used to cache the discovered plugin list.
+    """
+
+    def __init__(self, places, manifest=None):
+        """Initialize the registry.
+
+        Parameters:
+            places (list): Directories to search for plugins.
+            manifest (str): Cache file for the plugin list. Plugin
+                directories are scanned on every start when not given.
+        """
+        self.places = [os.path.abspath(x) for x in places]
+        self.manifest = manifest
+        self._plugins = None
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def collect(self):
+        """Find the available plugins, using the manifest when it is valid."""
+        data = self._read_manifest()
+        if data is None:
+            data = self._scan()
+            self._write_manifest(data)
+
+        self._plugins = data['plugins']
+
+    def names(self):
+        """Return the names of all available plugins."""
+        if self._plugins is None:
+            self.collect()
+        return list(self._plugins)
+
+    def get(self, name):
+        """Get a plugin object by name, importing the plugin if needed.
+
+        Parameters:
+            name (str): Plugin name from the ``.yapsy-plugin`` file.
+
+        Returns:
+            IPlugin: Plugin object or `None` if there is no such plugin.
+        """
+        plugin = self._objects.get(name)
+        if plugin is not None:
+            return plugin
+
+        if self._plugins is None:
+            self.collect()
+
+        info = self._plugins.get(name)
+        if info is None:
+            return None
+
+        with self._lock:
+            if name not in self._objects:
+                self._objects[name] = self._load(info)
+
+        return self._objects[name]
+
+    def _scan(self):
+        """Walk the plugin directories and read every description file."""
+        dirs = {}
+        files = {}
+        plugins = {}
+
+        for place in self.places:
+            for root, dirnames, filenames in os.walk(place):
+                dirnames.sort()
+                dirs[root] = _mtime(root)
+
+                for filename in sorted(filenames):
+                    if not filename.endswith(INFO_EXT):
+                        continue
+                    info_file = os.path.join(root, filename)
+                    files[info_file] = _mtime(info_file)
+
+                    info = read_info(info_file)
+                    # First plugin found with a name wins.
+                    if info is not None and info['name'] not in plugins:
+                        plugins[info['name']] = info
+
+        return {
+            'version': MANIFEST_VERSION,
+            'places': self.places,
+            'dirs': dirs,
+            'files': files,
+            'plugins': plugins,
+        }
+
+    def _read_manifest(self):
+        """Return the cached manifest or `None` if it is missing or stale."""
+        if self.manifest is None or not os.path.isfile(self.manifest):
+            return None
+
+        try:
+            with open(self.manifest, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            return None
+
+        if (data.get('version') != MANIFEST_VERSION or
+                data.get('places') != self.places):
+            return None
+
+        for paths in (data['dirs'], data['files']):
+            for path, mtime in paths.items():
+                if _mtime(path) != mtime:
+                    return None
+
+        # Plugin directories that did not exist at scan time.
+        for place in self.places:
+            if place not in data['dirs'] and os.path.isdir(place):
+                return None
+
+        return data
+
+    def _write_manifest(self, data):
+        if self.manifest is None:
+            return
+
+        dirname = os.path.dirname(self.manifest)
+        try:
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            tmp = self.manifest + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.manifest)
+        except OSError:
+            # The manifest is only a cache.
+            pass
+
+    def _load(self, info):
+        """Import a plugin module and instantiate its plugin class."""
+        from yapsy.IPlugin import IPlugin
+
+        path = info['path']
+        if os.path.isdir(path):
+            path = os.path.join(path, '__init__.py')
+        else:
+            path += '.py'
+
+        # Plugin modules have names like `json` and `csv`, import them under
+        # a unique name so they do not shadow the standard library.
+        digest = hashlib.md5(path.encode()).hexdigest()[:8]
+        module_name = 'pyledgertools_plugin_{}_{}'.format(
+            digest, os.path.basename(info['path'])
+        )
+
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+
+        for value in vars(module).values():
+            if (isinstance(value, type) and issubclass(value, IPlugin) and
+                    value is not IPlugin and
+                    value.__module__ == module_name):
+                return value()
+
+        return None
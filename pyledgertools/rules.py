@@ -0,0 +1,867 @@
+"""Loading and compilation of transaction matching rules.
+
+Rules are written in YAML in a single file or a directory of ``.rules``
+files. Parsed files are cached in memory and, when a cache directory is
+given, on disk so only files that changed since the last run are parsed
+again.
+
+The ``conditions`` of each rule are compiled into predicate objects once
+when the rules are loaded. Rule values are converted to numbers or lower case
+strings up front and ``AND``/``OR`` groups stop evaluating as soon as the
+result is known.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+import hashlib
+import operator
+import os
+import pickle
+
+import yaml
+
+from pyledgertools.batch import TransactionBatch, column
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RULE_EXT = '.rules'
+
+_memo = {}
+
+
+def rule_files(rule_loc):
+    """List the rule files at a location.
+
+    Parameters:
+        rule_loc (str): Rule file or directory containing ``.rules`` files.
+
+    Returns:
+        list: Paths of the rule files in the order they are applied.
+    """
+    if os.path.isfile(rule_loc):
+        return [rule_loc]
+
+    files = []
+    if os.path.isdir(rule_loc):
+        for root, dirs, filenames in os.walk(rule_loc):
+            for filename in filenames:
+                if filename.endswith(RULE_EXT):
+                    files.append(os.path.join(root, filename))
+
+    return files
+
+
+def _cache_file(cache_dir, path):
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'rules', digest + '.pickle')
+
+
+def load_rule_file(path, cache_dir=None):
+    """Parse a single rule file, using cached results when possible.
+
+    Results are keyed on the path, modification time and size of the file.
+
+    Parameters:
+        path (str): Rule file.
+        cache_dir (str): Directory for parsed rule files. Only the in memory
+            cache is used when not given.
+
+    Returns:
+        dict: Rules defined in the file.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _memo.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    cache_file = None
+    rules = None
+    if cache_dir is not None:
+        cache_file = _cache_file(cache_dir, path)
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached[0] == key:
+                rules = cached[1]
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    if rules is None:
+        with open(path, 'r') as f:
+            rules = yaml.load(f, Loader=Loader) or {}
+
+        if cache_file is not None:
+            _write_cache(cache_file, (key, rules))
+
+    _memo[path] = (key, rules)
+
+    return rules
+
+
+def _write_cache(cache_file, data):
+    try:
+        dirname = os.path.dirname(cache_file)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp = cache_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+    except OSError:
+        # Failing to cache is not an error.
+        pass
+
+
+def load_rules(rule_loc, cache_dir=None):
+    """Build a single rule dictionary from a file or directory.
+
+    Parameters:
+        rule_loc (str): Rule file or directory containing ``.rules`` files.
+        cache_dir (str): Directory for parsed rule files.
+
+    Returns:
+        dict: Rule name to rule mapping or `None` if `rule_loc` does not
+        exist.
+    """
+    if not os.path.exists(rule_loc):
+        return None
+
+    rules = {}
+    for path in rule_files(rule_loc):
+        rules.update(load_rule_file(path, cache_dir))
+
+    return rules
+
+
+# Comparisons for GT/GE/LT/LE, called as ``cmp(rule_value, tran_value)``.
+COMPARISONS = {
+    'GT': operator.lt,
+    'GE': operator.le,
+    'LT': operator.gt,
+    'LE': operator.ge,
+}
+
+
+class Condition(object):
+    """A single ``<field> <TEST> <value>`` rule condition.
+
+    ``amount`` refers to the amount of the first posting, which holds the
+    bank account side of an imported transaction. Any other field is read
+    from the transaction attribute of that name.
+
+    Attributes:
+        field (str): Lower case transaction field.
+        test (str): Comparison name, ``CONTAINS``, ``GT`` etc.
+        value (str): Rule value as written.
+        text (str): Lower case rule value.
+        number (float): Numeric rule value or `None`.
+        match (function): Predicate taking a transaction.
+    """
+
+    __slots__ = ('field', 'test', 'value', 'text', 'number', 'match')
+
+    def __init__(self, condition):
+        """Compile a condition string.
+
+        Parameters:
+            condition (str): Condition from the rules file.
+        """
+        parts = condition.split(' ')
+        if len(parts) < 2:
+            raise ValueError('Invalid rule condition: {!r}'.format(condition))
+
+        self.field = parts[0].lower()
+        self.test = parts[1]
+        self.value = ' '.join(parts[2:])
+        self.text = self.value.lower()
+        try:
+            self.number = float(self.value)
+        except ValueError:
+            self.number = None
+
+        self.match = self._compile()
+
+    def get(self, transaction):
+        """Get the transaction value this condition tests."""
+        if self.field == 'amount':
+            return transaction.postings[0].amount
+        return getattr(transaction, self.field)
+
+    def _compile(self):
+        test = self.test
+        text = self.text
+        number = self.number
+
+        if self.field == 'amount':
+            def get(transaction):
+                return transaction.postings[0].amount
+        else:
+            get = operator.attrgetter(self.field)
+
+        if test == 'CONTAINS':
+            def match(transaction):
+                return text in get(transaction).lower()
+
+        elif test == 'STARTS_WITH':
+            def match(transaction):
+                return get(transaction).lower().strip().startswith(text)
+
+        elif test == 'ENDS_WITH':
+            def match(transaction):
+                return get(transaction).lower().strip().endswith(text)
+
+        elif test == 'EQUALS' and number is None:
+            def match(transaction):
+                return get(transaction).lower().strip() == text
+
+        elif test == 'EQUALS':
+            def match(transaction):
+                value = get(transaction)
+                try:
+                    return float(value) == number
+                except (TypeError, ValueError):
+                    return value.lower().strip() == text
+
+        elif test in COMPARISONS and number is None:
+            cmp = COMPARISONS[test]
+
+            def match(transaction):
+                return cmp(text, get(transaction).lower())
+
+        elif test in COMPARISONS:
+            cmp = COMPARISONS[test]
+
+            def match(transaction):
+                value = get(transaction)
+                try:
+                    return cmp(number, float(value))
+                except (TypeError, ValueError):
+                    return cmp(text, value.lower())
+
+        elif test == 'MOD' and number is not None:
+            def match(transaction):
+                return float(get(transaction)) % number == 0
+
+        else:
+            raise ValueError('Invalid rule test {!r} with value {!r}'.format(
+                test, self.value
+            ))
+
+        return match
+
+
+class Group(object):
+    """Conditions combined with a boolean operator.
+
+    Attributes:
+        logic (str): ``AND``, ``OR``, ``NAND``, ``NOR`` or ``XOR``.
+        children (list): :obj:`Condition` and :obj:`Group` objects.
+        match (function): Predicate taking a transaction.
+    """
+
+    __slots__ = ('logic', 'children', 'match')
+
+    def __init__(self, logic, conditions):
+        """Compile a list of conditions.
+
+        Parameters:
+            logic (str): Boolean operator name.
+            conditions (list): Condition strings or single key dictionaries
+                mapping an operator to a nested list of conditions.
+        """
+        self.logic = logic
+        self.children = [compile_condition(x) for x in conditions]
+        self.match = self._compile()
+
+    def _compile(self):
+        tests = [x.match for x in self.children]
+        logic = self.logic
+
+        if logic in ('AND', 'OR') and len(tests) == 1:
+            return tests[0]
+
+        if logic in ('AND', 'NAND'):
+            expect = logic == 'AND'
+
+            def match(transaction):
+                for test in tests:
+                    if not test(transaction):
+                        return not expect
+                return expect
+
+        elif logic in ('OR', 'NOR'):
+            expect = logic == 'OR'
+
+            def match(transaction):
+                for test in tests:
+                    if test(transaction):
+                        return expect
+                return not expect
+
+        elif logic == 'XOR':
+            # True for an odd number of true results.
+            def match(transaction):
+                count = 0
+                for test in tests:
+                    if test(transaction):
+                        count += 1
+                return count % 2 == 1
+
+        else:
+            raise ValueError('Invalid rule logic {!r}'.format(logic))
+
+        return match
+
+
+def compile_condition(condition):
+    """Compile a condition string or nested condition group."""
+    if isinstance(condition, dict):
+        logic = list(condition.keys())[0]
+        return Group(logic, condition[logic])
+    if isinstance(condition, str):
+        return Condition(condition)
+
+    raise ValueError('Invalid rule condition: {!r}'.format(condition))
+
+
+class Rule(object):
+    """Compiled rule.
+
+    Attributes:
+        name (str): Rule name.
+        data (dict): Rule definition from the rules file.
+        conditions (Group): Compiled top level conditions, combined with
+            ``AND``.
+        match (function): Predicate taking a transaction.
+    """
+
+    __slots__ = ('name', 'data', 'conditions', 'match')
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.conditions = Group('AND', data['conditions'])
+        self.match = self.conditions.match
+
+
+class Automaton(object):
+    """Aho-Corasick automaton for finding many substrings in one pass.
+
+    Each pattern is associated with a list of values, :meth:`search` returns
+    the values of every pattern found in a text.
+    """
+
+    def __init__(self, patterns):
+        """Build the automaton.
+
+        Parameters:
+            patterns (dict): Non empty pattern string to list of values.
+        """
+        goto = [{}]
+        output = [[]]
+
+        for pattern, values in patterns.items():
+            node = 0
+            for char in pattern:
+                nxt = goto[node].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][char] = nxt
+                    goto.append({})
+                    output.append([])
+                node = nxt
+            output[node].extend(values)
+
+        # Breadth first pass to set the failure links and merge the output of
+        # each node with the output of its failure node.
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in goto[node].items():
+                queue.append(nxt)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[nxt] = goto[state].get(char, 0)
+                if fail[nxt] == nxt:
+                    fail[nxt] = 0
+                output[nxt] = output[nxt] + output[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def search(self, text):
+        """Return the values of all patterns occurring in `text`."""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        found = []
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.extend(output[node])
+
+        return found
+
+
+class Trie(object):
+    """Prefix tree returning the values of every key that prefixes a text."""
+
+    def __init__(self, keys):
+        """Build the tree.
+
+        Parameters:
+            keys (dict): Key string to list of values.
+        """
+        self._root = {}
+        for key, values in keys.items():
+            node = self._root
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).extend(values)
+
+    def search(self, text):
+        """Return the values of all keys `text` starts with."""
+        found = []
+        node = self._root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.extend(node[None])
+
+        return found
+
+
+# Index kinds in order of preference when choosing which condition of an
+# AND group to index a rule by. Earlier kinds give fewer candidates.
+INDEX_KINDS = ('equals', 'prefix', 'suffix', 'contains', 'number', 'range')
+
+
+def _index_keys(node):
+    """Find index keys for a compiled condition.
+
+    Returns a list of ``(kind, field, test, value)`` keys where at least one
+    key is satisfied whenever the condition is true, or `None` if the
+    condition can not be indexed.
+    """
+    if isinstance(node, Condition):
+        field = node.field
+        test = node.test
+
+        if field == 'amount':
+            if node.number is None:
+                return None
+            if test == 'EQUALS':
+                return [('number', field, test, node.number)]
+            if test in COMPARISONS:
+                return [('range', field, test, node.number)]
+            return None
+
+        if node.text == '':
+            return None
+        if test == 'EQUALS' and node.number is None:
+            return [('equals', field, test, node.text)]
+        if test == 'STARTS_WITH':
+            return [('prefix', field, test, node.text)]
+        if test == 'ENDS_WITH':
+            return [('suffix', field, test, node.text[::-1])]
+        if test == 'CONTAINS':
+            return [('contains', field, test, node.text)]
+        return None
+
+    if node.logic == 'AND':
+        options = [_index_keys(x) for x in node.children]
+        options = [x for x in options if x is not None]
+        if not options:
+            return None
+        return min(options, key=_keys_cost)
+
+    if node.logic == 'OR':
+        keys = []
+        for child in node.children:
+            child_keys = _index_keys(child)
+            if child_keys is None:
+                return None
+            keys.extend(child_keys)
+        return keys or None
+
+    return None
+
+
+def _keys_cost(keys):
+    """Rough cost of a list of index keys, lower is more selective."""
+    worst = max(INDEX_KINDS.index(x[0]) for x in keys)
+    longest = max(-len(x[3]) if isinstance(x[3], str) else 0 for x in keys)
+    return (worst, len(keys), longest)
+
+
+class RuleIndex(object):
+    """Index narrowing down which rules can match a transaction.
+
+    Rules are indexed on one condition that must hold for the rule to match:
+    hashes for ``EQUALS``, prefix trees for ``STARTS_WITH`` and
+    ``ENDS_WITH``, an Aho-Corasick automaton for ``CONTAINS`` and sorted
+    thresholds for amount comparisons. Rules that can not be indexed are
+    always candidates.
+    """
+
+    def __init__(self, rules):
+        """Build the index.
+
+        Parameters:
+            rules (list): :obj:`Rule` objects.
+        """
+        self.always = []
+
+        keys = {}
+        for idx, rule in enumerate(rules):
+            rule_keys = _index_keys(rule.conditions)
+            if rule_keys is None:
+                self.always.append(idx)
+                continue
+            for kind, field, test, value in rule_keys:
+                group = keys.setdefault((kind, field), {})
+                group.setdefault((test, value), []).append(idx)
+
+        self._lookups = []
+        for (kind, field), group in sorted(keys.items()):
+            if field == 'amount':
+                get = _get_amount
+            else:
+                get = operator.attrgetter(field)
+            self._lookups.append(_make_lookup(kind, get, group))
+
+    def candidates(self, transaction):
+        """Indices of the rules that may match a transaction, sorted."""
+        found = set(self.always)
+        for lookup in self._lookups:
+            found.update(lookup(transaction))
+        return sorted(found)
+
+
+def _get_amount(transaction):
+    return transaction.postings[0].amount
+
+
+def _make_lookup(kind, get, group):
+    """Build the candidate lookup function for one kind of key on a field."""
+    values = {}
+    for (test, value), ids in group.items():
+        values.setdefault(value, []).extend(ids)
+
+    if kind == 'equals':
+        def lookup(transaction):
+            return values.get(get(transaction).lower().strip(), ())
+
+    elif kind == 'prefix':
+        trie = Trie(values)
+
+        def lookup(transaction):
+            return trie.search(get(transaction).lower().strip())
+
+    elif kind == 'suffix':
+        trie = Trie(values)
+
+        def lookup(transaction):
+            return trie.search(get(transaction).lower().strip()[::-1])
+
+    elif kind == 'contains':
+        automaton = Automaton(values)
+
+        def lookup(transaction):
+            return automaton.search(get(transaction).lower())
+
+    elif kind == 'number':
+        def lookup(transaction):
+            try:
+                return values.get(float(get(transaction)), ())
+            except (TypeError, ValueError):
+                return ()
+
+    else:
+        lookup = _range_lookup(get, group)
+
+    return lookup
+
+
+def _range_lookup(get, group):
+    """Candidate lookup for amount ``GT``/``GE``/``LT``/``LE`` conditions."""
+    bounds = {}
+    for (test, value), ids in group.items():
+        for idx in ids:
+            bounds.setdefault(test, []).append((value, idx))
+
+    tables = []
+    for test, items in bounds.items():
+        items.sort()
+        tables.append((test, [x[0] for x in items], [x[1] for x in items]))
+
+    def lookup(transaction):
+        try:
+            amount = float(get(transaction))
+        except (TypeError, ValueError):
+            return ()
+
+        found = []
+        for test, numbers, ids in tables:
+            if test == 'GT':
+                found.extend(ids[:bisect_left(numbers, amount)])
+            elif test == 'GE':
+                found.extend(ids[:bisect_right(numbers, amount)])
+            elif test == 'LT':
+                found.extend(ids[bisect_right(numbers, amount):])
+            else:
+                found.extend(ids[bisect_left(numbers, amount):])
+        return found
+
+    return lookup
+
+
+class RuleSet(object):
+    """Ordered collection of compiled rules.
+
+    Rules are checked in order and the first match wins. A
+    :obj:`RuleIndex` is used to skip rules that can not match.
+    """
+
+    def __init__(self, rules):
+        """Compile rules.
+
+        Parameters:
+            rules (dict): Rule name to rule definition mapping, as returned
+                by :func:`load_rules`.
+        """
+        self.rules = [Rule(name, data) for name, data in rules.items()]
+        self.index = RuleIndex(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def find(self, transaction):
+        """Find the first rule matching a transaction.
+
+        Returns:
+            dict: Definition of the matching rule, empty if there is none.
+        """
+        idx = self.find_index(transaction)
+        if idx < 0:
+            return {}
+        return self.rules[idx].data
+
+    def find_index(self, transaction):
+        """Find the position of the first rule matching a transaction.
+
+        Returns:
+            int: Index into :attr:`rules`, ``-1`` if there is no match.
+        """
+        rules = self.rules
+        for idx in self.index.candidates(transaction):
+            if rules[idx].match(transaction):
+                return idx
+
+        return -1
+
+
+def compile_rules(rules):
+    """Compile a rule dictionary into a :obj:`RuleSet`.
+
+    Returns `None` when `rules` is `None`.
+    """
+    if rules is None:
+        return None
+    return RuleSet(rules)
+
+
+def match_all(rules, transactions):
+    """Find the first matching rule for each transaction in a batch.
+
+    When NumPy is available the transaction fields are loaded into arrays
+    and every condition is evaluated over the whole batch at once, only rows
+    without a match yet are passed on to the next rule. Otherwise each
+    transaction is matched with :meth:`RuleSet.find`.
+
+    Parameters:
+        rules (RuleSet): Compiled rules, a rule dictionary is compiled first.
+        transactions (iterable): :obj:`Transaction` objects or a
+            :obj:`TransactionBatch`.
+
+    Returns:
+        list: Index into ``rules.rules`` of the first matching rule for each
+        transaction, ``-1`` where no rule matches.
+    """
+    if not isinstance(rules, RuleSet):
+        rules = compile_rules(rules)
+
+    # Batches are matched column by column without building transactions.
+    if not isinstance(transactions, TransactionBatch):
+        transactions = list(transactions)
+
+    if np is None:
+        return [rules.find_index(x) for x in transactions]
+
+    result = np.full(len(transactions), -1, dtype=np.intp)
+    remaining = np.arange(len(transactions))
+    columns = _Columns(transactions)
+
+    for idx, rule in enumerate(rules.rules):
+        if len(remaining) == 0:
+            break
+        mask = _evaluate(rule.conditions, columns, remaining)
+        result[remaining[mask]] = idx
+        remaining = remaining[~mask]
+
+    return result.tolist()
+
+
+class _Columns(object):
+    """Lazily built NumPy columns for the fields of a list of transactions."""
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self._cache = {}
+
+    def _values(self, field):
+        return column(self.transactions, field)
+
+    def lower(self, field):
+        """Lower case field values."""
+        key = ('lower', field)
+        if key not in self._cache:
+            values = [x.lower() for x in self._values(field)]
+            self._cache[key] = np.array(values, dtype=str)
+        return self._cache[key]
+
+    def stripped(self, field):
+        """Lower case field values with surrounding white space removed."""
+        key = ('stripped', field)
+        if key not in self._cache:
+            values = [x.lower().strip() for x in self._values(field)]
+            self._cache[key] = np.array(values, dtype=str)
+        return self._cache[key]
+
+    def number(self, field):
+        """Field values as floats and a mask of the values that converted."""
+        key = ('number', field)
+        if key not in self._cache:
+            numbers = np.full(len(self.transactions), np.nan)
+            valid = np.zeros(len(self.transactions), dtype=bool)
+            for idx, value in enumerate(self._values(field)):
+                try:
+                    numbers[idx] = float(value)
+                    valid[idx] = True
+                except (TypeError, ValueError):
+                    pass
+            self._cache[key] = (numbers, valid)
+        return self._cache[key]
+
+
+if np is not None:
+    _strings = getattr(np, 'strings', None) or np.char
+
+
+def _evaluate(node, columns, rows):
+    """Evaluate a compiled condition for a subset of rows.
+
+    Parameters:
+        node (Condition or Group): Compiled condition.
+        columns (_Columns): Transaction columns.
+        rows (ndarray): Row numbers to evaluate.
+
+    Returns:
+        ndarray: Boolean mask aligned with `rows`.
+    """
+    if isinstance(node, Group):
+        return _evaluate_group(node, columns, rows)
+
+    field = node.field
+    test = node.test
+    text = node.text
+    number = node.number
+
+    if test == 'CONTAINS':
+        return _strings.find(columns.lower(field)[rows], text) >= 0
+    if test == 'STARTS_WITH':
+        return _strings.startswith(columns.stripped(field)[rows], text)
+    if test == 'ENDS_WITH':
+        return _strings.endswith(columns.stripped(field)[rows], text)
+    if test == 'EQUALS' and number is None:
+        return columns.stripped(field)[rows] == text
+    if test in COMPARISONS and number is None:
+        return COMPARISONS[test](text, columns.lower(field)[rows])
+
+    numbers, valid = columns.number(field)
+    numbers = numbers[rows]
+    valid = valid[rows]
+
+    with np.errstate(invalid='ignore'):
+        if test == 'EQUALS':
+            mask = numbers == number
+        elif test in COMPARISONS:
+            mask = COMPARISONS[test](number, numbers)
+        else:
+            mask = numbers % number == 0
+
+    # Values that are not numbers fall back to the single transaction
+    # predicate, which compares them as strings.
+    if not valid.all():
+        for idx in np.nonzero(~valid)[0]:
+            mask[idx] = node.match(columns.transactions[rows[idx]])
+
+    return mask
+
+
+def _evaluate_group(group, columns, rows):
+    """Evaluate a condition group, skipping rows that are already decided."""
+    logic = group.logic
+
+    if logic == 'XOR':
+        count = np.zeros(len(rows), dtype=np.intp)
+        for child in group.children:
+            count += _evaluate(child, columns, rows)
+        return count % 2 == 1
+
+    # AND/NAND keep evaluating rows that are still true, OR/NOR the rows
+    # that are still false.
+    conjunction = logic in ('AND', 'NAND')
+    mask = np.full(len(rows), conjunction, dtype=bool)
+
+    for child in group.children:
+        if conjunction:
+            active = np.nonzero(mask)[0]
+        else:
+            active = np.nonzero(~mask)[0]
+        if len(active) == 0:
+            break
+
+        result = _evaluate(child, columns, rows[active])
+        if conjunction:
+            mask[active[~result]] = False
+        else:
+            mask[active[result]] = True
+
+    if logic in ('NAND', 'NOR'):
+        mask = ~mask
+
+    return mask
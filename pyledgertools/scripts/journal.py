@@ -1,4 +1,409 @@
+"""Journal file maintenance scripts.
+
+Journals are handled as blocks of lines separated by blank lines, the first
+line of a transaction block starts with its date. Blocks are sorted by that
+date with a stable external merge sort so files of any size can be sorted
+with bounded memory: sorted runs that do not fit in the buffer are spilled
+to temporary files and merged back with a heap.
+
+Imports append new transactions to the end of a sorted journal. Instead of
+sorting everything again these can be merged into the sorted part: the
+insertion point of each new block is found by binary search over the byte
+offsets of the file and it is rewritten by copying the ranges in between.
+
+The search scripts are thin wrappers around :mod:`journal_index` and
+:mod:`search`.
+"""
+
 from argparse import ArgumentParser
+from bisect import bisect_right
+import heapq
+import io
+import json
+import mmap
+from operator import itemgetter
+import os
+import re
+import struct
+import sys
+import tempfile
+
+from pyledgertools.journal_index import open_indexes, remove_index
+from pyledgertools.reader import mark_digest, sidecar_path
+from pyledgertools.search import SearchFilter, journal_files, search_files
+from pyledgertools.writer import atomic_write, file_lock
+
+# Patterns are only used with match() so they also work at an offset.
+DATE_REGEX = re.compile(br'(\d{4})[/-](\d{1,2})[/-](\d{1,2})')
+# Line break followed by one or more blank lines.
+BLANK_REGEX = re.compile(br'\n(?:[ \t\r\f\v]*\n)+')
+# Blank lines at the start of a block.
+LEADING_REGEX = re.compile(br'(?:[ \t\r\f\v]*\n)+')
+
+CHUNK_SIZE = 1 << 20
+
+BUFFER_SIZE = 64 << 20
+"""Default number of bytes of blocks sorted in memory before spilling."""
+
+# Rough per block cost of the bytes object and tuple holding it in a run.
+BLOCK_OVERHEAD = 100
+
+# Spilled run record: date key and block length, followed by the block.
+_RECORD = struct.Struct('<II')
+
+SORTED_EXT = '.sorted'
+"""Extension of the file holding the end of the sorted part of a journal.
+
+The file is hidden, see :func:`pyledgertools.reader.sidecar_path`.
+"""
+
+# Number of search results written at a time.
+OUTPUT_BATCH = 1000
+
+
+def iter_blocks(stream, chunk_size=CHUNK_SIZE):
+    """Read blank line separated blocks from a binary file lazily.
+
+    Parameters:
+        stream (file): Journal opened in binary mode.
+        chunk_size (int): Number of bytes read at a time.
+
+    Yields:
+        bytes: Lines of a block, the last one ending with a newline.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parts = BLANK_REGEX.split(pending + chunk)
+        # The last part may continue in the next chunk.
+        pending = parts.pop()
+        for part in parts:
+            block = _block(part)
+            if block:
+                yield block
+
+    for part in BLANK_REGEX.split(pending + b'\n'):
+        block = _block(part)
+        if block:
+            yield block
+
+
+def _block(part):
+    """Block from the text between two blank lines, `None` if empty."""
+    match = LEADING_REGEX.match(part)
+    if match:
+        part = part[match.end():]
+    # A blank line split from its line break at a chunk boundary.
+    if part and not part.isspace():
+        return part + b'\n'
+    return None
+
+
+def block_key(block):
+    """Sort key of a journal block.
+
+    Parameters:
+        block (bytes): Journal block.
+
+    Returns:
+        int: Date of the block as ``YYYYMMDD``, ``0`` for blocks that do not
+        start with a date so directives and comments stay at the top.
+    """
+    match = DATE_REGEX.match(block)
+    if not match:
+        return 0
+    y, m, d = match.groups()
+    return int(y) * 10000 + int(m) * 100 + int(d)
+
+
+def _spill(run, tmpdir):
+    """Write a sorted run to a temporary file and return the file."""
+    pack = _RECORD.pack
+    run_file = tempfile.TemporaryFile(dir=tmpdir)
+    run_file.writelines(
+        pack(key, len(block)) + block for key, block in run
+    )
+    run_file.seek(0)
+    return run_file
+
+
+def _read_run(run_file):
+    """Yield the ``(key, block)`` records of a spilled run."""
+    size = _RECORD.size
+    with run_file:
+        while True:
+            header = run_file.read(size)
+            if not header:
+                return
+            key, length = _RECORD.unpack(header)
+            yield key, run_file.read(length)
+
+
+def sort_blocks(blocks, buffer_size=BUFFER_SIZE, tmpdir=None):
+    """Sort journal blocks by date.
+
+    The sort is stable, blocks with the same date keep their order. Blocks
+    are collected until about `buffer_size` bytes are held, sorted and
+    spilled to a temporary file; all runs are then merged with
+    :func:`heapq.merge`. Nothing is spilled when the input fits the buffer.
+
+    Parameters:
+        blocks (iterable): Journal blocks as bytes.
+        buffer_size (int): Approximate memory limit in bytes.
+        tmpdir (str): Directory for spilled runs, the system default when
+            not given.
+
+    Yields:
+        bytes: Blocks in date order.
+    """
+    key = itemgetter(0)
+    runs = []
+    run = []
+    size = 0
+
+    try:
+        for block in blocks:
+            run.append((block_key(block), block))
+            size += len(block) + BLOCK_OVERHEAD
+            if size >= buffer_size:
+                run.sort(key=key)
+                runs.append(_spill(run, tmpdir))
+                run = []
+                size = 0
+
+        run.sort(key=key)
+        if not runs:
+            for _, block in run:
+                yield block
+            return
+
+        # heapq.merge prefers earlier inputs on ties, runs are in input
+        # order so the merge is stable as well.
+        merged = heapq.merge(
+            *([_read_run(x) for x in runs] + [iter(run)]), key=key
+        )
+        for _, block in merged:
+            yield block
+    finally:
+        for run_file in runs:
+            run_file.close()
+
+
+def write_blocks(blocks, stream):
+    """Write blocks to a binary file separated by blank lines.
+
+    Returns:
+        int: Number of blocks written.
+    """
+    count = 0
+    write = stream.write
+    for block in blocks:
+        write(block + b'\n')
+        count += 1
+    return count
+
+
+def sort_file(path, output=None, buffer_size=BUFFER_SIZE, tmpdir=None):
+    """Sort the blocks of a journal file by date.
+
+    Parameters:
+        path (str): Journal file.
+        output (file): Binary stream for the sorted journal. The journal is
+            atomically replaced with the sorted version when not given.
+        buffer_size (int): Approximate memory limit in bytes.
+        tmpdir (str): Directory for spilled runs.
+
+    Returns:
+        int: Number of blocks written.
+    """
+    if output is not None:
+        with open(path, 'rb') as infile:
+            blocks = sort_blocks(iter_blocks(infile), buffer_size, tmpdir)
+            return write_blocks(blocks, output)
+
+    # Locked while reading as well so appends during the sort are not lost.
+    with file_lock(path):
+        with open(path, 'rb') as infile:
+            blocks = sort_blocks(iter_blocks(infile), buffer_size, tmpdir)
+            with atomic_write(path, 'wb', lock=False) as outfile:
+                count = write_blocks(blocks, outfile)
+
+        write_sorted_mark(path)
+        remove_index(path)
+    return count
+
+
+def read_sorted_mark(path, f):
+    """End of the sorted part of a journal saved by the last sort.
+
+    Parameters:
+        path (str): Journal file.
+        f (file): The journal opened in binary mode.
+
+    Returns:
+        int: Offset, `None` if there is no mark or the journal was changed
+        before it.
+    """
+    try:
+        with open(sidecar_path(path, SORTED_EXT), 'r') as mark_file:
+            mark = json.load(mark_file)
+        offset = mark['offset']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    if (os.fstat(f.fileno()).st_size < offset or
+            mark_digest(f, offset) != mark.get('digest')):
+        return None
+    return offset
+
+
+def write_sorted_mark(path):
+    """Record that all of a journal is sorted."""
+    with open(path, 'rb') as f:
+        offset = os.fstat(f.fileno()).st_size
+        mark = {'offset': offset, 'digest': mark_digest(f, offset)}
+
+    # The mark is only an optimization, it does not need to be durable.
+    mark_path = sidecar_path(path, SORTED_EXT)
+    tmp = mark_path + '.tmp'
+    with open(tmp, 'w') as mark_file:
+        json.dump(mark, mark_file)
+    os.replace(tmp, mark_path)
+
+
+def _block_start(data, pos, end):
+    """Start of the first block found from `pos` within ``data[:end]``.
+
+    The result never decreases as `pos` grows and every block is found from
+    some position, so bisecting over byte positions finds blocks in order.
+    """
+    if pos == 0:
+        match = LEADING_REGEX.match(data, 0, end)
+        return match.end() if match else 0
+    match = BLANK_REGEX.search(data, pos - 1, end)
+    return match.end() if match else end
+
+
+class _PositionKeys(object):
+    """Date keys of the blocks found from each byte position.
+
+    Sequence for :func:`bisect.bisect_right`. Positions that only find the
+    end of the range have a key after all dates.
+    """
+
+    def __init__(self, data, end):
+        self.data = data
+        self.end = end
+
+    def __len__(self):
+        return self.end
+
+    def __getitem__(self, pos):
+        start = _block_start(self.data, pos, self.end)
+        if start >= self.end:
+            return sys.maxsize
+        match = DATE_REGEX.match(self.data, start, start + 10)
+        if not match:
+            return 0
+        y, m, d = match.groups()
+        return int(y) * 10000 + int(m) * 100 + int(d)
+
+
+def _find_sorted_end(data):
+    """Offset of the first block that is out of date order."""
+    start = _block_start(data, 0, len(data))
+    last = block_key(data[start:start + 10])
+    for match in BLANK_REGEX.finditer(data, start):
+        start = match.end()
+        if start == len(data):
+            break
+        key = block_key(data[start:start + 10])
+        if key < last:
+            return start
+        last = key
+    return len(data)
+
+
+def _content_end(data, end):
+    """Offset after the last non white space byte before `end`."""
+    while end > 0 and data[end - 1:end].isspace():
+        end -= 1
+    return end
+
+
+def merge_file(path):
+    """Merge the unsorted blocks at the end of a journal into the rest.
+
+    The journal is assumed to be sorted up to the offset recorded by the
+    last :func:`sort_file` or :func:`merge_file` run, or when there is no
+    valid record, up to the first block that is out of order. Only blocks
+    after that point are parsed and sorted. Each is placed after the
+    existing blocks with the same date by binary search over the block
+    offsets; the sorted part is copied around them without being parsed.
+
+    Parameters:
+        path (str): Journal file, atomically replaced with the result.
+
+    Returns:
+        int: Number of blocks merged.
+    """
+    with file_lock(path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                count = _merge(path, f, data)
+            finally:
+                data.close()
+
+        write_sorted_mark(path)
+        if count:
+            # Offsets moved, the index is rebuilt when it is next used.
+            remove_index(path)
+    return count
+
+
+def _merge(path, f, data):
+    """Rewrite a journal with its unsorted tail merged in."""
+    sorted_end = read_sorted_mark(path, f)
+    if sorted_end is None:
+        sorted_end = _find_sorted_end(data)
+
+    new_blocks = [
+        (block_key(x), x) for x in iter_blocks(io.BytesIO(data[sorted_end:]))
+    ]
+    if not new_blocks:
+        return 0
+    new_blocks.sort(key=itemgetter(0))
+
+    keys = _PositionKeys(data, sorted_end)
+    content_end = _content_end(data, sorted_end)
+
+    with atomic_write(path, 'wb', lock=False) as out:
+        pos = 0
+        lo = 0
+        for key, block in new_blocks:
+            lo = bisect_right(keys, key, lo)
+            start = _block_start(data, lo, sorted_end)
+            if start < sorted_end:
+                out.write(data[pos:start])
+                pos = start
+            elif pos < content_end:
+                # First block after the last sorted one.
+                out.write(data[pos:content_end])
+                out.write(b'\n\n')
+                pos = content_end
+            out.write(block + b'\n')
+
+        if pos < content_end:
+            out.write(data[pos:content_end])
+            out.write(b'\n\n')
+
+    return len(new_blocks)
+
 
 def sort_journal():
     """Sort journal file transactions."""
@@ -11,15 +416,178 @@ def sort_journal():
         default=None,
         help='Journal file to be sorted.'
     )
+    parser.add_argument(
+        '-i', '--in-place',
+        dest='in_place',
+        action='store_true',
+        help='Replace the journal file instead of printing the result.'
+    )
+    parser.add_argument(
+        '-m', '--merge',
+        dest='merge',
+        action='store_true',
+        help='Merge transactions appended since the last sort into the '
+             'sorted journal in place.'
+    )
+    parser.add_argument(
+        '-S', '--buffer-size',
+        dest='buffer_size',
+        type=int,
+        default=BUFFER_SIZE >> 20,
+        help='Megabytes of transactions to sort in memory before spilling '
+             'to temporary files.'
+    )
+    parser.add_argument(
+        '-T', '--temporary-directory',
+        dest='tmpdir',
+        default=None,
+        help='Directory for temporary files.'
+    )
     args = dict((k, v) for k, v in vars(parser.parse_args()).items() if v)
     journal_file = args.get('journal_file')
+    options = {
+        'buffer_size': args.get('buffer_size', 1) << 20,
+        'tmpdir': args.get('tmpdir'),
+    }
+
+    if args.get('merge'):
+        merge_file(journal_file)
+    elif args.get('in_place'):
+        sort_file(journal_file, **options)
+    else:
+        sort_file(journal_file, sys.stdout.buffer, **options)
+        sys.stdout.buffer.flush()
+
+
+def query_index():
+    """Search journals using their sidecar index."""
+
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        '-j', '--journal-file',
+        dest='journal_files',
+        action='append',
+        default=None,
+        help='Journal file to search, files it includes are searched as '
+             'well. Defaults to the ledger journal.'
+    )
+    parser.add_argument(
+        '-p', '--payee',
+        dest='payee',
+        default=None,
+        help='Words the payee has to contain (as prefixes).'
+    )
+    parser.add_argument(
+        '-u', '--uuid',
+        dest='uuid',
+        default=None,
+        help='Transaction UUID.'
+    )
+    parser.add_argument(
+        '-f', '--file',
+        dest='file',
+        default=None,
+        help='Part of the file: metadata of the transaction.'
+    )
+    parser.add_argument(
+        '-b', '--begin',
+        dest='begin',
+        default=None,
+        help='First date to include.'
+    )
+    parser.add_argument(
+        '-e', '--end',
+        dest='end',
+        default=None,
+        help='Date to stop at (exclusive).'
+    )
+    parser.add_argument(
+        '--list-files',
+        dest='list_files',
+        action='store_true',
+        help='Only print the file: metadata of the transactions found.'
+    )
+    args = vars(parser.parse_args())
+    list_files = args.pop('list_files')
+    journal_files = args.pop('journal_files')
+
+    for index in open_indexes(journal_files):
+        found = index.find(**args)
+        if list_files:
+            for _, term in index.terms('file', [x[0] for x in found]):
+                print(term)
+            continue
 
-    with open(journal_file, 'r') as infile:
-        journal_string = infile.read()
+        for line, text in index.read(found):
+            print(';; {}:{} ;;'.format(index.journal, line))
+            print(text)
 
-    blocks = [x for x in journal_string.split('\n\n')]
 
-    blocks.sort()
+def search_journal():
+    """Search journal files for transactions."""
+
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        'pattern',
+        help='Regular expression to search for, ignoring case. An empty '
+             'pattern matches every transaction.'
+    )
+    parser.add_argument(
+        'paths',
+        nargs='*',
+        help='Journal files or directories with *.ledger files. Defaults '
+             'to the directory of the ledger journal.'
+    )
+    parser.add_argument(
+        '-b', '--begin',
+        dest='begin',
+        default=None,
+        help='First date to include.'
+    )
+    parser.add_argument(
+        '-e', '--end',
+        dest='end',
+        default=None,
+        help='Date to stop at (exclusive).'
+    )
+    parser.add_argument(
+        '-a', '--amount',
+        dest='amount',
+        default=None,
+        help='Absolute posting amount, 12.50 or a range like 10..20.'
+    )
+    parser.add_argument(
+        '--account',
+        dest='account',
+        default=None,
+        help='Regular expression matching one of the posting accounts.'
+    )
+    parser.add_argument(
+        '-J', '--jobs',
+        dest='jobs',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of files to search at the same time.'
+    )
+    args = parser.parse_args()
+
+    search = SearchFilter(
+        pattern=args.pattern,
+        begin=args.begin,
+        end=args.end,
+        amount=args.amount,
+        account=args.account,
+    )
 
-    for tran in blocks:
-        print(tran + '\n')
+    # Results are written in batches, writing them one by one takes longer
+    # than the search when there are a lot of them.
+    output = []
+    paths = journal_files(args.paths)
+    for path, line, text in search_files(paths, search, args.jobs):
+        output.append(';; {}:{} ;;\n{}\n\n'.format(path, line, text))
+        if len(output) >= OUTPUT_BATCH:
+            sys.stdout.write(''.join(output))
+            del output[:]
+    sys.stdout.write(''.join(output))
@@ -0,0 +1,392 @@
+"""Search journal files for transactions.
+
+Each journal file is memory mapped and scanned a chunk at a time with a
+precompiled regular expression; only the blank line separated blocks around
+the matches are decoded and checked against the date, amount and account
+filters. Case insensitive searches run on lower cased chunks with a lower
+cased pattern where possible, which is several times faster than a case
+insensitive regular expression. Files are searched in a process pool and
+the results of each file are returned in file order with the line number of
+every block.
+
+When a file has a :mod:`journal_index` and the search is limited to a date
+range only the entries in that range are read.
+"""
+
+from decimal import Decimal, InvalidOperation
+import fnmatch
+import mmap
+import os
+import re
+
+from pyledgertools.journal_index import JournalIndex, date_key, index_path
+from pyledgertools.reader import (
+    COMMENT_CHARS, HEADER_REGEX, default_journal, parse_posting
+)
+
+JOURNAL_PATTERN = '*.ledger'
+
+# Run of lines that are not blank.
+BLOCK_REGEX = re.compile(br'(?:[^\n]*\S[^\n]*(?:\n|\Z))+')
+# Line that is empty or only has whitespace.
+BLANK_LINE_REGEX = re.compile(br'\n[ \t\r\f\v]*\n')
+WHITESPACE = b' \t\n\r\f\v'
+
+# Unescaped ``^`` or ``$``, other than ``[^``.
+ANCHOR_REGEX = re.compile(br'(?<![\[\\])\^|(?<!\\)\$')
+
+# Constructs whose meaning changes when the letters of a pattern are lower
+# cased: numeric and named character escapes, back references, inline flags
+# and named groups.
+UNFOLDABLE_REGEX = re.compile(br'\\[0-9xuUN]|\(\?(?![:=!]|<[=!])')
+# Character ranges that keep their meaning when lower cased.
+FOLDABLE_RANGE_REGEX = re.compile(br'[a-z]-[a-z]|[A-Z]-[A-Z]|[0-9]-[0-9]')
+ESCAPE_OR_UPPER_REGEX = re.compile(br'\\.|[A-Z]', re.S)
+
+# Bytes of a journal file scanned at a time. Small chunks stay in the CPU
+# cache while they are lower cased and searched.
+SCAN_CHUNK = 256 << 10
+
+
+class SearchFilter(object):
+    """Conditions a transaction block has to meet.
+
+    Attributes:
+        pattern (bytes): Regular expression searched for in the block,
+            ignoring case. Every block matches when `None`.
+        begin (int): First date as ``YYYYMMDD``.
+        end (int): Date to stop at as ``YYYYMMDD``, exclusive.
+        amount (tuple): Smallest and largest absolute posting amount, either
+            may be `None`.
+        account (str): Regular expression one of the posting accounts has to
+            contain, ignoring case.
+    """
+
+    def __init__(self, pattern=None, begin=None, end=None, amount=None,
+                 account=None):
+        """Initialize the filter.
+
+        Parameters:
+            pattern (str): Regular expression to search for.
+            begin (str): First date, ``YYYY-MM-DD``.
+            end (str): Date to stop at, exclusive.
+            amount (str): Absolute amount ``12.50`` or range ``10..20``,
+                either end of the range may be left out.
+            account (str): Regular expression for the posting accounts.
+        """
+        self.pattern = pattern.encode('utf-8') if pattern else None
+        self.begin = date_key(begin) if begin else None
+        self.end = date_key(end) if end else None
+        self.amount = parse_range(amount) if amount else None
+        self.account = account
+        self._compiled = None
+
+    def __getstate__(self):
+        # Compiled patterns are rebuilt in the worker processes.
+        state = dict(self.__dict__)
+        state['_compiled'] = None
+        return state
+
+    def compiled(self):
+        """Compiled `pattern` and `account` expressions.
+
+        The third expression is the case sensitive version of `pattern` for
+        searching lower cased text, see :func:`fold_pattern`. It is `None`
+        when there is no pattern or it can't be folded.
+        """
+        if self._compiled is None:
+            folded = fold_pattern(self.pattern) if self.pattern else None
+            self._compiled = (
+                re.compile(self.pattern, re.I) if self.pattern else None,
+                re.compile(self.account, re.I) if self.account else None,
+                re.compile(folded) if folded is not None else None,
+            )
+        return self._compiled
+
+    @property
+    def has_dates(self):
+        return self.begin is not None or self.end is not None
+
+    def match(self, text):
+        """Check the date, amount and account conditions of a block.
+
+        The pattern is not checked again.
+
+        Parameters:
+            text (str): Transaction block.
+
+        Returns:
+            bool: `True` if the block meets all conditions.
+        """
+        if not (self.has_dates or self.amount or self.account):
+            return True
+
+        lines = text.split('\n')
+        header = None
+        for idx, line in enumerate(lines):
+            if line and line[0] not in COMMENT_CHARS:
+                header = HEADER_REGEX.match(line.split(';', 1)[0].rstrip())
+                break
+        if header is None:
+            return False
+
+        if self.has_dates:
+            date = date_key(header.group('date'))
+            if self.begin is not None and date < self.begin:
+                return False
+            if self.end is not None and date >= self.end:
+                return False
+
+        if not (self.amount or self.account):
+            return True
+
+        account_regex = self.compiled()[1]
+        postings = [
+            parse_posting(x) for x in lines[idx + 1:]
+            if x.strip() and not x.strip().startswith(';')
+        ]
+        if account_regex is not None and not any(
+                account_regex.search(x.account) for x in postings):
+            return False
+        if self.amount is not None:
+            low, high = self.amount
+            amounts = [abs(x.amount) for x in postings if x.amount is not None]
+            if not any((low is None or x >= low) and
+                       (high is None or x <= high) for x in amounts):
+                return False
+        return True
+
+
+def parse_range(text):
+    """Parse an amount or amount range.
+
+    >>> parse_range('10..20.5')
+    (Decimal('10'), Decimal('20.5'))
+    >>> parse_range('12.50')
+    (Decimal('12.50'), Decimal('12.50'))
+
+    Parameters:
+        text (str): ``AMOUNT`` or ``[LOW]..[HIGH]``.
+
+    Returns:
+        tuple: Smallest and largest amount, `None` for an open end.
+    """
+    try:
+        if '..' not in text:
+            amount = abs(Decimal(text.replace(',', '')))
+            return amount, amount
+        low, high = text.split('..', 1)
+        return (
+            abs(Decimal(low.replace(',', ''))) if low.strip() else None,
+            abs(Decimal(high.replace(',', ''))) if high.strip() else None,
+        )
+    except InvalidOperation:
+        raise ValueError('Invalid amount range: {!r}'.format(text))
+
+
+def fold_pattern(pattern):
+    """Lower case the letters of a pattern to search lower cased text with.
+
+    Searching lower cased text with a case sensitive pattern finds the same
+    matches as a case insensitive search of the original text. Escapes like
+    ``\\S`` are left alone.
+
+    >>> fold_pattern(b'AMAZON\\s+Mktp')
+    b'amazon\\\\s+mktp'
+
+    Parameters:
+        pattern (bytes): Regular expression.
+
+    Returns:
+        bytes: Lower cased pattern, `None` if the pattern uses constructs
+        whose meaning would change.
+    """
+    if UNFOLDABLE_REGEX.search(pattern):
+        return None
+    if b'[' in pattern and b'-' in FOLDABLE_RANGE_REGEX.sub(b'', pattern):
+        return None
+    return ESCAPE_OR_UPPER_REGEX.sub(
+        lambda x: x.group().lower() if len(x.group()) == 1 else x.group(),
+        pattern
+    )
+
+
+def journal_files(paths=None):
+    """Journal files to search.
+
+    Parameters:
+        paths (list): Files and directories. Directories are searched for
+            ``*.ledger`` files. Defaults to the directory of the ledger
+            journal.
+
+    Returns:
+        list: Journal file paths.
+    """
+    if not paths:
+        journal = default_journal()
+        if journal is None:
+            raise IOError('No journal file given and no default found.')
+        paths = [os.path.dirname(os.path.abspath(journal))]
+
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            files.extend(
+                os.path.join(root, x)
+                for x in sorted(fnmatch.filter(filenames, JOURNAL_PATTERN))
+            )
+    return files
+
+
+def _scan(data, pattern):
+    """Yield the ``(start, end)`` of the blocks matching a pattern.
+
+    Blocks are found by looking for blank lines on both sides of a match.
+    Only when that range holds lines with just whitespace, or the match
+    runs past it, are its blocks split up with `BLOCK_REGEX` and searched
+    one by one. Patterns with ``^`` or ``$`` are always searched block by
+    block so they match at the start and end of a block, like awk does.
+
+    Parameters:
+        data (bytes): Text to search.
+        pattern (regex): Compiled pattern, every block matches when
+            `None`.
+    """
+    if pattern is None or ANCHOR_REGEX.search(pattern.pattern):
+        for block in BLOCK_REGEX.finditer(data):
+            if pattern is None or pattern.search(block.group()):
+                yield block.start(), block.end()
+        return
+
+    # Bound methods, this loop runs once for every matching block.
+    search = pattern.search
+    rfind = data.rfind
+    find = data.find
+    blank_line = BLANK_LINE_REGEX.search
+
+    size = len(data)
+    pos = 0
+    while pos < size:
+        match = search(data, pos)
+        if match is None:
+            return
+        at, after = match.span()
+        if at == size:
+            return
+
+        # The previous range ends between the two line breaks of a blank
+        # line.
+        start = rfind(b'\n\n', max(pos - 1, 0), at)
+        start = pos if start < 0 else start + 2
+        end = find(b'\n\n', at)
+        end = size if end < 0 else end + 1
+
+        if (after > end or data[start] in WHITESPACE or
+                blank_line(data, start, end)):
+            for block in BLOCK_REGEX.finditer(data, start, end):
+                if search(block.group()):
+                    yield block.start(), block.end()
+        else:
+            yield start, end
+        pos = end
+
+
+def search_file(path, search):
+    """Search a single journal file.
+
+    Module level so it can run in a worker process.
+
+    Parameters:
+        path (str): Journal file.
+        search (SearchFilter): Search conditions.
+
+    Returns:
+        list: ``(path, line, text)`` of the matching blocks in file order.
+    """
+    if search.has_dates and os.path.exists(index_path(path)):
+        return _search_index(path, search)
+
+    pattern, _, folded = search.compiled()
+    filtered = search.has_dates or search.amount or search.account
+
+    results = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return results
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = len(data)
+            line = 1
+            offset = 0
+            while offset < size:
+                # Chunks end after a blank line so no block is split.
+                cut = data.find(b'\n\n', offset + SCAN_CHUNK)
+                cut = size if cut < 0 else cut + 2
+                chunk = data[offset:cut]
+                if folded is not None:
+                    blocks = _scan(chunk.lower(), folded)
+                else:
+                    blocks = _scan(chunk, pattern)
+
+                counted = 0
+                for start, end in blocks:
+                    text = chunk[start:end].decode('utf-8', 'replace')
+                    if filtered and not search.match(text):
+                        continue
+                    line += chunk.count(b'\n', counted, start)
+                    counted = start
+                    results.append((path, line, text.rstrip('\r\n')))
+                if cut < size:
+                    line += chunk.count(b'\n', counted)
+                offset = cut
+        finally:
+            data.close()
+    return results
+
+
+def _search_index(path, search):
+    """Search the entries in the date range of a search using the index."""
+    pattern = search.compiled()[0]
+    with JournalIndex(path) as index:
+        index.update()
+        entries = index.find(begin=search.begin, end=search.end)
+
+        results = []
+        for line, text in index.read(entries):
+            if pattern is not None and not pattern.search(text.encode()):
+                continue
+            if search.match(text):
+                results.append((path, line, text.rstrip('\r\n')))
+    return results
+
+
+def search_files(paths, search, jobs=1):
+    """Search journal files in parallel.
+
+    Parameters:
+        paths (list): Journal files.
+        search (SearchFilter): Search conditions.
+        jobs (int): Number of worker processes.
+
+    Yields:
+        tuple: ``(path, line, text)`` of each matching block, file by file
+        in the order of `paths`.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            for result in search_file(path, search):
+                yield result
+        return
+
+    # Imported here, it adds noticeably to the start up time of a search.
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(search_file, x, search) for x in paths]
+        for future in futures:
+            for result in future.result():
+                yield result
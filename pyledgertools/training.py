@@ -0,0 +1,386 @@
+"""Training data for the transaction classifier.
+
+Turns journals into ``(text, account)`` training examples and counts them
+into :obj:`NaiveBayes` models, optionally spread over several processes.
+The worker functions live here rather than in the classifier plugin so
+worker processes can import them.
+
+:obj:`WindowedModel` keeps the counts per month so a model over a sliding
+window of months can be updated with only the transactions added since the
+last run.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from itertools import chain, islice
+import json
+import os
+
+from pyledgertools.bayes import HashingTokenizer, NaiveBayes, Tokenizer
+from pyledgertools.functions import amount_group, months_ago
+from pyledgertools.reader import (
+    JournalChanged, filter_transactions, journal_key, parse_entries,
+    read_new_entries
+)
+
+
+def train_transactions(transactions):
+    """Generate training examples from journal transactions.
+
+    Parameters:
+        transactions (iterable): :obj:`Transaction` objects, typically from
+            :func:`pyledgertools.reader.read_journal`.
+
+    Yields:
+        tuple: ``(text, account)`` where text is the payee plus the amount
+        group of the first posting and account is the second posting account.
+    """
+    for transaction in transactions:
+        postings = transaction.postings
+        if len(postings) < 2 or postings[0].amount is None:
+            continue
+        text = transaction.payee + ' ' + amount_group(postings[0].amount)
+        yield text, postings[1].account
+
+
+def chunks(iterable, size):
+    """Split an iterable into lists of `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _count(model, examples):
+    update = model.update
+    for text, category in examples:
+        update(text, category)
+    return model
+
+
+def count_entries(model, entries, since=None, exclude_payee=None):
+    """Count the training examples of raw journal entries.
+
+    Parameters:
+        model (NaiveBayes): Model to add the counts to.
+        entries (list): Entries from
+            :func:`pyledgertools.reader.read_entries`.
+        since (str): Only count transactions dated on or after this
+            ``YYYY-MM-DD`` date.
+        exclude_payee (str): Case insensitive regex of payees to skip.
+
+    Returns:
+        NaiveBayes: `model`.
+    """
+    transactions = filter_transactions(
+        parse_entries(entries), since, exclude_payee
+    )
+    return _count(model, train_transactions(transactions))
+
+
+def train_sharded(model, count, shards, jobs):
+    """Count training examples in a process pool and merge the counts.
+
+    Every shard is counted into an empty copy of `model` by a worker and
+    the results are merged into `model` in shard order, which makes the
+    model identical to one trained serially on the same examples. Only a
+    few shards are queued ahead of the merge to keep memory use flat.
+
+    Parameters:
+        model (NaiveBayes): Model to train.
+        count (callable): :func:`count_entries` or a similar module level
+            function.
+        shards (iterable): Arguments of `count` following the model, one
+            tuple per shard.
+        jobs (int): Number of worker processes.
+    """
+    shards = iter(shards)
+    first = next(shards, None)
+    if first is None:
+        return
+    second = next(shards, None)
+    if second is None:
+        # Not worth starting a pool.
+        count(model, *first)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for shard in chain([first, second], shards):
+            empty = type(model)(model.tokenizer, model.default_prob)
+            pending.append(pool.submit(count, empty, *shard))
+            if len(pending) > 2 * jobs:
+                model.merge(pending.popleft().result())
+
+        while pending:
+            model.merge(pending.popleft().result())
+
+
+class MonthlyCounts(object):
+    """Naive bayes counts split by transaction month.
+
+    Takes the same arguments as :obj:`NaiveBayes` so it can be used with
+    :func:`train_sharded`.
+
+    Attributes:
+        months (dict): ``YYYY-MM`` month to :obj:`NaiveBayes` model.
+    """
+
+    def __init__(self, tokenizer=None, default_prob=1e-9):
+        self.tokenizer = tokenizer
+        self.default_prob = default_prob
+        self.months = {}
+
+    def model(self, month):
+        """Counts for `month`, created when missing."""
+        model = self.months.get(month)
+        if model is None:
+            model = self.months[month] = NaiveBayes(
+                self.tokenizer, self.default_prob
+            )
+        return model
+
+    def merge(self, other):
+        """Add the counts of another :obj:`MonthlyCounts`."""
+        for month, model in other.months.items():
+            if month in self.months:
+                self.months[month].merge(model)
+            else:
+                self.months[month] = model
+
+
+def count_monthly(counts, entries, since=None, exclude_payee=None):
+    """Count the training examples of raw journal entries per month.
+
+    Parameters:
+        counts (MonthlyCounts): Counts to add to.
+        entries (list): Entries from
+            :func:`pyledgertools.reader.read_entries`.
+        since (str): Only count transactions dated on or after this
+            ``YYYY-MM-DD`` date.
+        exclude_payee (str): Case insensitive regex of payees to skip.
+
+    Returns:
+        MonthlyCounts: `counts`.
+    """
+    transactions = filter_transactions(
+        parse_entries(entries), since, exclude_payee
+    )
+    for transaction in transactions:
+        for text, account in train_transactions([transaction]):
+            counts.model(transaction.date[:7]).update(text, account)
+    return counts
+
+
+class WindowedModel(object):
+    """Classifier model over a sliding window of months.
+
+    Counts are kept per month in ``<state_dir>/months`` together with a
+    high-water mark for every journal file (see
+    :func:`pyledgertools.reader.read_new_entries`). A refresh only parses
+    what was appended to the journal since the last one, drops the months
+    that left the window and merges the remaining months into the model
+    used for classification. Reading a different journal, changing the
+    options or a change to the journal that is reported by
+    :func:`read_new_entries` rebuilds everything. Some edits in the middle
+    of the journal are not reported, pass ``rebuild=True`` to
+    :meth:`refresh` after those.
+
+    Attributes:
+        state_dir (str): Directory holding the model state.
+        window (int): Number of months, before the current one, to train on.
+    """
+
+    VERSION = 1
+    # Number of journal entries counted by each worker process.
+    SHARD_SIZE = 5000
+
+    def __init__(self, state_dir, window=12, exclude_payee=None,
+                 hash_buckets=None, min_token_count=1, min_category_count=1):
+        """Initialize the model.
+
+        Parameters:
+            state_dir (str): Directory holding the model state.
+            window (int): Number of months, before the current one, to train
+                on.
+            exclude_payee (str): Case insensitive regex of payees to skip.
+            hash_buckets (int): Hash tokens into this many buckets, see
+                :obj:`pyledgertools.bayes.HashingTokenizer`.
+            min_token_count (int): Drop tokens seen fewer times than this
+                from the merged model.
+            min_category_count (int): Drop accounts with fewer transactions
+                than this from the merged model.
+        """
+        self.state_dir = state_dir
+        self.window = window
+        self.options = {
+            'exclude_payee': exclude_payee,
+            'hash_buckets': hash_buckets,
+            'min_token_count': min_token_count,
+            'min_category_count': min_category_count,
+        }
+
+    @property
+    def model_file(self):
+        """File of the merged model."""
+        return os.path.join(self.state_dir, 'model')
+
+    def _month_file(self, month):
+        return os.path.join(self.state_dir, 'months', month + '.model')
+
+    def _tokenizer(self):
+        if self.options['hash_buckets']:
+            return HashingTokenizer(self.options['hash_buckets'])
+        return Tokenizer()
+
+    def _read_state(self, journals):
+        """Saved state or `None` when missing, stale or incomplete.
+
+        Parameters:
+            journals (list): :func:`journal_key` of the journal read.
+        """
+        try:
+            with open(os.path.join(self.state_dir, 'state.json'), 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if (state.get('version') != self.VERSION or
+                state.get('options') != self.options or
+                state.get('journals') != journals or
+                state.get('dirty', True)):
+            return None
+
+        return state
+
+    def _write_state(self, state):
+        path = os.path.join(self.state_dir, 'state.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def refresh(self, paths=None, jobs=1, today=None, rebuild=False):
+        """Bring the model up to date with the journal.
+
+        Parameters:
+            paths (str or list): Journal file(s), defaults to the ledger
+                default journal.
+            jobs (int): Number of processes used to count new entries.
+            today (date): Reference date of the window, defaults to today.
+            rebuild (bool): Discard the saved state and count the whole
+                journal again.
+
+        Returns:
+            NaiveBayes: The merged model, memory mapped.
+        """
+        since = months_ago(self.window, today)
+        first_month = since[:7]
+
+        journals = journal_key(paths)
+        state = None if rebuild else self._read_state(journals)
+        if state is not None:
+            counts, marks = self._count(paths, jobs, since, state['marks'])
+        if state is None or counts is None:
+            state = {'journals': journals, 'marks': {}, 'months': []}
+            counts, marks = self._count(paths, jobs, since, {})
+            rebuild = True
+        else:
+            rebuild = False
+
+        expired = [x for x in state['months'] if x < first_month]
+        if not rebuild and not counts.months and not expired:
+            model = NaiveBayes.load(self.model_file)
+            if model is not None:
+                if marks != state['marks']:
+                    state['marks'] = marks
+                    self._write_state(self._state(state, dirty=False))
+                return model
+
+        months_dir = os.path.join(self.state_dir, 'months')
+        if not os.path.isdir(months_dir):
+            os.makedirs(months_dir)
+
+        # Month files are changed in place, until the state is written again
+        # a crash leaves it marked dirty which forces a rebuild.
+        self._write_state(self._state(state, dirty=True))
+
+        if rebuild:
+            for path in glob(os.path.join(months_dir, '*.model')):
+                os.unlink(path)
+        for month in expired:
+            path = self._month_file(month)
+            if os.path.exists(path):
+                os.unlink(path)
+
+        months = set(x for x in state['months'] if x >= first_month)
+        for month, new in counts.months.items():
+            model = None
+            if month in months:
+                model = NaiveBayes.load(self._month_file(month))
+            if model is None:
+                model = new
+            else:
+                model.merge(new)
+            model.save(self._month_file(month))
+            months.add(month)
+
+        merged = NaiveBayes(self._tokenizer())
+        for month in sorted(months):
+            model = NaiveBayes.load(self._month_file(month))
+            if model is None and rebuild:
+                raise IOError(
+                    'Unable to load {}'.format(self._month_file(month))
+                )
+            if model is None:
+                # A month file went missing or can't be read, only a
+                # rebuild can restore its counts. The state is still
+                # marked dirty.
+                return self.refresh(paths, jobs, today)
+            merged.merge(model)
+        if (self.options['min_token_count'] > 1 or
+                self.options['min_category_count'] > 1):
+            merged.prune(
+                self.options['min_token_count'],
+                self.options['min_category_count']
+            )
+        merged.save(self.model_file)
+
+        state['marks'] = marks
+        state['months'] = sorted(months)
+        self._write_state(self._state(state, dirty=False))
+
+        return NaiveBayes.load(self.model_file)
+
+    def _state(self, state, dirty):
+        return {
+            'version': self.VERSION,
+            'options': self.options,
+            'dirty': dirty,
+            'journals': state['journals'],
+            'marks': state['marks'],
+            'months': state['months'],
+        }
+
+    def _count(self, paths, jobs, since, marks):
+        """Count the entries after the marks.
+
+        Returns:
+            tuple: :obj:`MonthlyCounts` and the new marks, the counts are
+            `None` if the journal changed before the marks.
+        """
+        marks = dict(marks)
+        counts = MonthlyCounts(self._tokenizer())
+        shards = (
+            (x, since, self.options['exclude_payee'])
+            for x in chunks(read_new_entries(paths, marks), self.SHARD_SIZE)
+        )
+        try:
+            train_sharded(counts, count_monthly, shards, jobs)
+        except JournalChanged:
+            return None, marks
+
+        return counts, marks
@@ -0,0 +1,136 @@
+"""Persistent index of imported transaction UUID's."""
+
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+
+
+class UUIDIndex(object):
+    """SQLite backed set of transaction UUID's.
+
+    Used by the import scripts to skip transactions that already exist in the
+    journal without having to run ``ledger`` over the whole file every time.
+    The index supports ``in``, ``len`` and iteration like a regular set.
+
+    Attributes:
+        path (str): Location of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        """Open (and create if needed) the index.
+
+        Parameters:
+            path (str): Location of the SQLite database file.
+        """
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS uuids (uuid TEXT PRIMARY KEY) '
+            'WITHOUT ROWID'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)'
+        )
+        self._conn.commit()
+
+    def __contains__(self, uuid):
+        cur = self._conn.execute(
+            'SELECT 1 FROM uuids WHERE uuid = ?', (uuid,)
+        )
+        return cur.fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM uuids').fetchone()[0]
+
+    def __iter__(self):
+        for row in self._conn.execute('SELECT uuid FROM uuids'):
+            yield row[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def journals(self):
+        """Journal files the index was seeded from, `None` if unknown."""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'journals'"
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @journals.setter
+    def journals(self, paths):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('journals', ?)", (json.dumps(paths),)
+            )
+
+    @property
+    def marks(self):
+        """Journal high-water marks the index is up to date with.
+
+        See :func:`pyledgertools.reader.read_new_entries`, `None` if
+        unknown.
+        """
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'marks'"
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @marks.setter
+    def marks(self, marks):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('marks', ?)", (json.dumps(marks),)
+            )
+
+    def add(self, uuid):
+        """Add a single UUID to the index."""
+        self.update([uuid])
+
+    def update(self, uuids):
+        """Add several UUID's to the index in one transaction.
+
+        Parameters:
+            uuids (iterable): UUID strings. Empty values are ignored.
+        """
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO uuids (uuid) VALUES (?)',
+                ((x,) for x in uuids if x)
+            )
+
+    @contextmanager
+    def atomic_update(self, uuids):
+        """Add UUID's, committed only if the block exits without an error.
+
+        Used to add the UUID's of imported transactions in the same step as
+        appending them to the journal.
+
+        Parameters:
+            uuids (iterable): UUID strings. Empty values are ignored.
+        """
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO uuids (uuid) VALUES (?)',
+                ((x,) for x in uuids if x)
+            )
+            yield
+
+    def clear(self):
+        """Remove every UUID and the journal marks from the index."""
+        with self._conn:
+            self._conn.execute('DELETE FROM uuids')
+            self._conn.execute("DELETE FROM meta WHERE key = 'marks'")
+
+    def close(self):
+        self._conn.close()
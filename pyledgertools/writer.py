@@ -0,0 +1,164 @@
+"""Buffered journal output."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import shutil
+import tempfile
+
+from pyledgertools.journal_index import update_index
+from pyledgertools.reader import sidecar_path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Hold the exclusive lock used by :func:`atomic_write`.
+
+    The lock file is ``.<name>.lock`` next to the file, see
+    :func:`pyledgertools.reader.sidecar_path`. Symbolic links are resolved
+    so every name of a file shares one lock.
+
+    Parameters:
+        path (str): File to lock.
+    """
+    with open(sidecar_path(path, '.lock'), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+@contextmanager
+def atomic_write(path, mode='w', lock=True):
+    """Replace a file with the data written to the yielded file object.
+
+    Data is written to a temporary file in the same directory which is
+    synced to disk and renamed over `path` when the block exits without an
+    error, otherwise `path` is left untouched. When `path` is a symbolic
+    link the file it points to is replaced. The lock from
+    :func:`file_lock` is held while doing so to keep concurrent writers from
+    overwriting each other.
+
+    Parameters:
+        path (str): File to replace. Created if it does not exist.
+        mode (str): ``w`` for text or ``wb`` for binary output.
+        lock (bool): Take the lock, `False` when the caller already holds
+            it.
+    """
+    path = os.path.realpath(path)
+    dirname, basename = os.path.split(path)
+
+    with file_lock(path) if lock else _no_lock():
+        tmp = tempfile.NamedTemporaryFile(
+            mode=mode, dir=dirname, prefix='.' + basename + '.',
+            suffix='.tmp', delete=False
+        )
+        try:
+            with tmp:
+                if os.path.exists(path):
+                    shutil.copymode(path, tmp.name)
+                yield tmp
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+        _fsync_dir(dirname)
+
+
+@contextmanager
+def _no_lock():
+    yield
+
+
+def atomic_append(path, text):
+    """Append text to a file so that it is either fully written or not at all.
+
+    The text is encoded once and appended with a single write while holding
+    the lock from :func:`file_lock`, then synced to disk. If the write fails
+    the file is truncated back to its previous size. Existing contents are
+    never rewritten, so symbolic links, line endings and the encoding of
+    the file are left alone.
+
+    Parameters:
+        path (str): File to append to. Created if it does not exist.
+        text (str): Text to append.
+    """
+    data = text.encode('utf-8')
+    with file_lock(path):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            size = os.fstat(fd).st_size
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            except BaseException:
+                os.ftruncate(fd, size)
+                raise
+        finally:
+            os.close(fd)
+
+
+def _fsync_dir(dirname):
+    """Make a rename in `dirname` durable. Not supported on all platforms."""
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JournalWriter(object):
+    """Collect rendered transactions and write them out in one go.
+
+    Output is buffered per journal file and per account, in the order the
+    accounts were first seen. Nothing touches the disk until :meth:`flush`
+    is called, which appends everything for a journal file with a single
+    atomic write.
+    """
+
+    def __init__(self):
+        self._buffers = OrderedDict()
+
+    def add(self, ledger_file, account, text):
+        """Queue text to be appended to a journal file.
+
+        Parameters:
+            ledger_file (str): Journal file the text belongs in.
+            account (str): Import account the text came from.
+            text (str): Rendered transaction(s) including separators.
+        """
+        accounts = self._buffers.setdefault(ledger_file, OrderedDict())
+        accounts.setdefault(account, []).append(text)
+
+    def pending(self):
+        """Return the number of queued entries."""
+        return sum(
+            len(x) for accounts in self._buffers.values()
+            for x in accounts.values()
+        )
+
+    def flush(self):
+        """Append all queued text to the journal files.
+
+        Journals with a :mod:`journal_index` are indexed right away.
+        """
+        for ledger_file in list(self._buffers):
+            accounts = self._buffers[ledger_file]
+            text = ''.join(''.join(x) for x in accounts.values())
+            atomic_append(ledger_file, text)
+            del self._buffers[ledger_file]
+            update_index(ledger_file)
@@ -29,7 +29,6 @@ setup(
         'nose',
         'ofxtools==0.3.14',
         'PyYaml',
-        'naiveBayesClassifier',
         'yapsy',
     ],
     include_package_data=True,
@@ -39,6 +38,8 @@ setup(
             'int-ofx=pyledgertools.cli:interactive',
             'auto-import=pyledgertools.cli:automatic',
             'journal-sort=pyledgertools.scripts.journal:sort_journal',
+            'journal-index=pyledgertools.scripts.journal:query_index',
+            'journal-search=pyledgertools.scripts.journal:search_journal',
         ]
     },
     scripts = [
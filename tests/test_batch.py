@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from pyledgertools.batch import TransactionBatch, column
+from pyledgertools.journal import Posting, Transaction
+
+ROWS = [
+    ('2017-03-02', 'Coffee Shop', -3.5, [('check', '101')], 'u1'),
+    ('2017-03-01', 'Employer', 1000, [], 'u2'),
+    ('2017-03-02', 'Gas Station', '-40.125', [('note', 'a'), ('x', 'b')],
+     'u3'),
+    ('2017-02-28', 'Bank', Decimal('0.01'), [('UUID', 'u4')], 'u4'),
+]
+
+
+def _batch():
+    batch = TransactionBatch()
+    for date, payee, amount, meta, uuid in ROWS:
+        batch.append(date, payee, 'Assets:Checking', amount,
+                     metadata=meta, uuid=uuid, account='1234')
+    return batch
+
+
+def test_materialize():
+    batch = _batch()
+    assert len(batch) == 4
+
+    for tran, (date, payee, amount, meta, uuid) in zip(batch, ROWS):
+        expected = Transaction(
+            date=date,
+            payee=payee,
+            postings=[Posting(account='Assets:Checking', amount=amount)],
+            metadata=meta,
+            account='1234',
+            uuid=uuid
+        )
+        assert tran.to_string() == expected.to_string()
+        assert tran.postings[0].amount == expected.postings[0].amount
+        assert tran.uuid == uuid and tran.account == '1234'
+
+    assert batch.amount(2) == Decimal('-40.125')
+    assert batch[-1].payee == 'Bank'
+    assert column(batch, 'amount') == column(list(batch), 'amount')
+    assert column(batch, 'date') == [x[0] for x in ROWS]
+
+
+def test_sort_and_filter():
+    batch = _batch().sort_by_date()
+    # Stable: the two 2017-03-02 rows keep their order.
+    assert batch.uuids == ['u4', 'u2', 'u1', 'u3']
+    assert batch.metadata(3) == [('note', 'a'), ('x', 'b')]
+    assert batch.amount(3) == Decimal('-40.125')
+
+    kept = batch.filter([x != 'u2' for x in batch.uuids])
+    assert kept.uuids == ['u4', 'u1', 'u3']
+    assert [x.metadata for x in kept] == [
+        [('UUID', 'u4')], [('check', '101')], [('note', 'a'), ('x', 'b')]
+    ]
+    assert kept.amount(2) == Decimal('-40.125')
+    assert len(kept.filter([False] * 3)) == 0
@@ -0,0 +1,264 @@
+from pyledgertools.bayes import HashingTokenizer, NaiveBayes
+
+
+def _model():
+    model = NaiveBayes()
+    model.update('coffee shop n0', 'Expenses:Coffee')
+    model.update('coffee shop n10', 'Expenses:Coffee')
+    model.update('gas station n10', 'Expenses:Auto:Gas')
+    return model
+
+
+def test_classify():
+    model = _model()
+    result = model.classify('Coffee Shop n10')
+    assert result[0][0] == 'Expenses:Coffee'
+
+    # prior 2/3 * P(coffee) 2/2 * P(shop) 2/2 * P(n10) 1/2
+    assert abs(result[0][1] - 1 / 3.0) < 1e-12
+    # prior 1/3 * 1e-9 * 1e-9 * P(n10) 1/1
+    assert abs(result[1][1] - 1e-18 / 3) < 1e-30
+
+    # Unknown tokens are ignored, nothing known scores zero.
+    best = model.classify('coffee zzz')[0]
+    assert best[0] == 'Expenses:Coffee'
+    assert abs(best[1] - 2 / 3.0) < 1e-12
+    assert [x[1] for x in model.classify('zzz')] == [0.0, 0.0]
+
+
+def test_forget():
+    model = _model()
+    before = model.classify('gas n10')
+
+    model.update('gas mart n10', 'Expenses:Coffee')
+    assert model.classify('gas n10') != before
+
+    model.forget('gas mart n10', 'Expenses:Coffee')
+    assert model.classify('gas n10') == before
+    assert 'mart' not in model.token_counts
+    assert len(model) == 3
+
+
+def test_classify_batch():
+    model = _model()
+    texts = ['coffee shop n10', 'gas n10', 'zzz', 'gas coffee n0']
+
+    batch = model.classify_batch(texts)
+    for text, result in zip(texts, batch):
+        expected = model.classify(text)
+        assert [x[0] for x in result] == [x[0] for x in expected]
+        for got, want in zip(result, expected):
+            assert abs(got[1] - want[1]) <= 1e-12 * max(1, want[1])
+
+    top = model.classify_batch(texts, k=1)
+    assert [x[0][0] for x in top] == [x[0][0] for x in batch]
+    assert all(len(x) == 1 for x in top)
+
+
+def test_save_load():
+    import os
+    import tempfile
+
+    model = _model()
+    model.update('café n0', 'Expenses:Coffee')
+    texts = ['coffee shop n10', 'gas n10', 'café', 'zzz']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model')
+        model.save(path)
+        loaded = NaiveBayes.load(path)
+
+        assert loaded.doc_counts == model.doc_counts
+        assert dict(loaded.token_counts.items()) == model.token_counts
+        for text in texts:
+            assert loaded.classify(text) == model.classify(text)
+        assert loaded.classify_batch(texts) == model.classify_batch(texts)
+
+        # Training a loaded model works on plain dictionaries.
+        loaded.update('gas station n0', 'Expenses:Auto:Gas')
+        assert isinstance(loaded.token_counts, dict)
+        assert loaded.token_counts['gas']['Expenses:Auto:Gas'] == 2
+
+        with open(path, 'wb') as f:
+            f.write(b'not a model')
+        assert NaiveBayes.load(path) is None
+        assert NaiveBayes.load(os.path.join(tmp, 'missing')) is None
+
+
+def test_train_sharded():
+    import os
+    import random
+    import tempfile
+
+    from pyledgertools.reader import read_entries
+    from pyledgertools.training import (
+        chunks, count_entries, train_sharded
+    )
+
+    rand = random.Random(3)
+    words = ['shop', 'gas', 'coffee', 'market', 'bar', 'cafe', 'store']
+    accounts = ['Expenses:A', 'Expenses:B', 'Expenses:C', 'Expenses:D']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = os.path.join(tmp, 'journal.ledger')
+        with open(journal, 'w') as f:
+            for i in range(500):
+                amount = rand.randint(1, 50000) / 100.0
+                f.write(
+                    '2017/01/{:02} {} {}\n'
+                    '    Assets:Checking    $ {:.2f}\n'
+                    '    {}\n\n'.format(
+                        i % 28 + 1, rand.choice(words), rand.choice(words),
+                        -amount, rand.choice(accounts)
+                    )
+                )
+
+        serial = count_entries(NaiveBayes(), read_entries(journal))
+        sharded = NaiveBayes()
+        shards = ((x,) for x in chunks(read_entries(journal), 37))
+        train_sharded(sharded, count_entries, shards, 2)
+
+        assert list(sharded.doc_counts.items()) == \
+            list(serial.doc_counts.items())
+        assert [(x, list(y.items())) for x, y in sharded.token_counts.items()] \
+            == [(x, list(y.items())) for x, y in serial.token_counts.items()]
+
+        serial.save(os.path.join(tmp, 'serial'))
+        sharded.save(os.path.join(tmp, 'sharded'))
+        with open(os.path.join(tmp, 'serial'), 'rb') as a, \
+                open(os.path.join(tmp, 'sharded'), 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_hashing_prune():
+    import os
+    import tempfile
+
+    model = NaiveBayes(HashingTokenizer(buckets=16))
+    for i in range(50):
+        model.update('store #{} n10'.format(i), 'Expenses:Store')
+    model.update('rare shop', 'Expenses:Rare')
+    assert len(model.token_counts) <= 16
+    assert model.classify('store #999 n10')[0][0] == 'Expenses:Store'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model')
+        model.save(path)
+        loaded = NaiveBayes.load(path)
+        assert loaded.tokenizer.buckets == 16
+        assert loaded.classify('store 7') == model.classify('store 7')
+
+    model = _model()
+    model.prune(min_token_count=2, min_category_count=2)
+    assert model.doc_counts == {'Expenses:Coffee': 2}
+    assert sorted(model.token_counts) == ['coffee', 'shop']
+
+
+def test_classifier_cache():
+    from pyledgertools.plugins.classify.naive_bayes import Classifier
+
+    classifier = Classifier()
+    classifier.update('coffee shop n0', 'Expenses:Coffee')
+    classifier.update('gas station n10', 'Expenses:Auto:Gas')
+
+    first = classifier.classify('Coffee Shop n0')
+    assert classifier.classify('coffee shop N0') == first
+    assert classifier.cache_info()[:2] == (1, 1)
+
+    texts = ['coffee shop n0', 'gas n10', 'gas n10', 'COFFEE shop n0']
+    result = classifier.classify_batch(texts, k=1)
+    assert [x[0][0] for x in result] == [
+        'Expenses:Coffee', 'Expenses:Auto:Gas', 'Expenses:Auto:Gas',
+        'Expenses:Coffee',
+    ]
+    # Only `gas n10` and the first text with k=1 are scored.
+    assert classifier.cache_info()[:2] == (3, 3)
+
+    # Training invalidates cached results.
+    assert classifier.classify('shop n0')[0][0] == 'Expenses:Coffee'
+    classifier.update('shop n0', 'Expenses:Shopping')
+    classifier.update('shop n0', 'Expenses:Shopping')
+    assert classifier.cache_info().currsize == 0
+    assert classifier.classify('shop n0')[0][0] == 'Expenses:Shopping'
+
+
+def test_windowed_model():
+    import datetime
+    import os
+    import tempfile
+
+    from pyledgertools.training import WindowedModel
+
+    def entry(date, payee, account):
+        return (
+            '{} {}\n    Assets:Checking    $ -12.00\n    {}\n\n'.format(
+                date, payee, account
+            )
+        )
+
+    def counts(model):
+        return model.doc_counts, dict(model.token_counts.items())
+
+    today = datetime.date(2017, 3, 15)
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = os.path.join(tmp, 'journal.ledger')
+        with open(journal, 'w') as f:
+            f.write(entry('2016-01-05', 'Old Shop', 'Expenses:Old'))
+            f.write(entry('2016-12-05', 'Coffee Shop', 'Expenses:Coffee'))
+            f.write(entry('2017-01-05', 'Gas Station', 'Expenses:Gas'))
+
+        windowed = WindowedModel(os.path.join(tmp, 'state'), window=3)
+        model = windowed.refresh(journal, today=today)
+        assert model.doc_counts == {
+            'Expenses:Coffee': 1, 'Expenses:Gas': 1
+        }
+
+        with open(journal, 'a') as f:
+            f.write(entry('2017-03-01', 'Coffee Shop', 'Expenses:Coffee'))
+        model = windowed.refresh(journal, today=today)
+        assert model.doc_counts == {
+            'Expenses:Coffee': 2, 'Expenses:Gas': 1
+        }
+
+        # Same result as training from scratch.
+        fresh = WindowedModel(os.path.join(tmp, 'fresh'), window=3)
+        assert counts(fresh.refresh(journal, today=today)) == counts(model)
+
+        # December leaves the window.
+        model = windowed.refresh(journal, today=datetime.date(2017, 4, 1))
+        assert model.doc_counts == {
+            'Expenses:Coffee': 1, 'Expenses:Gas': 1
+        }
+
+        # Edits other than appends rebuild the model.
+        with open(journal, 'w') as f:
+            f.write(entry('2017-03-02', 'Grocer', 'Expenses:Food'))
+        model = windowed.refresh(journal, today=today)
+        assert model.doc_counts == {'Expenses:Food': 1}
+
+        # A missing month file forces a rebuild.
+        with open(journal, 'a') as f:
+            f.write(entry('2017-02-02', 'Grocer', 'Expenses:Food'))
+        os.unlink(os.path.join(tmp, 'state', 'months', '2017-03.model'))
+        model = windowed.refresh(journal, today=today)
+        assert model.doc_counts == {'Expenses:Food': 2}
+
+        # So does reading a different journal.
+        other = os.path.join(tmp, 'other.ledger')
+        with open(other, 'w') as f:
+            f.write(entry('2017-03-03', 'Gas Station', 'Expenses:Gas'))
+        model = windowed.refresh(other, today=today)
+        assert model.doc_counts == {'Expenses:Gas': 1}
+
+        # An edit keeping the length of the journal is noticed by its
+        # modification time.
+        with open(other, 'w') as f:
+            f.write(entry('2017-03-03', 'Gas Station', 'Expenses:Car'))
+        os.utime(other, ns=(0, 0))
+        model = windowed.refresh(other, today=today)
+        assert model.doc_counts == {'Expenses:Car': 1}
+
+        with open(other, 'a') as f:
+            f.write(entry('2017-03-04', 'Gas Station', 'Expenses:Gas'))
+        model = windowed.refresh(other, today=today, rebuild=True)
+        assert model.doc_counts == {'Expenses:Car': 1, 'Expenses:Gas': 1}
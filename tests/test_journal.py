@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+from pyledgertools.functions import GCD
+from pyledgertools.journal import Posting, Transaction
+
+
+def test_posting_amounts():
+    posting = Posting(account='Expenses:Food', amount=0.29)
+    assert posting.amount == Decimal('0.29')
+    assert posting.cents == 29
+    assert posting.to_string(width=40).endswith('$ 0.29')
+
+    posting = Posting(account='Assets:Stock', amount='1.2345', currency='X')
+    assert posting.amount == Decimal('1.2345')
+    assert posting.cents == 123
+    assert Posting(account='A', amount=None).cents is None
+
+    posting.amount = posting.amount + Decimal('0.1')
+    assert posting.amount == Decimal('1.3345')
+
+    transaction = Transaction(date='2017-01-01', payee='Shop')
+    transaction.add('Expenses:Food', -12.5, '$')
+    assert transaction.postings[0].amount == Decimal('-12.50')
+    assert transaction.postings[0].account is Posting(
+        account=''.join(['Expenses:', 'Food']), amount=0
+    ).account
+
+
+def test_gcd():
+    # int(0.29 * 100) is 28.
+    assert GCD([0.29, 0.58]) == Decimal('0.29')
+    assert GCD([Decimal('10.00'), 25]) == 5
+
+
+def test_render_journal():
+    import io
+    import random
+
+    from pyledgertools.journal import render_journal
+
+    rand = random.Random(5)
+    transactions = []
+    for i in range(200):
+        transaction = Transaction(
+            date='2017-01-{:02}'.format(i % 28 + 1),
+            flag=rand.choice([' ', ' * ', ' ! ']),
+            payee=rand.choice(['Shop', 'Gas Station', 'A Very Long Payee']),
+            tags=rand.choice([[], ['a'], ['a', 'b']]),
+            metadata=rand.choice([[], [['UUID', 'abc']]]),
+            postings=[],
+        )
+        for _ in range(rand.randint(0, 3)):
+            transaction.postings.append(Posting(
+                account=rand.choice(['Assets:Checking', 'Expenses:X' * 9]),
+                amount=rand.choice([
+                    rand.randint(-10 ** 6, 10 ** 6) / 100.0, '0.125', 0,
+                    -0.05, '1e3',
+                ]),
+                currency=rand.choice(['$', 'USD', 'U.S.']),
+                assertion=rand.random() < 0.2,
+                tags=rand.choice([[], ['t']]),
+                metadata=rand.choice([[], [['k', 'v'], ['k2', 'v2']]]),
+            ))
+        transactions.append(transaction)
+
+    for width, indent in ((80, 4), (60, 2)):
+        expected = ''.join(
+            x.to_string(width, indent) + '\n\n' for x in transactions
+        )
+        stream = io.StringIO()
+        assert render_journal(transactions, stream, width, indent) == 200
+        assert stream.getvalue() == expected
@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+from pyledgertools.journal_index import JournalIndex, open_indexes
+from pyledgertools.writer import JournalWriter
+
+JOURNAL = """; Main journal
+include years/*.ledger
+
+2017/03/01 * Coffee Shop #12
+    ; UUID: aaa
+    Expenses:Coffee  $ 3.50
+    Assets:Checking
+
+comment
+2017/03/02 Hidden
+    Expenses:Food  $ 1.00
+end comment
+
+2017-03-05 (1001) AMAZON Mktp US  ; note
+    ; file: receipts/amazon-1001.pdf
+    Expenses:Shopping  $ 20.00
+    Assets:Checking
+"""
+
+YEAR = """2016/12/24 Coffee Roasters
+    ; UUID: bbb
+    Expenses:Coffee  $ 12.00
+    Assets:Checking
+"""
+
+
+def test_journal_index():
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'main.ledger')
+    with open(path, 'w') as f:
+        f.write(JOURNAL)
+    os.makedirs(os.path.join(tmpdir, 'years'))
+    with open(os.path.join(tmpdir, 'years', '2016.ledger'), 'w') as f:
+        f.write(YEAR)
+
+    with JournalIndex(path) as index:
+        assert index.update() == 2
+        assert index.update() == 0
+        assert len(index) == 2
+
+        found = index.find(payee='coffee')
+        assert [x[2] for x in found] == [4]
+        assert list(index.read(found)) == [
+            (4, JOURNAL.split('\n\n')[1] + '\n')
+        ]
+        assert [x[2] for x in index.find(payee='amaz US')] == [14]
+        assert index.find(payee='amaz coffee') == []
+        assert index.find(uuid='aaa') == found
+        assert index.find(file='amazon-1002') == []
+        assert [x[2] for x in index.find(file='AMAZON-1001')] == [14]
+        assert [x[2] for x in index.find(begin='2017-03-02')] == [14]
+        assert [x[2] for x in index.find(end='2017/03/05')] == [4]
+        assert [x[1] for x in index.terms('file')] == \
+            ['receipts/amazon-1001.pdf']
+
+    # Appends are indexed incrementally by the writer.
+    writer = JournalWriter()
+    writer.add(path, 'checking', '\n2017/04/01 Coffee Shop\n'
+                                 '    ; UUID: ccc\n'
+                                 '    Expenses:Coffee  $ 2.00\n\n')
+    writer.flush()
+    with JournalIndex(path) as index:
+        assert [x[2] for x in index.find(uuid='ccc')] == [19]
+        assert len(index.find(payee='coffee')) == 2
+
+    # Other changes rebuild the index.
+    with open(path, 'w') as f:
+        f.write(YEAR)
+    with JournalIndex(path) as index:
+        assert index.update() == 1
+        assert index.find(uuid='aaa') == []
+
+    with open(path, 'w') as f:
+        f.write(JOURNAL)
+    journals = [
+        (os.path.basename(x.journal), len(x.find(payee='coffee')))
+        for x in open_indexes([path])
+    ]
+    assert journals == [('main.ledger', 1), ('2016.ledger', 1)]
+
+
+def test_index_hidden_from_includes():
+    from pyledgertools.reader import read_journal
+
+    tmpdir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(tmpdir, 'years'))
+    path = os.path.join(tmpdir, 'main.ledger')
+    with open(path, 'w') as f:
+        f.write('include years/*\n')
+    with open(os.path.join(tmpdir, 'years', '2016.ledger'), 'w') as f:
+        f.write(YEAR)
+
+    list(open_indexes([path]))
+    assert sorted(os.listdir(os.path.join(tmpdir, 'years'))) == [
+        '.2016.ledger.index', '2016.ledger'
+    ]
+    assert [x.uuid for x in read_journal(path)] == ['bbb']
@@ -0,0 +1,108 @@
+import io
+import os
+import tempfile
+
+from pyledgertools.reader import (
+    JournalChanged, parse_amount, parse_posting, read_journal, read_new_entries
+)
+
+MAIN = """; Main journal
+include sub/*.ledger
+
+2017/01/05 * Coffee Shop  ; :food:
+    ; UUID: abc123
+    Assets:Checking                          $ -4.50
+    Expenses:Coffee
+
+2017-02-01 Opening Balance
+    Assets:Checking                          $ 100.00
+    Equity:Opening
+"""
+
+SUB = """2016-12-31 ! (42) Utility Co
+    Liabilities:Visa                          = $ -10.00
+    Expenses:Utilities                    1,200.00 USD ; note: x
+"""
+
+
+def _write(path, text):
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_read_journal_follows_includes():
+    tmpdir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(tmpdir, 'sub'))
+    main = os.path.join(tmpdir, 'main.ledger')
+    _write(main, MAIN)
+    _write(os.path.join(tmpdir, 'sub', 'a.ledger'), SUB)
+
+    trans = list(read_journal(main))
+    assert [t.payee for t in trans] == [
+        'Utility Co', 'Coffee Shop', 'Opening Balance'
+    ]
+
+    coffee = trans[1]
+    assert coffee.date == '2017-01-05'
+    assert coffee.flag == ' * '
+    assert coffee.tags == ['food']
+    assert coffee.uuid == 'abc123'
+    assert coffee.postings[0].amount == -4.5
+    assert coffee.postings[1].amount is None
+
+    utility = trans[0]
+    assert utility.postings[0].assertion is True
+    assert utility.postings[1].currency == 'USD'
+    assert utility.postings[1].metadata == [['note', 'x']]
+
+    filtered = read_journal(
+        main, since='2017-01-01', exclude_payee='opening balance'
+    )
+    assert [t.payee for t in filtered] == ['Coffee Shop']
+
+
+def test_parse_amount():
+    assert parse_amount('-$12') == (-12.0, '$')
+    assert parse_amount('$ -1,234.50') == (-1234.5, '$')
+    assert parse_amount('(2 * $ 3)') == (None, None)
+    assert parse_posting('    Expenses:Food').amount is None
+
+
+def test_read_new_entries():
+    tmpdir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(tmpdir, 'sub'))
+    main = os.path.join(tmpdir, 'main.ledger')
+    _write(main, MAIN)
+    _write(os.path.join(tmpdir, 'sub', 'a.ledger'), SUB)
+
+    marks = {}
+    entries = list(read_new_entries(main, marks))
+    assert [x[0][:10] for x in entries] == [
+        '2016-12-31', '2017/01/05', '2017-02-01'
+    ]
+    assert list(read_new_entries(main, marks)) == []
+
+    # Appended entries and new included files are read.
+    with io.open(main, 'a', encoding='utf-8') as f:
+        f.write('\n2017-03-01 Grocer\n    Assets:Checking  $ -5\n')
+    _write(os.path.join(tmpdir, 'sub', 'b.ledger'), SUB)
+    entries = list(read_new_entries(main, marks))
+    assert [x[0][:10] for x in entries] == ['2016-12-31', '2017-03-01']
+
+    # An edit keeping the size of the file is reported.
+    os.utime(main, ns=(0, 0))
+    try:
+        list(read_new_entries(main, marks))
+    except JournalChanged:
+        pass
+    else:
+        assert False
+
+    # Anything else is reported.
+    _write(main, MAIN.replace('Coffee', 'Tea'))
+    try:
+        list(read_new_entries(main, marks))
+    except JournalChanged:
+        pass
+    else:
+        assert False
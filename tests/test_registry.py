@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+from pyledgertools.registry import PluginRegistry
+
+PLUGINS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'pyledgertools', 'plugins'
+)
+
+
+def test_registry_manifest():
+    manifest = os.path.join(tempfile.mkdtemp(), 'plugins.json')
+
+    registry = PluginRegistry([PLUGINS], manifest=manifest)
+    names = registry.names()
+    assert 'OFX Download' in names
+    assert 'suntrust_scrape' in names
+    assert registry.get('No Such Plugin') is None
+    assert os.path.isfile(manifest)
+
+    # A valid manifest is used without scanning the plugin directories.
+    cached = PluginRegistry([PLUGINS], manifest=manifest)
+    cached._scan = None
+    assert sorted(cached.names()) == sorted(names)
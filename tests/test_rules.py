@@ -0,0 +1,176 @@
+import os
+import tempfile
+import time
+
+from pyledgertools import rules as rules_mod
+from pyledgertools.rules import load_rules
+
+RULES = """
+Coffee:
+  conditions:
+    - payee CONTAINS coffee
+  allocations:
+    - 100 PERCENT Expenses:Coffee
+"""
+
+
+def test_load_rules_cache():
+    tmpdir = tempfile.mkdtemp()
+    rule_dir = os.path.join(tmpdir, 'rules.d')
+    cache_dir = os.path.join(tmpdir, 'cache')
+    os.makedirs(os.path.join(rule_dir, 'sub'))
+    path = os.path.join(rule_dir, 'sub', 'a.rules')
+    with open(path, 'w') as f:
+        f.write(RULES)
+    with open(os.path.join(rule_dir, 'ignored.txt'), 'w') as f:
+        f.write('not: rules')
+
+    rules = load_rules(rule_dir, cache_dir)
+    assert list(rules) == ['Coffee']
+    assert os.listdir(os.path.join(cache_dir, 'rules'))
+
+    # Parsed file is reused from the on disk cache.
+    rules_mod._memo.clear()
+    assert load_rules(rule_dir, cache_dir) == rules
+
+    # Changed files are parsed again.
+    time.sleep(0.01)
+    with open(path, 'w') as f:
+        f.write(RULES.replace('Coffee:', 'Tea:'))
+    assert list(load_rules(rule_dir, cache_dir)) == ['Tea']
+
+    assert load_rules(os.path.join(tmpdir, 'missing')) is None
+
+
+def _transaction(payee, amount, date='2017-03-01'):
+    from pyledgertools.journal import Transaction, Posting
+    return Transaction(
+        date=date,
+        payee=payee,
+        postings=[Posting(account='Assets:Checking', amount=amount)]
+    )
+
+
+def test_compiled_rules():
+    from pyledgertools.rules import compile_rules
+
+    ruleset = compile_rules({
+        'Salary': {'conditions': [
+            'payee CONTAINS My Employer',
+            {'AND': ['amount GT 800.00', 'amount MOD 100']},
+        ]},
+        'Bonus': {'conditions': [
+            {'OR': ['payee STARTS_WITH my employer', 'payee EQUALS Boss']},
+            {'NOR': ['amount GE 800', 'date LT 2017-01-01']},
+        ]},
+        'Odd': {'conditions': [
+            {'XOR': ['payee ENDS_WITH x', 'amount EQUALS 5', 'amount LE 5']},
+        ]},
+    })
+
+    assert len(ruleset) == 3
+    assert ruleset.find(_transaction('MY EMPLOYER INC', 1000)) is \
+        ruleset.rules[0].data
+    assert ruleset.find(_transaction('  My Employer', 500)) is \
+        ruleset.rules[1].data
+    assert ruleset.find(_transaction('boss', 500, '2016-12-31')) == {}
+    assert ruleset.find(_transaction('Fox', 5)) is ruleset.rules[2].data
+    assert ruleset.find(_transaction('Fox', 4)) == {}
+
+
+def test_invalid_rule_test():
+    from pyledgertools.rules import compile_rules
+
+    try:
+        compile_rules({'Bad': {'conditions': ['payee LIKE x']}})
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+
+WORDS = ['coffee', 'shop', 'gas', 'station', 'co', 'amazon', 'mkt', 'a']
+
+
+def _random_rules(rng, count=200):
+    tests = ['CONTAINS', 'STARTS_WITH', 'ENDS_WITH', 'EQUALS']
+
+    def condition():
+        roll = rng.random()
+        if roll < 0.3:
+            return 'amount {} {}'.format(
+                rng.choice(['GT', 'GE', 'LT', 'LE', 'EQUALS', 'MOD']),
+                rng.choice([-50, -5, 5, 50])
+            )
+        if roll < 0.4:
+            return 'date {} 2017-0{}-01'.format(
+                rng.choice(['GT', 'LE']), rng.randint(1, 6)
+            )
+        return 'payee {} {}'.format(rng.choice(tests), rng.choice(WORDS))
+
+    def group(depth=0):
+        items = [condition() for _ in range(rng.randint(1, 3))]
+        if depth < 2 and rng.random() < 0.4:
+            logic = rng.choice(['AND', 'OR', 'NAND', 'NOR', 'XOR'])
+            items.append({logic: group(depth + 1)})
+        return items
+
+    return dict(
+        ('rule{}'.format(i), {'conditions': group()}) for i in range(count)
+    )
+
+
+def _random_transactions(rng, count=500):
+    transactions = []
+    for _ in range(count):
+        payee = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        transactions.append(_transaction(
+            payee,
+            rng.choice([-50, -7.5, 0, 5, 50, 120]),
+            '2017-0{}-15'.format(rng.randint(1, 6))
+        ))
+    return transactions
+
+
+def _linear_index(ruleset, transaction):
+    for idx, rule in enumerate(ruleset.rules):
+        if rule.match(transaction):
+            return idx
+    return -1
+
+
+def test_rule_index_matches_linear_scan():
+    import random
+    from pyledgertools.rules import compile_rules
+
+    rng = random.Random(1)
+    ruleset = compile_rules(_random_rules(rng))
+
+    for tran in _random_transactions(rng):
+        expected = _linear_index(ruleset, tran)
+        assert ruleset.find_index(tran) == expected
+        if expected < 0:
+            assert ruleset.find(tran) == {}
+        else:
+            assert ruleset.find(tran) is ruleset.rules[expected].data
+
+
+def test_match_all():
+    import random
+    from pyledgertools.batch import TransactionBatch
+    from pyledgertools.rules import compile_rules, match_all
+
+    rng = random.Random(2)
+    for count in (5, 50, 300):
+        ruleset = compile_rules(_random_rules(rng, count))
+        transactions = _random_transactions(rng)
+        expected = [_linear_index(ruleset, x) for x in transactions]
+        assert match_all(ruleset, transactions) == expected
+
+        batch = TransactionBatch()
+        for tran in transactions:
+            batch.append(tran.date, tran.payee, 'Assets:Checking',
+                         tran.postings[0].amount)
+        assert match_all(ruleset, batch) == expected
+
+    assert match_all(ruleset, []) == []
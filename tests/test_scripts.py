@@ -0,0 +1,88 @@
+import io
+import os
+import random
+import tempfile
+
+from pyledgertools.scripts.journal import (
+    block_key, iter_blocks, sort_blocks, sort_file
+)
+
+
+def _journal(rng, count=300):
+    blocks = [b'; Header comment\naccount Assets:Checking\n']
+    for idx in range(count):
+        blocks.append(
+            '2017{0}{1:02d}{0}{2:02d} Payee {3}\n'
+            '    Expenses:Food  $ {3}.00\n'
+            '    Assets:Checking\n'.format(
+                rng.choice('/-'), rng.randint(1, 12), rng.randint(1, 28), idx
+            ).encode()
+        )
+    return blocks
+
+
+def test_sort_blocks():
+    rng = random.Random(3)
+    blocks = _journal(rng)
+    text = b'\n\n'.join(x.rstrip(b'\n') for x in blocks) + b'\n'
+
+    messy = b'\n \na\n b\n\t\n \r\n\nc\r\n\r\nd\n  '
+    for chunk_size in (1, 7, 1 << 20):
+        assert list(iter_blocks(io.BytesIO(text), chunk_size)) == blocks
+        assert list(iter_blocks(io.BytesIO(messy), chunk_size)) == \
+            [b'a\n b\n', b'c\r\n', b'd\n']
+
+    expected = sorted(blocks, key=block_key)
+    assert expected[0] == blocks[0]
+    # A small buffer spills many runs, the result must not change.
+    for buffer_size in (1 << 20, 1000, 1):
+        assert list(sort_blocks(iter(blocks), buffer_size)) == expected
+
+
+def test_sort_file_in_place():
+    rng = random.Random(4)
+    blocks = _journal(rng, 50)
+    path = os.path.join(tempfile.mkdtemp(), 'test.ledger')
+    with open(path, 'wb') as f:
+        f.write(b'\n\n\n'.join(blocks))
+    os.chmod(path, 0o640)
+
+    assert sort_file(path, buffer_size=500) == 51
+    with open(path, 'rb') as f:
+        assert f.read() == b'\n'.join(sorted(blocks, key=block_key)) + b'\n'
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert not [x for x in os.listdir(os.path.dirname(path))
+                if x.endswith('.tmp')]
+
+
+def test_merge_file():
+    from pyledgertools.scripts.journal import merge_file
+
+    rng = random.Random(5)
+    blocks = _journal(rng, 200)
+    path = os.path.join(tempfile.mkdtemp(), 'test.ledger')
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(blocks[:150]) + b'\n')
+    sort_file(path)
+
+    # Appended like an import, then merged using the saved sort mark.
+    with open(path, 'ab') as f:
+        f.write(b''.join(x + b'\n' for x in blocks[150:]))
+    assert merge_file(path) == 51
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'\n'.join(sorted(blocks, key=block_key)) + b'\n'
+    assert merge_file(path) == 0
+    assert sorted(os.listdir(os.path.dirname(path))) == [
+        '.test.ledger.lock', '.test.ledger.sorted', 'test.ledger'
+    ]
+
+    # Without a mark the sorted part ends at the first block out of order.
+    os.unlink(os.path.join(os.path.dirname(path), '.test.ledger.sorted'))
+    with open(path, 'ab') as f:
+        f.write(b'\n2017-06-15 Late\n    Expenses:Food  $ 1.00\n')
+    assert merge_file(path) == 1
+    with open(path, 'rb') as f:
+        merged = list(iter_blocks(f))
+    assert b'2017-06-15 Late\n    Expenses:Food  $ 1.00\n' in merged
+    assert merged == sorted(merged, key=block_key)
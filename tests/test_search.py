@@ -0,0 +1,98 @@
+import os
+import tempfile
+
+from pyledgertools.journal_index import JournalIndex
+from pyledgertools.search import (
+    SearchFilter, _scan, fold_pattern, journal_files, search_files
+)
+
+JOURNAL_2016 = """; 2016
+
+2016/12/24 Coffee Roasters
+    Expenses:Coffee  $ 12.00
+    Assets:Checking
+
+2016/12/30 Grocery Store
+    ; Coffee beans
+    Expenses:Food  $ 40.00
+    Assets:Checking
+"""
+
+JOURNAL_2017 = """2017/01/02 Gas Station
+    Expenses:Auto:Gas  $ 30.00
+    Liabilities:Credit Card
+   \t
+2017/01/05 COFFEE SHOP
+    Expenses:Coffee  $ 3.50
+    Liabilities:Credit Card
+"""
+
+
+def _journals():
+    tmpdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmpdir, 'years'))
+    for name, text in (('2016', JOURNAL_2016), ('2017', JOURNAL_2017)):
+        with open(os.path.join(tmpdir, 'years', name + '.ledger'), 'w') as f:
+            f.write(text)
+    with open(os.path.join(tmpdir, 'notes.txt'), 'w') as f:
+        f.write('Coffee\n')
+    return tmpdir
+
+
+def test_scan():
+    import re
+
+    data = b'a\nb\n\n  \nc\nd\n\n\nbc\n'
+    assert list(_scan(data, None)) == [(0, 4), (8, 12), (14, 17)]
+    assert list(_scan(data, re.compile(b'b'))) == [(0, 4), (14, 17)]
+    assert list(_scan(data, re.compile(b'd'))) == [(8, 12)]
+    assert list(_scan(data, re.compile(br'c\s+d'))) == [(8, 12)]
+    # Matches across blocks don't count, anchors match at block edges.
+    assert list(_scan(data, re.compile(br'b\s+c'))) == []
+    assert list(_scan(data, re.compile(b'^c'))) == [(8, 12)]
+
+
+def test_fold_pattern():
+    assert fold_pattern(b'COFFEE\\S[A-Z]') == b'coffee\\S[a-z]'
+    assert fold_pattern(br'\\Amazon') == br'\\amazon'
+    assert fold_pattern(br'\x41') is None
+    assert fold_pattern(b'(?P<Name>a)') is None
+    assert fold_pattern(b'[0-^]') is None
+
+
+def test_search_files():
+    tmpdir = _journals()
+    paths = journal_files([tmpdir])
+    assert [os.path.basename(x) for x in paths] == \
+        ['2016.ledger', '2017.ledger']
+
+    def found(jobs=1, **search):
+        return [
+            (os.path.basename(path), line, text.split('\n')[0])
+            for path, line, text in search_files(
+                paths, SearchFilter(**search), jobs
+            )
+        ]
+
+    coffee = [
+        ('2016.ledger', 3, '2016/12/24 Coffee Roasters'),
+        ('2016.ledger', 7, '2016/12/30 Grocery Store'),
+        ('2017.ledger', 5, '2017/01/05 COFFEE SHOP'),
+    ]
+    assert found(pattern='coffee') == coffee
+    assert found(jobs=2, pattern='coffee') == coffee
+    assert found(pattern='coffee', begin='2016-12-25') == coffee[1:]
+    assert found(pattern='coffee', end='2016/12/30') == coffee[:1]
+    assert found(amount='10..20') == coffee[:1]
+    assert found(amount='3.5') == coffee[2:]
+    assert found(account='credit card') == [
+        ('2017.ledger', 1, '2017/01/02 Gas Station'), coffee[2]
+    ]
+    assert found(pattern='nothing') == []
+
+    # Date limited searches use the index when there is one.
+    for path in paths:
+        JournalIndex(path).close()
+    assert found(pattern='coffee', begin='2016-12-25') == coffee[1:]
+    assert found(jobs=2, account='gas', end='2017-01-03') == \
+        [('2017.ledger', 1, '2017/01/02 Gas Station')]
@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from pyledgertools.cli import load_uuid_index
+from pyledgertools.uuid_index import UUIDIndex
+
+
+def test_uuid_index_persists():
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'sub', 'uuids.sqlite')
+
+    with UUIDIndex(path) as index:
+        index.update(['abc123', 'def456', '', 'abc123'])
+        assert len(index) == 2
+        assert 'abc123' in index
+        assert 'zzz' not in index
+        assert index.journals is None
+        index.journals = ['/tmp/journal.ledger']
+
+    with UUIDIndex(path) as index:
+        assert sorted(index) == ['abc123', 'def456']
+        assert index.journals == ['/tmp/journal.ledger']
+        index.clear()
+        assert len(index) == 0
+
+
+def test_load_uuid_index_follows_journal():
+    tmpdir = tempfile.mkdtemp()
+    journal = os.path.join(tmpdir, 'main.ledger')
+    path = os.path.join(tmpdir, 'uuids.sqlite')
+    entry = (
+        '2017-01-{0:02} Shop\n'
+        '    ; UUID: u{0}\n'
+        '    Expenses:Food  $ 1\n'
+        '    Assets:Checking\n\n'
+    )
+    with open(journal, 'w') as f:
+        f.write(entry.format(1) + entry.format(2))
+
+    with load_uuid_index(path, journal) as index:
+        assert sorted(index) == ['u1', 'u2']
+
+    # Appended entries are added.
+    with open(journal, 'a') as f:
+        f.write(entry.format(3))
+    with load_uuid_index(path, journal) as index:
+        assert sorted(index) == ['u1', 'u2', 'u3']
+        with index.atomic_update(['u4']):
+            pass
+        try:
+            with index.atomic_update(['u5']):
+                raise IOError
+        except IOError:
+            pass
+        assert 'u4' in index
+        assert 'u5' not in index
+
+    # Anything else reseeds the index.
+    with open(journal, 'w') as f:
+        f.write(entry.format(1) + entry.format(3))
+    with load_uuid_index(path, journal) as index:
+        assert sorted(index) == ['u1', 'u3']
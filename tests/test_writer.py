@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from pyledgertools.writer import JournalWriter
+
+
+def test_writer_flush_groups_by_account():
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'checking.ledger')
+    with open(path, 'w') as f:
+        f.write('existing\n\n')
+
+    writer = JournalWriter()
+    writer.add(path, 'checking', 'a1\n\n')
+    writer.add(path, 'savings', 's1\n\n')
+    writer.add(path, 'checking', 'a2\n\n')
+    assert writer.pending() == 3
+
+    with open(path) as f:
+        assert f.read() == 'existing\n\n'
+
+    writer.flush()
+    assert writer.pending() == 0
+
+    with open(path) as f:
+        assert f.read() == 'existing\n\na1\n\na2\n\ns1\n\n'
+
+    leftovers = [x for x in os.listdir(tmpdir) if x.endswith('.tmp')]
+    assert leftovers == []
+
+
+def test_writer_appends_through_symlink():
+    tmpdir = tempfile.mkdtemp()
+    real = os.path.join(tmpdir, 'real.ledger')
+    link = os.path.join(tmpdir, 'link.ledger')
+    with open(real, 'wb') as f:
+        f.write(b'existing\r\n\r\n')
+    os.symlink(real, link)
+
+    writer = JournalWriter()
+    writer.add(link, 'checking', 'a1\n\n')
+    writer.flush()
+
+    assert os.path.islink(link)
+    with open(real, 'rb') as f:
+        assert f.read() == b'existing\r\n\r\na1\n\n'
+
+    # One hidden lock file for both names.
+    assert sorted(os.listdir(tmpdir)) == [
+        '.real.ledger.lock', 'link.ledger', 'real.ledger'
+    ]